@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Count, Q
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q, OuterRef, Subquery, Func, IntegerField
+from django.db.models.functions import Coalesce
 import csv
 from django.http import HttpResponse
 from rangefilter.filters import DateRangeFilter, DateTimeRangeFilter
@@ -13,8 +15,10 @@ from rangefilter.filters import DateRangeFilter, DateTimeRangeFilter
 from .models import (
     AnneeAcademique, Filiere, Niveau, UE, Etudiant,
     Paiement, InscriptionUE, Salle, SessionExamen,
-    Examen, ControleAcces, JustificatifAbsence, AuditLog
+    Examen, ControleAcces, JustificatifAbsence, AuditLog, RepartitionSalle,
+    VirementBancaire
 )
+from .services import InscriptionService, ExamSchedulerService, PlacementService
 
 # ========================================================
 # ACTIONS ADMINISTRATIVES COMMUNES
@@ -57,19 +61,33 @@ desactiver_selection.short_description = "Désactiver la sélection"
 
 
 def marquer_comme_regle(modeladmin, request, queryset):
-    """Marquer les paiements comme réglés"""
+    """Marquer les paiements comme réglés et répercuter sur les autorisations"""
+    paiements = list(queryset.values_list('etudiant_id', 'annee_academique_id'))
     updated = queryset.update(est_regle=True, date_paiement=timezone.now())
-    modeladmin.message_user(request, f"{updated} paiements marqués comme réglés.")
+    autorisees = 0
+    for annee_id in {annee_id for _, annee_id in paiements}:
+        autorisees += InscriptionService.recompute_authorizations(
+            inscriptions=InscriptionUE.objects.filter(annee_academique_id=annee_id),
+            etudiants=[etudiant_id for etudiant_id, paiement_annee_id in paiements if paiement_annee_id == annee_id],
+            user=request.user,
+        )['autorisees']
+    modeladmin.message_user(
+        request, f"{updated} paiements marqués comme réglés, {autorisees} inscriptions autorisées."
+    )
 
 marquer_comme_regle.short_description = "Marquer comme réglé"
 
 
-def autoriser_examen(modeladmin, request, queryset):
-    """Autoriser les étudiants à passer l'examen"""
-    updated = queryset.update(est_autorise_examen=True)
-    modeladmin.message_user(request, f"{updated} étudiants autorisés pour l'examen.")
+def recalculer_autorisations(modeladmin, request, queryset):
+    """Réappliquer la règle d'autorisation (étudiant actif et paiement réglé), y compris aux autorisations manuelles"""
+    resultat = InscriptionService.recompute_authorizations(inscriptions=queryset, user=request.user, forcer=True)
+    modeladmin.message_user(
+        request,
+        f"{resultat['autorisees']} inscriptions autorisées, "
+        f"{resultat['revoquees']} autorisations retirées."
+    )
 
-autoriser_examen.short_description = "Autoriser pour examen"
+recalculer_autorisations.short_description = "Recalculer l'autorisation d'examen"
 
 
 # ========================================================
@@ -133,6 +151,39 @@ class AutorisationExamenFilter(admin.SimpleListFilter):
         return queryset
 
 
+# ========================================================
+# COLONNES CALCULÉES
+# ========================================================
+
+def compter(queryset):
+    """Sous-requête corrélée COUNT(*) utilisable dans une annotation"""
+    return Coalesce(
+        Subquery(queryset.order_by().values(n=Func('pk', function='COUNT')), output_field=IntegerField()),
+        0
+    )
+
+
+class AnnotatedCountsMixin:
+    """
+    Colonnes calculées par annotation du queryset de la liste.
+    
+    Déclarer les expressions dans `annotations` ({nom: expression}) et lire
+    `obj.<nom>` dans la méthode d'affichage, avec `admin_order_field = '<nom>'`
+    pour rendre la colonne triable. Aucune requête n'est faite par ligne.
+    """
+    annotations = {}
+    
+    def get_annotations(self, request):
+        return self.annotations
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        annotations = self.get_annotations(request)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+
 # ========================================================
 # INLINES (pour les relations)
 # ========================================================
@@ -150,12 +201,42 @@ class InscriptionUEInline(admin.TabularInline):
     """Inline pour les inscriptions UE dans l'admin étudiant"""
     model = InscriptionUE
     extra = 0
-    fields = ('ue', 'annee_academique', 'est_autorise_examen', 'date_inscription')
+    fields = ('ue', 'annee_academique', 'est_autorise_examen', 'autorisation_manuelle', 'date_inscription')
     readonly_fields = ('date_inscription',)
     can_delete = False
     show_change_link = True
 
 
+class RepartitionSalleInline(admin.TabularInline):
+    """Inline pour la répartition d'un examen entre plusieurs salles"""
+    model = RepartitionSalle
+    extra = 0
+    fields = ('ordre', 'salle', 'nombre_places')
+    readonly_fields = ('ordre', 'salle', 'nombre_places')
+    can_delete = False
+    max_num = 0  # Lecture seule, calculée par l'action "Répartir dans les salles"
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+    
+    def nombre_places(self, obj):
+        return obj.nombre_places
+    nombre_places.short_description = "Places"
+
+
+class VirementBancaireInline(admin.TabularInline):
+    """Inline pour les virements rapprochés dans l'admin paiement"""
+    model = VirementBancaire
+    extra = 0
+    fields = ('reference', 'montant', 'date_virement', 'fichier', 'date_creation')
+    readonly_fields = ('reference', 'montant', 'date_virement', 'fichier', 'date_creation')
+    can_delete = False
+    max_num = 0  # Lecture seule, alimenté par le rapprochement bancaire
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class ControleAccesInline(admin.TabularInline):
     """Inline pour les contrôles d'accès dans l'admin examen"""
     model = ControleAcces
@@ -188,7 +269,7 @@ class AnneeAcademiqueAdmin(admin.ModelAdmin):
     list_display = ('code', 'active', 'date_creation')
     list_filter = ('active',)
     search_fields = ('code',)
-    actions = [activer_selection, desactiver_selection, exporter_csv]
+    actions = [activer_selection, desactiver_selection, exporter_csv, 'generer_inscriptions', 'recalculer_autorisations']
     readonly_fields = ('date_creation', 'date_modification')
     
     fieldsets = (
@@ -200,6 +281,24 @@ class AnneeAcademiqueAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def generer_inscriptions(self, request, queryset):
+        """Inscrire chaque étudiant aux UEs de sa filière et de son niveau"""
+        for annee in queryset:
+            creees = InscriptionService.generate(annee, user=request.user)
+            self.message_user(request, f"{annee}: {creees} inscriptions UE créées.")
+    generer_inscriptions.short_description = "Générer les inscriptions UE"
+    
+    def recalculer_autorisations(self, request, queryset):
+        """Réappliquer la règle d'autorisation à toutes les inscriptions de l'année"""
+        for annee in queryset:
+            resultat = InscriptionService.recompute_authorizations(annee, user=request.user)
+            self.message_user(
+                request,
+                f"{annee}: {resultat['autorisees']} inscriptions autorisées, "
+                f"{resultat['revoquees']} autorisations retirées."
+            )
+    recalculer_autorisations.short_description = "Recalculer les autorisations d'examen"
 
 
 @admin.register(Filiere)
@@ -288,16 +387,31 @@ class EtudiantAdmin(admin.ModelAdmin):
     
     def changer_statut_actif(self, request, queryset):
         """Changer le statut des étudiants sélectionnés en 'actif'"""
+        # Ids figés avant la mise à jour : un changelist filtré sur le statut ne les retrouverait plus
+        ids = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(statut='actif')
+        InscriptionService.recompute_authorizations(etudiants=ids, user=request.user)
         self.message_user(request, f"{updated} étudiants marqués comme actifs.")
     changer_statut_actif.short_description = "Marquer comme actif"
     
     def changer_statut_suspendu(self, request, queryset):
         """Changer le statut des étudiants sélectionnés en 'suspendu'"""
+        # Ids figés avant la mise à jour : un changelist filtré sur le statut ne les retrouverait plus
+        ids = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(statut='suspendu')
+        InscriptionService.recompute_authorizations(etudiants=ids, user=request.user)
         self.message_user(request, f"{updated} étudiants suspendus.")
     changer_statut_suspendu.short_description = "Suspendre"
     
+    def save_formset(self, request, form, formset, change):
+        """Une autorisation modifiée dans l'inline devient manuelle"""
+        if formset.model is InscriptionUE:
+            for inline_form in formset.forms:
+                if ('est_autorise_examen' in inline_form.changed_data
+                        and 'autorisation_manuelle' not in inline_form.changed_data):
+                    inline_form.instance.autorisation_manuelle = True
+        super().save_formset(request, form, formset, change)
+    
     def get_queryset(self, request):
         """Optimiser les requêtes avec select_related"""
         return super().get_queryset(request).select_related('filiere', 'niveau')
@@ -311,6 +425,7 @@ class PaiementAdmin(admin.ModelAdmin):
     search_fields = ('etudiant__matricule', 'etudiant__nom', 'etudiant__prenom')
     actions = [exporter_csv, marquer_comme_regle]
     readonly_fields = ('date_creation', 'date_modification', 'created_by')
+    inlines = [VirementBancaireInline]
     
     fieldsets = (
         ('Informations de paiement', {
@@ -336,15 +451,15 @@ class PaiementAdmin(admin.ModelAdmin):
 @admin.register(InscriptionUE)
 class InscriptionUEAdmin(admin.ModelAdmin):
     """Administration des inscriptions UE"""
-    list_display = ('etudiant', 'ue', 'annee_academique', 'est_autorise_examen', 'date_inscription')
-    list_filter = (AutorisationExamenFilter, 'annee_academique', 'ue__filiere', 'ue__niveau')
+    list_display = ('etudiant', 'ue', 'annee_academique', 'est_autorise_examen', 'autorisation_manuelle', 'date_inscription')
+    list_filter = (AutorisationExamenFilter, 'autorisation_manuelle', 'annee_academique', 'ue__filiere', 'ue__niveau')
     search_fields = ('etudiant__matricule', 'etudiant__nom', 'ue__code', 'ue__intitule')
-    actions = [exporter_csv, autoriser_examen]
+    actions = [exporter_csv, recalculer_autorisations]
     readonly_fields = ('date_inscription', 'date_creation', 'date_modification', 'created_by')
     
     fieldsets = (
         ('Inscription', {
-            'fields': ('etudiant', 'ue', 'annee_academique', 'est_autorise_examen')
+            'fields': ('etudiant', 'ue', 'annee_academique', 'est_autorise_examen', 'autorisation_manuelle')
         }),
         ('Traçabilité', {
             'fields': ('created_by', 'date_inscription', 'date_creation', 'date_modification'),
@@ -356,6 +471,8 @@ class InscriptionUEAdmin(admin.ModelAdmin):
         """Enregistrer l'utilisateur qui crée/modifie"""
         if not obj.pk:  # Si création
             obj.created_by = request.user
+        if 'est_autorise_examen' in form.changed_data and 'autorisation_manuelle' not in form.changed_data:
+            obj.autorisation_manuelle = True
         super().save_model(request, obj, form, change)
     
     def get_queryset(self, request):
@@ -364,47 +481,74 @@ class InscriptionUEAdmin(admin.ModelAdmin):
 
 
 @admin.register(Salle)
-class SalleAdmin(admin.ModelAdmin):
+class SalleAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     """Administration des salles"""
     list_display = ('code', 'batiment', 'etage', 'capacite', 'examen_count')
     list_filter = ('batiment', 'etage')
     search_fields = ('code', 'batiment')
     actions = [exporter_csv]
     readonly_fields = ('date_creation', 'date_modification')
+    annotations = {'nb_examens': Count('examen')}
     
     def examen_count(self, obj):
-        """Compter le nombre d'examens programmés dans cette salle"""
-        count = Examen.objects.filter(salle=obj).count()
+        """Nombre d'examens programmés dans cette salle"""
         url = reverse('admin:core_examen_changelist') + f'?salle__id__exact={obj.id}'
-        return format_html('<a href="{}">{}</a>', url, count)
+        return format_html('<a href="{}">{}</a>', url, obj.nb_examens)
     examen_count.short_description = "Examens programmés"
+    examen_count.admin_order_field = 'nb_examens'
 
 
 @admin.register(SessionExamen)
-class SessionExamenAdmin(admin.ModelAdmin):
+class SessionExamenAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     """Administration des sessions d'examen"""
     list_display = ('nom', 'type_session', 'annee_academique', 'date_debut', 'date_fin', 'active', 'examen_count')
     list_filter = ('type_session', 'active', 'annee_academique')
     search_fields = ('nom',)
     actions = [activer_selection, desactiver_selection, exporter_csv]
-    readonly_fields = ('date_creation', 'date_modification', 'created_by')
+    readonly_fields = ('date_creation', 'date_modification', 'created_by', 'doubles_reservations')
     
     fieldsets = (
         ('Informations de session', {
             'fields': ('nom', 'type_session', 'annee_academique', 'date_debut', 'date_fin', 'active')
         }),
+        ('Contrôle du planning', {
+            'fields': ('doubles_reservations',)
+        }),
         ('Traçabilité', {
             'fields': ('created_by', 'date_creation', 'date_modification'),
             'classes': ('collapse',)
         }),
     )
     
+    annotations = {'nb_examens': Count('examen')}
+    
     def examen_count(self, obj):
-        """Compter le nombre d'examens dans la session"""
-        count = Examen.objects.filter(session=obj).count()
+        """Nombre d'examens dans la session"""
         url = reverse('admin:core_examen_changelist') + f'?session__id__exact={obj.id}'
-        return format_html('<a href="{}">{}</a>', url, count)
+        return format_html('<a href="{}">{}</a>', url, obj.nb_examens)
     examen_count.short_description = "Nombre d'examens"
+    examen_count.admin_order_field = 'nb_examens'
+    
+    def doubles_reservations(self, obj):
+        """Paires d'examens qui se chevauchent pour au moins un étudiant"""
+        if not obj.pk:
+            return "-"
+        resultat = ExamSchedulerService.double_bookings(obj)
+        if not resultat['paires']:
+            return "Aucun étudiant convoqué à deux examens simultanés."
+        lignes = format_html_join(
+            '', '<tr><td>{}</td><td>{} / {}</td><td>{}</td></tr>',
+            (
+                (paire['date'], paire['ues'][0], paire['ues'][1], paire['etudiants'])
+                for paire in resultat['paires']
+            )
+        )
+        return format_html(
+            '<p><strong>{} étudiant(s)</strong> convoqué(s) à deux examens simultanés.</p>'
+            '<table><tr><th>Date</th><th>Examens</th><th>Étudiants</th></tr>{}</table>',
+            resultat['etudiants'], lignes
+        )
+    doubles_reservations.short_description = "Doubles convocations"
     
     def save_model(self, request, obj, form, change):
         """Enregistrer l'utilisateur qui crée/modifie"""
@@ -414,14 +558,14 @@ class SessionExamenAdmin(admin.ModelAdmin):
 
 
 @admin.register(Examen)
-class ExamenAdmin(admin.ModelAdmin):
+class ExamenAdmin(AnnotatedCountsMixin, admin.ModelAdmin):
     """Administration des examens"""
     list_display = ('ue', 'date', 'heure_debut', 'heure_fin', 'salle', 'surveillant', 'type_examen', 'session', 'duree_display', 'present_count')
     list_filter = ('type_examen', 'session', 'ue__filiere', 'ue__niveau', ('date', DateRangeFilter))
     search_fields = ('ue__code', 'ue__intitule', 'salle__code')
-    actions = [exporter_csv, 'generer_liste_presence']
+    actions = [exporter_csv, 'generer_liste_presence', 'repartir_salles']
     readonly_fields = ('date_creation', 'date_modification', 'created_by', 'duree')
-    inlines = [ControleAccesInline, JustificatifAbsenceInline]
+    inlines = [RepartitionSalleInline, ControleAccesInline, JustificatifAbsenceInline]
     
     fieldsets = (
         ('Informations de l\'examen', {
@@ -439,6 +583,18 @@ class ExamenAdmin(admin.ModelAdmin):
         }),
     )
     
+    annotations = {
+        'nb_inscrits': compter(InscriptionUE.objects.filter(
+            ue=OuterRef('ue'),
+            annee_academique=OuterRef('annee_academique'),
+            est_autorise_examen=True
+        )),
+        'nb_presents': compter(ControleAcces.objects.filter(
+            examen=OuterRef('pk'),
+            autorise=True
+        )),
+    }
+    
     def duree_display(self, obj):
         """Afficher la durée de manière lisible"""
         return f"{obj.duree} min"
@@ -446,20 +602,10 @@ class ExamenAdmin(admin.ModelAdmin):
     
     def present_count(self, obj):
         """Afficher le nombre d'étudiants présents"""
-        total = InscriptionUE.objects.filter(
-            ue=obj.ue,
-            annee_academique=obj.annee_academique,
-            est_autorise_examen=True
-        ).count()
-        
-        presents = ControleAcces.objects.filter(
-            examen=obj,
-            autorise=True
-        ).count()
-        
         url = reverse('admin:core_controleacces_changelist') + f'?examen__id__exact={obj.id}'
-        return format_html('<a href="{}">{} / {}</a>', url, presents, total)
+        return format_html('<a href="{}">{} / {}</a>', url, obj.nb_presents, obj.nb_inscrits)
     present_count.short_description = "Présents / Inscrits"
+    present_count.admin_order_field = 'nb_presents'
     
     def generer_liste_presence(self, request, queryset):
         """Générer une liste de présence pour les examens sélectionnés"""
@@ -489,6 +635,20 @@ class ExamenAdmin(admin.ModelAdmin):
         return response
     generer_liste_presence.short_description = "Générer liste de présence"
     
+    def repartir_salles(self, request, queryset):
+        """Répartir les étudiants autorisés entre les salles libres (places par matricule)"""
+        for examen in queryset.select_related('ue'):
+            try:
+                repartitions = PlacementService.allocate(examen, user=request.user)
+            except ValidationError as e:
+                self.message_user(request, f"{examen.ue.code}: {'; '.join(e.messages)}", level='error')
+                continue
+            salles = ", ".join(
+                f"{repartition.salle.code} ({repartition.nombre_places})" for repartition in repartitions
+            )
+            self.message_user(request, f"{examen.ue.code}: {salles or 'aucun étudiant autorisé'}.")
+    repartir_salles.short_description = "Répartir dans les salles"
+    
     def save_model(self, request, obj, form, change):
         """Enregistrer l'utilisateur qui crée/modifie"""
         if not obj.pk:  # Si création
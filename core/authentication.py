@@ -0,0 +1,81 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Cache LRU en mémoire des jetons d'API déjà validés (un par processus).
+
+    Chaque entrée expire après TOKEN_CACHE_TIMEOUT secondes et le cache ne
+    dépasse pas TOKEN_CACHE_MAX_SIZE jetons. Les signaux invalident les
+    entrées du processus courant ; dans les autres processus, un jeton
+    supprimé ou un compte désactivé reste accepté au plus TOKEN_CACHE_TIMEOUT
+    secondes.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Retourner (user, token) si le jeton est en cache et non expiré"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expire_at, user, token = entry
+            if expire_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Copie par requête : les attributs mémorisés (rôles...) ne sont pas partagés
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        expire_at = time.monotonic() + settings.TOKEN_CACHE_TIMEOUT
+        with self._lock:
+            self._entries[key] = (expire_at, copy.copy(user), token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """Retirer tous les jetons d'un utilisateur"""
+        with self._lock:
+            for key in [k for k, (_, user, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication sans requête en base pour les jetons déjà vus.
+
+    Les tablettes de scan appellent l'API en continu avec le même jeton :
+    la jointure authtoken_token / auth_user n'est faite qu'au premier appel
+    puis à l'expiration de l'entrée. Les jetons invalides ne sont jamais mis
+    en cache.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
@@ -1,42 +1,50 @@
-from django.contrib.auth.backends import BaseBackend
+from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
-from django.contrib.auth.hashers import check_password
-from .models import Etudiant
+from django.db.models import Case, IntegerField, Q, Value, When
+
+
+class MultiAuthBackend(ModelBackend):
+    """Backend d'authentification supportant plusieurs types d'utilisateurs
+
+    L'identifiant saisi peut être un nom d'utilisateur, un matricule étudiant
+    ou une adresse email. Le compte candidat est résolu en une seule requête
+    et un seul hachage est vérifié, même quand aucun compte ne correspond.
+    Hérite de ModelBackend pour conserver la gestion des permissions.
+    """
+
+    def get_candidat(self, identifiant):
+        """Compte correspondant à l'identifiant (priorité : username, matricule, email)"""
+        return (
+            User.objects
+            .filter(
+                Q(username=identifiant)
+                | Q(etudiant_profile__matricule=identifiant)
+                | Q(email=identifiant)
+            )
+            .annotate(priorite=Case(
+                When(username=identifiant, then=Value(0)),
+                When(etudiant_profile__matricule=identifiant, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ))
+            .order_by('priorite', 'pk')
+            .first()
+        )
 
-class MultiAuthBackend(BaseBackend):
-    """Backend d'authentification supportant plusieurs types d'utilisateurs"""
-    
     def authenticate(self, request, username=None, password=None, **kwargs):
-        # Essayer d'abord avec l'authentification Django standard
-        try:
-            user = User.objects.get(username=username)
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
-            pass
-        
-        # Essayer avec le matricule étudiant
-        try:
-            etudiant = Etudiant.objects.get(matricule=username)
-            # Si l'étudiant a un utilisateur associé
-            if hasattr(etudiant, 'user') and etudiant.user:
-                if etudiant.user.check_password(password):
-                    return etudiant.user
-        except Etudiant.DoesNotExist:
-            pass
-        
-        # Essayer avec l'email
-        try:
-            user = User.objects.get(email=username)
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
-            pass
-        
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+
+        user = self.get_candidat(username)
+        if user is None:
+            # Hachage factice : même coût qu'un échec sur un compte existant
+            User().set_password(password)
+            return None
+
+        # Comptes désactivés refusés ici : obtain_auth_token (API) ne
+        # vérifie pas is_active lui-même, contrairement aux formulaires
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
         return None
-    
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.utils import timezone
+from .services import RoleService
 
 def global_context(request):
     """Contexte global disponible dans tous les templates"""
@@ -9,14 +10,17 @@ def global_context(request):
     }
     
     if request.user.is_authenticated:
+        # Rôles chargés une seule fois par requête (voir RoleService)
+        context['user_roles'] = RoleService.get_roles(request.user)
+        
         if hasattr(request.user, 'etudiant_profile'):
             context['user_role'] = 'etudiant'
             context['etudiant'] = request.user.etudiant_profile
-        elif request.user.groups.filter(name='Surveillant').exists():
+        elif RoleService.has_role(request.user, 'Surveillant'):
             context['user_role'] = 'surveillant'
-        elif request.user.groups.filter(name='Enseignant').exists():
+        elif RoleService.has_role(request.user, 'Enseignant'):
             context['user_role'] = 'enseignant'
-        elif request.user.groups.filter(name='Administrateur').exists():
+        elif RoleService.has_role(request.user, 'Administrateur'):
             context['user_role'] = 'administrateur'
         elif request.user.is_staff:
             context['user_role'] = 'admin'
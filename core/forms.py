@@ -443,6 +443,12 @@ class InscriptionUEForm(forms.ModelForm):
             'annee_academique': forms.Select(attrs={'class': 'form-control'}),
             'est_autorise_examen': forms.CheckboxInput(attrs={'class': 'form-check-input'})
         }
+    
+    def save(self, commit=True):
+        # Une autorisation cochée ou décochée à la main n'est plus recalculée
+        if 'est_autorise_examen' in self.changed_data:
+            self.instance.autorisation_manuelle = True
+        return super().save(commit)
 
 class SalleForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,62 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Examen, SessionExamen
+from core.services import PlacementService
+
+class Command(BaseCommand):
+    help = 'Répartit les étudiants autorisés de chaque examen entre les salles libres et numérote les places'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session',
+            type=int,
+            help='Identifiant de la session d\'examen (défaut: session active la plus récente)',
+        )
+        parser.add_argument(
+            '--examen',
+            type=int,
+            help='Ne traiter que cet examen',
+        )
+        parser.add_argument(
+            '--ordre',
+            choices=PlacementService.ORDRES,
+            default='matricule',
+            help='Ordre d\'attribution des places (défaut: matricule)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Graine du placement aléatoire (placement reproductible)',
+        )
+
+    def handle(self, *args, **options):
+        examens = Examen.objects.select_related('ue', 'salle').order_by('date', 'heure_debut', 'pk')
+        if options['examen']:
+            examens = examens.filter(pk=options['examen'])
+        else:
+            sessions = SessionExamen.objects.all()
+            if options['session']:
+                session = sessions.filter(pk=options['session']).first()
+            else:
+                session = sessions.filter(active=True).first()
+            if session is None:
+                raise CommandError("Session d'examen introuvable : précisez --session ou --examen")
+            examens = examens.filter(session=session)
+
+        erreurs = 0
+        for examen in examens:
+            try:
+                repartitions = PlacementService.allocate(examen, ordre=options['ordre'], seed=options['seed'])
+            except ValidationError as e:
+                erreurs += 1
+                self.stdout.write(self.style.ERROR(f"  ❌ {examen.ue.code} {examen.date}: {'; '.join(e.messages)}"))
+                continue
+            salles = ", ".join(
+                f"{repartition.salle.code} ({repartition.nombre_places})" for repartition in repartitions
+            )
+            self.stdout.write(f"  {examen.ue.code} {examen.date} {examen.heure_debut:%H:%M}: {salles or 'aucun étudiant autorisé'}")
+
+        if erreurs:
+            self.stdout.write(self.style.WARNING(f"⚠️  {erreurs} examen(s) sans répartition"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Places attribuées"))
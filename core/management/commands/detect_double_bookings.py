@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import SessionExamen
+from core.services import ExamSchedulerService
+
+class Command(BaseCommand):
+    help = 'Détecte les étudiants convoqués à deux examens qui se chevauchent dans une session'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session',
+            type=int,
+            help='Identifiant de la session d\'examen (défaut: session active la plus récente)',
+        )
+
+    def handle(self, *args, **options):
+        sessions = SessionExamen.objects.select_related('annee_academique')
+        if options['session']:
+            session = sessions.filter(pk=options['session']).first()
+        else:
+            session = sessions.filter(active=True).first()
+        if session is None:
+            raise CommandError("Session d'examen introuvable : précisez --session")
+
+        resultat = ExamSchedulerService.double_bookings(session)
+
+        if not resultat['conflits']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {session} : aucun étudiant convoqué à deux examens simultanés"))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            f"⚠️  {session} : {resultat['etudiants']} étudiant(s) convoqué(s) à deux examens simultanés"
+        ))
+        for paire in resultat['paires']:
+            self.stdout.write(
+                f"  {paire['date']} {paire['ues'][0]} / {paire['ues'][1]} : {paire['etudiants']} étudiant(s)"
+            )
+
+        if options['verbosity'] > 1:
+            for conflit in resultat['conflits']:
+                examen, autre = conflit['examen'], conflit['conflit']
+                self.stdout.write(
+                    f"  {conflit['matricule']} {conflit['nom']} {conflit['prenom']} - {conflit['date']} "
+                    f"{autre['ue']} {autre['heure_debut']:%H:%M}-{autre['heure_fin']:%H:%M} / "
+                    f"{examen['ue']} {examen['heure_debut']:%H:%M}-{examen['heure_fin']:%H:%M}"
+                )
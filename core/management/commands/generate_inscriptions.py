@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import AnneeAcademique, Filiere, Niveau
+from core.services import InscriptionService
+
+class Command(BaseCommand):
+    help = 'Génère en une requête les inscriptions UE manquantes (étudiants × UEs de même filière et niveau)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--annee',
+            type=str,
+            help='Code de l\'année académique (défaut: année active)',
+        )
+        parser.add_argument(
+            '--filiere',
+            type=str,
+            help='Code de la filière à traiter (défaut: toutes)',
+        )
+        parser.add_argument(
+            '--niveau',
+            type=str,
+            help='Niveau à traiter, ex. L1 (défaut: tous)',
+        )
+
+    def handle(self, *args, **options):
+        if options['annee']:
+            annee_academique = AnneeAcademique.objects.filter(code=options['annee']).first()
+        else:
+            annee_academique = AnneeAcademique.objects.filter(active=True).first()
+        if annee_academique is None:
+            raise CommandError(f"Année académique introuvable: {options['annee'] or 'aucune année active'}")
+
+        filiere = niveau = None
+        if options['filiere']:
+            try:
+                filiere = Filiere.objects.get(code=options['filiere'])
+            except Filiere.DoesNotExist:
+                raise CommandError(f"Filière inconnue: {options['filiere']}")
+        if options['niveau']:
+            try:
+                niveau = Niveau.objects.get(nom=options['niveau'])
+            except Niveau.DoesNotExist:
+                raise CommandError(f"Niveau inconnu: {options['niveau']}")
+
+        creees = InscriptionService.generate(annee_academique, filiere=filiere, niveau=niveau)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"📝 {creees} inscriptions UE créées pour {annee_academique}"
+        ))
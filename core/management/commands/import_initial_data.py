@@ -1,11 +1,16 @@
 # core/management/commands/import_initial_data.py
+import codecs
+import json
 import os
+import time as chrono
 import pandas as pd
 import numpy as np
+from contextlib import contextmanager
 from datetime import datetime, time, timedelta
 import random
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.db.models import Count, Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
@@ -14,6 +19,58 @@ from core.models import (
     AnneeAcademique, Filiere, Niveau, UE, Etudiant,
     Paiement, InscriptionUE, Salle, SessionExamen, Examen
 )
+from core.services import InscriptionService, StudentAccountService
+from core.signals import suspendre_creation_comptes
+
+
+# Mapping des noms de filière abrégés (fichier UE)
+FILIERE_NAME_MAPPING = {
+    'PHYSIQUE': 'RHY',
+    'CHIMIE': 'CUM',
+    'MATHEMATIQUE': 'MAT',
+    'INFORMATIQUE': 'INF',
+    'GEOSCIENCES': 'GEOS',
+    'BIOCHIMIE': 'BCH',
+    'BIOLOGIE ET PHYSIOLOGIE ANIMALE': 'BOA',
+    'BIOLOGIE ET PHYSIOLOGIE VEGETALE': 'BOV',
+    'BIOSCIENCES': 'BIOS',
+    'MICROBIOLOGIE': 'MIB',
+    'CHIMIE ORGANIQUE': 'CQ',
+    'CHIMIE INORGANIQUE': 'CI',
+}
+
+# Code de filière d'après le 3e caractère du matricule (ex: 22C422 -> C)
+CODE_FILIERE_MAP = {
+    'B': 'BCH', 'C': 'CUM', 'D': 'BOV', 'E': 'BOA',
+    'F': 'GEOS', 'G': 'INF', 'H': 'RHY', 'I': 'MAT',
+    'J': 'MIB', 'K': 'CQ', 'L': 'CI', 'M': 'BIOS'
+}
+
+
+# Champs comparés par le mode --delta
+CHAMPS_UE = ['intitule', 'niveau_id', 'semestre']
+CHAMPS_ETUDIANT = ['nom', 'prenom', 'email', 'telephone', 'filiere_id', 'niveau_id']
+
+
+def texte(serie):
+    """Colonne en texte nettoyé ('' pour les valeurs manquantes)"""
+    return serie.fillna('').astype(str).str.strip()
+
+
+def forme_canonique(df):
+    """Valeurs en texte, identiques qu'elles viennent du CSV ou de la base (3.0 == 3, None == '')"""
+    canonique = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        if col.endswith('_id') or col == 'semestre':
+            canonique[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64').astype(str)
+        else:
+            canonique[col] = texte(df[col])
+    return canonique
+
+
+def empreintes(df):
+    """Empreinte 64 bits de chaque ligne"""
+    return pd.util.hash_pandas_object(forme_canonique(df), index=False).to_numpy()
 
 
 class Command(BaseCommand):
@@ -30,19 +87,100 @@ class Command(BaseCommand):
             action='store_true',
             help='Vider les tables avant import'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Nombre de lignes par requête bulk_create (défaut: 2000)'
+        )
+        parser.add_argument(
+            '--skip-accounts',
+            action='store_true',
+            help='Ne pas créer les comptes étudiants (voir create_student_users)'
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Lire ETUDIANTS.csv par blocs, une transaction et un point de reprise par bloc'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Nombre de lignes étudiants par bloc en mode --stream (défaut: 5000)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            default='.import_initial_data.checkpoint',
+            help='Fichier de reprise du mode --stream (supprimé en fin d\'import)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignorer le fichier de reprise et réimporter depuis le début'
+        )
+        parser.add_argument(
+            '--delta',
+            action='store_true',
+            help='N\'écrire que les UEs/étudiants nouveaux ou modifiés (comparaison d\'empreintes)'
+        )
+        parser.add_argument(
+            '--rejects',
+            type=str,
+            default='ETUDIANTS.rejets.csv',
+            help='Fichier CSV des lignes étudiants rejetées, avec leur motif'
+        )
+    
+    @contextmanager
+    def phase(self, nom):
+        """Mesure la durée d'une étape de l'import"""
+        debut = chrono.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((nom, chrono.perf_counter() - debut))
+    
+    def print_timings(self):
+        """Affiche la durée de chaque étape"""
+        # En mode flux, les étapes répétées par bloc sont cumulées
+        durees = {}
+        for nom, duree in self.timings:
+            durees[nom] = durees.get(nom, 0) + duree
+        
+        self.stdout.write('\n⏱️  DURÉE PAR ÉTAPE:')
+        for nom, duree in durees.items():
+            self.stdout.write(f"  - {nom:<28} {duree:8.2f}s")
+        self.stdout.write(f"  - {'Total':<28} {sum(d for _, d in self.timings):8.2f}s")
     
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('🚀 Début du chargement des données initiales...'))
-        
-        # Vider les tables si demandé
-        if options['clear']:
-            self.clear_tables()
+        self.batch_size = options['batch_size']
+        self.rejects_path = options['rejects']
+        self.rejects_count = 0
+        self.timings = []
+        self.delta = options['delta']
+        self.nouvelles_ues = set()
+        self.nouveaux_etudiants = set()
+        stream = options['stream']
         
         # Utiliser les noms de fichiers définis dans le code
         filieres_path = self.FILIERES_FILE
         ue_path = self.UE_FILE
         etudiants_path = self.ETUDIANTS_FILE
         
+        # Reprise d'un import en flux interrompu
+        checkpoint = None
+        if stream and not options['restart']:
+            checkpoint = self.load_checkpoint(options['checkpoint'], etudiants_path)
+        
+        # Vider les tables si demandé (jamais lors d'une reprise)
+        if options['clear']:
+            if checkpoint:
+                self.stdout.write(self.style.WARNING('⚠️  Reprise en cours : --clear ignoré'))
+            else:
+                self.clear_tables()
+        
         self.stdout.write(f"📂 Recherche des fichiers CSV...")
         self.stdout.write(f"  - Filières: {filieres_path}")
         self.stdout.write(f"  - UEs: {ue_path}")
@@ -57,19 +195,20 @@ class Command(BaseCommand):
             if not os.path.exists(etudiants_path):
                 raise FileNotFoundError(f"Fichier non trouvé: {etudiants_path}")
             
-            # Essayer différents encodages
             self.stdout.write("📖 Lecture des fichiers CSV...")
             
-            # Lire les fichiers avec différents encodages
-            filieres_df = self.read_csv_with_encoding(filieres_path)
-            ue_df = self.read_csv_with_encoding(ue_path)
-            etudiants_df = self.read_csv_with_encoding(etudiants_path)
+            # En mode flux, le fichier étudiants est lu plus tard, par blocs
+            with self.phase('Lecture CSV'):
+                filieres_df = self.read_csv_with_encoding(filieres_path)
+                ue_df = self.read_csv_with_encoding(ue_path)
+                etudiants_df = None if stream else self.read_csv_with_encoding(etudiants_path)
             
             # Afficher un aperçu des données
             self.stdout.write(self.style.SUCCESS('✓ Fichiers CSV chargés avec succès'))
             self.stdout.write(f"  - Filières: {len(filieres_df)} lignes, {len(filieres_df.columns)} colonnes")
             self.stdout.write(f"  - UEs: {len(ue_df)} lignes, {len(ue_df.columns)} colonnes")
-            self.stdout.write(f"  - Étudiants: {len(etudiants_df)} lignes, {len(etudiants_df.columns)} colonnes")
+            if etudiants_df is not None:
+                self.stdout.write(f"  - Étudiants: {len(etudiants_df)} lignes, {len(etudiants_df.columns)} colonnes")
             
         except FileNotFoundError as e:
             self.stdout.write(self.style.ERROR(f"❌ {e}"))
@@ -85,7 +224,8 @@ class Command(BaseCommand):
         # Nettoyer les données
         try:
             self.stdout.write("\n🧹 Nettoyage des données...")
-            filieres_df, ue_df, etudiants_df = self.clean_data(filieres_df, ue_df, etudiants_df)
+            with self.phase('Nettoyage'):
+                filieres_df, ue_df, etudiants_df = self.clean_data(filieres_df, ue_df, etudiants_df)
             self.stdout.write(self.style.SUCCESS('✓ Données nettoyées'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"❌ Erreur lors du nettoyage: {e}"))
@@ -93,78 +233,222 @@ class Command(BaseCommand):
             self.stdout.write(traceback.format_exc())
             return
         
-        # Exécuter dans une transaction
         try:
-            with transaction.atomic():
-                # 1. Année académique
-                annee_academique = self.create_annee_academique()
-                if not annee_academique:
-                    raise Exception("Impossible de créer l'année académique")
-                
-                # 2. Niveaux
-                self.create_niveaux()
-                
-                # 3. Filieres
-                filiere_mapping = self.create_filieres(filieres_df)
-                
-                # 4. UEs
-                ue_mapping = self.create_ues(ue_df, filiere_mapping)
-                
-                # 5. Étudiants
-                etudiant_mapping = self.create_etudiants(etudiants_df, filiere_mapping)
-                
-                # 6. Salles (30 salles)
-                salles = self.create_salles()
-                
-                # 7. Sessions d'examen
-                sessions = self.create_session_examen(annee_academique)
-                
-                # 8. Utilisateurs supplémentaires
-                self.create_users_supplementaires()
-                
-                # 9. Paiements (mixte)
-                self.create_paiements(etudiant_mapping, annee_academique)
-                
-                # 10. Inscriptions UE
-                self.create_inscriptions_ues(etudiant_mapping, ue_mapping, annee_academique)
-                
-                # 11. Examens pour TOUTES les UEs
-                if sessions and salles:
-                    self.create_examens(ue_mapping, annee_academique, sessions, salles)
-                
-                self.stdout.write(self.style.SUCCESS('\n' + '=' * 60))
-                self.stdout.write(self.style.SUCCESS('✅ CHARGEMENT DES DONNÉES TERMINÉ AVEC SUCCÈS!'))
-                self.stdout.write(self.style.SUCCESS('=' * 60))
-                
-                # Afficher le résumé
-                self.print_summary()
-                
+            if stream:
+                # Une transaction par bloc : une erreur n'annule que le bloc en cours
+                with transaction.atomic():
+                    referentiel = self.create_referentiel(filieres_df, ue_df)
+                self.import_etudiants_stream(etudiants_path, referentiel, checkpoint, options)
+                with transaction.atomic():
+                    self.create_examens_phase(referentiel)
+                if os.path.exists(options['checkpoint']):
+                    os.remove(options['checkpoint'])
+            else:
+                # Exécuter dans une transaction
+                with transaction.atomic():
+                    referentiel = self.create_referentiel(filieres_df, ue_df)
+                    self.import_etudiants(etudiants_df, referentiel, options)
+                    self.create_examens_phase(referentiel)
+            
+            self.stdout.write(self.style.SUCCESS('\n' + '=' * 60))
+            self.stdout.write(self.style.SUCCESS('✅ CHARGEMENT DES DONNÉES TERMINÉ AVEC SUCCÈS!'))
+            self.stdout.write(self.style.SUCCESS('=' * 60))
+            
+            # Afficher le résumé
+            self.print_summary()
+            if self.rejects_count:
+                self.stdout.write(self.style.WARNING(
+                    f"\n⚠️  {self.rejects_count} ligne(s) rejetée(s), voir {self.rejects_path}"
+                ))
+            self.print_timings()
+            
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"❌ Erreur lors de l'import: {e}"))
             import traceback
             self.stdout.write(traceback.format_exc())
-            self.stdout.write(self.style.WARNING("⏪ Rollback de la transaction en cours..."))
+            if stream:
+                self.stdout.write(self.style.WARNING(
+                    f"⏸️  Les blocs déjà validés sont conservés ; relancer avec --stream pour reprendre "
+                    f"({options['checkpoint']})"
+                ))
+            else:
+                self.stdout.write(self.style.WARNING("⏪ Rollback de la transaction en cours..."))
     
-    def read_csv_with_encoding(self, file_path):
-        """Lit un fichier CSV en essayant différents encodages"""
-        encodings = ['utf-8', 'latin-1', 'ISO-8859-1', 'cp1252', 'utf-8-sig']
+    def create_referentiel(self, filieres_df, ue_df):
+        """Données de référence : année, niveaux, filières, UEs, salles, sessions, utilisateurs"""
+        # 1. Année académique
+        annee_academique = self.create_annee_academique()
+        if not annee_academique:
+            raise Exception("Impossible de créer l'année académique")
+        
+        # 2. Niveaux
+        with self.phase('Niveaux'):
+            self.create_niveaux()
+        
+        # 3. Filieres
+        with self.phase('Filières'):
+            filiere_mapping = self.create_filieres(filieres_df)
+        
+        # 4. UEs
+        with self.phase('UEs'):
+            ue_mapping = self.create_ues(ue_df, filiere_mapping)
+        
+        # 5. Salles (30 salles)
+        with self.phase('Salles'):
+            salles = self.create_salles()
+        
+        # 6. Sessions d'examen
+        with self.phase("Sessions d'examen"):
+            sessions = self.create_session_examen(annee_academique)
+        
+        # 7. Utilisateurs supplémentaires
+        with self.phase('Utilisateurs'):
+            self.create_users_supplementaires()
+        
+        return {
+            'annee_academique': annee_academique,
+            'filiere_mapping': filiere_mapping,
+            'ue_mapping': ue_mapping,
+            'salles': salles,
+            'sessions': sessions,
+        }
+    
+    def import_etudiants(self, etudiants_df, referentiel, options, offset=0, details=True):
+        """Étudiants, comptes, paiements et inscriptions UE d'un dataframe (ou d'un bloc)"""
+        annee_academique = referentiel['annee_academique']
+        
+        # 8. Étudiants
+        with self.phase('Étudiants'):
+            etudiant_mapping = self.create_etudiants(etudiants_df, referentiel['filiere_mapping'])
+        
+        # 9. Comptes étudiants (en masse, le signal post_save est suspendu)
+        if not options['skip_accounts']:
+            with self.phase('Comptes étudiants'):
+                self.create_comptes_etudiants(etudiant_mapping)
+        
+        # 10. Paiements (mixte) ; en delta, les paiements existants ne sont pas retouchés
+        if self.delta:
+            etudiants_payes = {m: e for m, e in etudiant_mapping.items() if m in self.nouveaux_etudiants}
+        else:
+            etudiants_payes = etudiant_mapping
+        with self.phase('Paiements'):
+            self.create_paiements(etudiants_payes, annee_academique, offset=offset, details=details)
         
-        for encoding in encodings:
+        # 11. Inscriptions UE
+        with self.phase('Inscriptions UE'):
+            self.create_inscriptions_ues(etudiant_mapping, annee_academique, details=details)
+    
+    def create_examens_phase(self, referentiel):
+        # 12. Examens pour TOUTES les UEs
+        ue_mapping = referentiel['ue_mapping']
+        if self.delta:
+            # Les examens des UEs déjà connues ne sont pas replanifiés
+            ue_mapping = {code: ue for code, ue in ue_mapping.items() if code in self.nouvelles_ues}
+        if referentiel['sessions'] and referentiel['salles'] and ue_mapping:
+            with self.phase('Examens'):
+                self.create_examens(
+                    ue_mapping, referentiel['annee_academique'],
+                    referentiel['sessions'], referentiel['salles'],
+                )
+    
+    def import_etudiants_stream(self, etudiants_path, referentiel, checkpoint, options):
+        """
+        Import du fichier étudiants par blocs de --chunk-size lignes.
+        
+        Chaque bloc est validé dans sa propre transaction puis noté dans le
+        fichier de reprise. Si un bloc échoue, ses lignes sont réimportées
+        une à une et celles qui échouent encore vont dans le fichier de rejets.
+        """
+        lignes_faites = checkpoint['rows'] if checkpoint else 0
+        if lignes_faites:
+            self.stdout.write(self.style.WARNING(f"↻ Reprise après {lignes_faites} ligne(s) étudiants"))
+        
+        encoding = self.detect_encoding(etudiants_path)
+        lecteur = pd.read_csv(
+            etudiants_path,
+            encoding=encoding,
+            chunksize=options['chunk_size'],
+            skiprows=range(1, lignes_faites + 1),
+            dtype=str,
+        )
+        
+        for bloc in lecteur:
+            bloc = self.clean_etudiants_data(bloc)
             try:
-                df = pd.read_csv(file_path, encoding=encoding)
-                return df
-            except UnicodeDecodeError:
-                continue
+                with transaction.atomic():
+                    self.import_etudiants(bloc, referentiel, options, offset=lignes_faites, details=False)
             except Exception as e:
-                self.stdout.write(f"⚠️  Erreur avec l'encodage {encoding} pour {file_path}: {e}")
-                continue
+                self.stdout.write(self.style.WARNING(f"⚠️  Bloc en échec ({e}), import ligne par ligne..."))
+                echecs = []
+                for i in range(len(bloc)):
+                    ligne = bloc.iloc[[i]]
+                    try:
+                        with transaction.atomic():
+                            self.import_etudiants(ligne, referentiel, options, offset=lignes_faites + i, details=False)
+                    except Exception as erreur:
+                        echecs.append((ligne, erreur))
+                
+                # Aucune ligne ne passe : erreur générale (base indisponible...), on s'arrête
+                if len(bloc) > 1 and len(echecs) == len(bloc):
+                    raise echecs[-1][1]
+                for ligne, erreur in echecs:
+                    self.write_rejects(ligne, str(erreur))
+            
+            lignes_faites += len(bloc)
+            self.save_checkpoint(options['checkpoint'], etudiants_path, lignes_faites)
+            self.stdout.write(self.style.SUCCESS(f"  ✓ {lignes_faites} ligne(s) étudiants validée(s)"))
+    
+    def load_checkpoint(self, checkpoint_path, etudiants_path):
+        """Point de reprise, s'il correspond bien au fichier étudiants actuel"""
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('file') != etudiants_path or checkpoint.get('size') != os.path.getsize(etudiants_path):
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {checkpoint_path} concerne un autre fichier : import repris depuis le début"
+            ))
+            return None
+        return checkpoint
+    
+    def save_checkpoint(self, checkpoint_path, etudiants_path, lignes):
+        with open(checkpoint_path, 'w') as f:
+            json.dump({'file': etudiants_path, 'size': os.path.getsize(etudiants_path), 'rows': lignes}, f)
+    
+    def write_rejects(self, lignes, motif):
+        """Ajoute des lignes rejetées (avec leur motif) au fichier de rejets"""
+        if lignes.empty:
+            return
+        lignes = lignes.assign(motif_rejet=motif)
+        entete = not os.path.exists(self.rejects_path)
+        lignes.to_csv(self.rejects_path, mode='a', header=entete, index=False, encoding='utf-8')
+        self.rejects_count += len(lignes)
+    
+    def detect_encoding(self, file_path, taille=1024 * 1024):
+        """Détecte l'encodage d'après le début du fichier (lu une seule fois)"""
+        with open(file_path, 'rb') as f:
+            debut = f.read(taille)
         
-        # Si aucun encodage ne fonctionne, essayer sans spécifier d'encodage
+        if debut.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        
+        # Un caractère multi-octets peut être coupé en fin d'échantillon
+        echantillon = debut if len(debut) < taille else debut[:-4]
+        for encoding in ('utf-8', 'cp1252'):
+            try:
+                echantillon.decode(encoding)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return 'latin-1'
+    
+    def read_csv_with_encoding(self, file_path):
+        """Lit un fichier CSV avec l'encodage détecté"""
+        encoding = self.detect_encoding(file_path)
         try:
-            df = pd.read_csv(file_path)
-            return df
+            return pd.read_csv(file_path, encoding=encoding)
         except Exception as e:
-            raise Exception(f"Impossible de lire le fichier {file_path} avec aucun encodage: {e}")
+            raise Exception(f"Impossible de lire le fichier {file_path} ({encoding}): {e}")
     
     def clear_tables(self):
         """Vide les tables avant import"""
@@ -187,60 +471,71 @@ class Command(BaseCommand):
         # Afficher les colonnes originales
         self.stdout.write(f"  Colonnes Filières: {list(filieres_df.columns)}")
         self.stdout.write(f"  Colonnes UEs: {list(ue_df.columns)}")
-        self.stdout.write(f"  Colonnes Étudiants: {list(etudiants_df.columns)}")
+        if etudiants_df is not None:
+            self.stdout.write(f"  Colonnes Étudiants: {list(etudiants_df.columns)}")
         
-        # Nettoyer les noms de colonnes (supprimer les espaces)
-        filieres_df.columns = [col.strip() for col in filieres_df.columns]
-        ue_df.columns = [col.strip() for col in ue_df.columns]
-        etudiants_df.columns = [col.strip() for col in etudiants_df.columns]
+        # Nettoyer les noms de colonnes (espaces, minuscules)
+        filieres_df.columns = [col.strip().lower() for col in filieres_df.columns]
+        ue_df.columns = [col.strip().lower() for col in ue_df.columns]
         
-        # Normaliser les noms de colonnes (minuscules)
-        filieres_df.columns = [col.lower() for col in filieres_df.columns]
-        ue_df.columns = [col.lower() for col in ue_df.columns]
-        etudiants_df.columns = [col.lower() for col in etudiants_df.columns]
+        ue_df = self.clean_ue_data(ue_df)
+        if etudiants_df is not None:
+            etudiants_df = self.clean_etudiants_data(etudiants_df)
         
-        # Standardiser les noms de colonnes pour UE
-        column_mapping = {}
+        return filieres_df, ue_df, etudiants_df
+    
+    def clean_etudiants_data(self, etudiants_df):
+        """Normalise les colonnes étudiants (fichier complet ou bloc)"""
+        etudiants_df.columns = [col.strip().lower() for col in etudiants_df.columns]
+        
+        # Créer des emails par défaut si non présents (téléphones : voir normalize_etudiants)
+        if 'email' not in etudiants_df.columns and 'matricule' in etudiants_df.columns:
+            etudiants_df['email'] = etudiants_df['matricule'].astype(str) + '@univ.local'
         
-        # Mapper les colonnes existantes
+        return etudiants_df
+    
+    def clean_ue_data(self, ue_df):
+        """Standardise les colonnes UE (une seule fois, pas par ligne) et normalise les valeurs"""
+        column_mapping = {}
         for col in ue_df.columns:
-            col_lower = col.lower()
-            if 'code' in col_lower:
+            if 'code' in col:
                 column_mapping[col] = 'code'
-            elif 'nitit' in col_lower or 'intit' in col_lower or 'titre' in col_lower:
+            elif 'nitit' in col or 'intit' in col or 'titre' in col:
                 column_mapping[col] = 'intitule'
-            elif 'silver' in col_lower or 'filiere' in col_lower:
+            elif 'silver' in col or 'filiere' in col:
                 column_mapping[col] = 'filiere'
-            elif 'inver' in col_lower or 'niveau' in col_lower:
+            elif 'inver' in col or 'niveau' in col:
                 column_mapping[col] = 'niveau'
-            elif 'semestre' in col_lower:
+            elif 'semestre' in col:
                 column_mapping[col] = 'semestre'
-            elif 'sperol' in col_lower:
+            elif 'sperol' in col:
                 column_mapping[col] = 'sperol'
         
-        if column_mapping:
-            ue_df = ue_df.rename(columns=column_mapping)
+        ue_df = ue_df.rename(columns=column_mapping)
+        # Plusieurs en-têtes peuvent correspondre au même champ : garder le premier
+        ue_df = ue_df.loc[:, ~ue_df.columns.duplicated()]
+        
+        for col in ('code', 'intitule', 'filiere'):
+            ue_df[col] = texte(ue_df[col]) if col in ue_df.columns else ''
         
-        # Nettoyer les valeurs pour UE
         if 'semestre' in ue_df.columns:
-            ue_df['semestre'] = ue_df['semestre'].astype(str).str.extract(r'(\d+)')
-            ue_df['semestre'] = pd.to_numeric(ue_df['semestre'], errors='coerce')
+            ue_df['semestre'] = pd.to_numeric(
+                ue_df['semestre'].astype(str).str.extract(r'(\d+)', expand=False), errors='coerce'
+            )
+        else:
+            ue_df['semestre'] = np.nan
         
         if 'niveau' in ue_df.columns:
-            ue_df['niveau'] = ue_df['niveau'].astype(str).str.replace('L', '').str.strip()
-            ue_df['niveau'] = pd.to_numeric(ue_df['niveau'], errors='coerce')
-        
-        if 'filiere' in ue_df.columns:
-            ue_df['filiere'] = ue_df['filiere'].astype(str).str.strip()
-        
-        # Pour les étudiants, créer des emails et téléphones par défaut si non présents
-        if 'email' not in etudiants_df.columns and 'matricule' in etudiants_df.columns:
-            etudiants_df['email'] = etudiants_df['matricule'].astype(str) + '@univ.local'
-        
-        if 'telephone' not in etudiants_df.columns:
-            etudiants_df['telephone'] = '+237600000000'
+            ue_df['niveau'] = pd.to_numeric(
+                ue_df['niveau'].astype(str).str.replace('L', '').str.strip(), errors='coerce'
+            )
+        else:
+            ue_df['niveau'] = np.nan
         
-        return filieres_df, ue_df, etudiants_df
+        ue_df['semestre'] = ue_df['semestre'].fillna(1).astype(int)
+        ue_df['niveau'] = ue_df['niveau'].fillna(1).astype(int)
+        ue_df['intitule'] = ue_df['intitule'].where(ue_df['intitule'] != '', 'UE ' + ue_df['code'])
+        return ue_df
     
     def create_annee_academique(self):
         """Crée une année académique par défaut"""
@@ -256,35 +551,22 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"❌ Erreur lors de la création de l'année académique: {e}"))
             return None
     
-    def create_niveaux(self):
-        """Crée les niveaux L1, L2, L3, M1, M2"""
-        niveaux = [
-            {'nom': 'L1', 'ordre': 1},
-            {'nom': 'L2', 'ordre': 2},
-            {'nom': 'L3', 'ordre': 3},
-            {'nom': 'M1', 'ordre': 4},
-            {'nom': 'M2', 'ordre': 5},
-        ]
-        
-        created_count = 0
-        for niveau_data in niveaux:
-            try:
-                obj, created = Niveau.objects.get_or_create(
-                    nom=niveau_data['nom'],
-                    defaults={'ordre': niveau_data['ordre']}
-                )
-                if created:
-                    created_count += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur lors de la création du niveau {niveau_data['nom']}: {e}"))
+    def create_niveaux(self, ordres=(1, 2, 3, 4, 5)):
+        """Crée les niveaux manquants (L1, L2, L3, M1, M2 par défaut) et retourne {ordre: niveau}"""
+        noms_standard = {1: 'L1', 2: 'L2', 3: 'L3', 4: 'M1', 5: 'M2'}
+        
+        existants = Niveau.objects.count()
+        Niveau.objects.bulk_create(
+            [Niveau(nom=noms_standard.get(ordre, f'L{ordre}'), ordre=ordre) for ordre in ordres],
+            ignore_conflicts=True,
+        )
+        created_count = Niveau.objects.count() - existants
         
-        self.stdout.write(self.style.SUCCESS(f"📚 Niveaux créés: {created_count}/{len(niveaux)}"))
+        self.stdout.write(self.style.SUCCESS(f"📚 Niveaux créés: {created_count}/{len(ordres)}"))
+        return {niveau.ordre: niveau for niveau in Niveau.objects.all()}
     
     def create_filieres(self, filieres_df):
         """Crée les filières à partir du dataframe"""
-        created_count = 0
-        filiere_mapping = {}
-        
         # Déterminer les noms de colonnes
         nom_col = None
         code_col = None
@@ -302,195 +584,169 @@ class Command(BaseCommand):
                 nom_col = filieres_df.columns[0]
                 code_col = filieres_df.columns[1]
         
-        for _, row in filieres_df.iterrows():
-            try:
-                nom_filiere = str(row[nom_col]).strip() if nom_col else 'Filière inconnue'
-                code_filiere = str(row[code_col]).strip() if code_col else 'CODE'
-                
-                if not nom_filiere or nom_filiere == 'nan':
-                    self.stdout.write(self.style.WARNING(f"⚠️  Nom de filière manquant pour la ligne: {row.to_dict()}"))
-                    continue
-                
-                if not code_filiere or code_filiere == 'nan':
-                    code_filiere = nom_filiere[:3].upper()
-                
-                # Créer ou récupérer la filière
-                filiere, created = Filiere.objects.get_or_create(
-                    code=code_filiere,
-                    defaults={'nom': nom_filiere}
-                )
-                
-                if created:
-                    created_count += 1
-                
-                # Stocker le mapping pour référence ultérieure
-                filiere_mapping[nom_filiere.upper()] = filiere
-                filiere_mapping[code_filiere] = filiere
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur lors de la création de la filière {row.to_dict()}: {e}"))
+        df = pd.DataFrame({
+            'nom': texte(filieres_df[nom_col]) if nom_col else 'Filière inconnue',
+            'code': texte(filieres_df[code_col]) if code_col else 'CODE',
+        })
+        
+        sans_nom = df['nom'] == ''
+        if sans_nom.any():
+            self.stdout.write(self.style.WARNING(f"⚠️  Nom de filière manquant pour {sans_nom.sum()} ligne(s)"))
+        df = df[~sans_nom].copy()
+        df['code'] = df['code'].where(df['code'] != '', df['nom'].str[:3].str.upper())
+        
+        existants = Filiere.objects.count()
+        Filiere.objects.bulk_create(
+            [Filiere(code=code, nom=nom) for nom, code in df.drop_duplicates('code').itertuples(index=False)],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        created_count = Filiere.objects.count() - existants
+        
+        # Mapping nom / code -> filière, pour référence ultérieure
+        par_code = Filiere.objects.in_bulk(df['code'].unique().tolist(), field_name='code')
+        filiere_mapping = {}
+        for nom, code in df.itertuples(index=False):
+            filiere_mapping[nom.upper()] = par_code[code]
+            filiere_mapping[code] = par_code[code]
         
         self.stdout.write(self.style.SUCCESS(f"🎓 Filieres créées: {created_count}"))
         return filiere_mapping
     
+    def find_filiere(self, filiere_nom, filiere_mapping):
+        """Filière correspondant à un libellé du fichier UE (appelé une fois par libellé distinct)"""
+        filiere_nom = filiere_nom.upper()
+        
+        # Essayer de trouver la filière directement
+        for key, filiere in filiere_mapping.items():
+            if key.upper() in filiere_nom:
+                return filiere
+        
+        # Sinon, essayer avec les noms abrégés
+        for key, code_abrev in FILIERE_NAME_MAPPING.items():
+            if key in filiere_nom and code_abrev in filiere_mapping:
+                return filiere_mapping[code_abrev]
+        return None
+    
     def create_ues(self, ue_df, filiere_mapping):
-        """Crée les UEs à partir du dataframe"""
-        created_count = 0
-        ue_mapping = {}
-        
-        # Mapping des noms de filière abrégés
-        filiere_name_mapping = {
-            'PHYSIQUE': 'RHY',
-            'CHIMIE': 'CUM',
-            'MATHEMATIQUE': 'MAT',
-            'INFORMATIQUE': 'INF',
-            'GEOSCIENCES': 'GEOS',
-            'BIOCHIMIE': 'BCH',
-            'BIOLOGIE ET PHYSIOLOGIE ANIMALE': 'BOA',
-            'BIOLOGIE ET PHYSIOLOGIE VEGETALE': 'BOV',
-            'BIOSCIENCES': 'BIOS',
-            'MICROBIOLOGIE': 'MIB',
-            'CHIMIE ORGANIQUE': 'CQ',
-            'CHIMIE INORGANIQUE': 'CI',
-        }
-        
-        for _, row in ue_df.iterrows():
-            try:
-                # Extraire les valeurs
-                code = str(row.get('code', '')).strip()
-                intitule = str(row.get('intitule', '')).strip()
-                filiere_nom = str(row.get('filiere', '')).strip()
-                niveau_num = row.get('niveau')
-                semestre = row.get('semestre')
-                
-                # Si certaines valeurs sont manquantes, essayer d'autres noms de colonnes
-                if not code:
-                    for col in row.index:
-                        if 'code' in col.lower():
-                            code = str(row[col]).strip()
-                            break
-                
-                if not intitule:
-                    for col in row.index:
-                        if 'nitit' in col.lower() or 'intit' in col.lower():
-                            intitule = str(row[col]).strip()
-                            break
-                
-                if not filiere_nom or pd.isna(filiere_nom):
-                    for col in row.index:
-                        if 'silver' in col.lower() or 'filiere' in col.lower():
-                            filiere_nom = str(row[col]).strip()
-                            break
-                
-                if pd.isna(niveau_num):
-                    for col in row.index:
-                        if 'inver' in col.lower() or 'niveau' in col.lower():
-                            niveau_num = row[col]
-                            break
-                
-                if pd.isna(semestre):
-                    for col in row.index:
-                        if 'semestre' in col.lower():
-                            semestre = row[col]
-                            break
-                
-                # Validation des données requises
-                if not code:
-                    self.stdout.write(self.style.WARNING(f"⚠️  Code manquant pour la ligne UE: {row.to_dict()}"))
-                    continue
-                
-                if not intitule:
-                    intitule = f"UE {code}"
-                
-                if not filiere_nom or pd.isna(filiere_nom) or filiere_nom == 'nan':
-                    self.stdout.write(self.style.WARNING(f"⚠️  Filière manquante pour l'UE {code}"))
-                    continue
-                
-                if pd.isna(niveau_num):
-                    niveau_num = 1
-                
-                if pd.isna(semestre):
-                    semestre = 1
-                
-                # Trouver la filière correspondante
-                filiere = None
-                
-                # Essayer de trouver la filière directement
-                for key, f in filiere_mapping.items():
-                    if isinstance(key, str) and key.upper() in filiere_nom.upper():
-                        filiere = f
-                        break
-                
-                # Si non trouvé, essayer avec le mapping
-                if not filiere:
-                    for key in filiere_name_mapping:
-                        if key in filiere_nom.upper():
-                            code_abrev = filiere_name_mapping[key]
-                            if code_abrev in filiere_mapping:
-                                filiere = filiere_mapping[code_abrev]
-                                break
-                
-                if not filiere:
-                    self.stdout.write(self.style.WARNING(f"⚠️  Filière non trouvée pour {filiere_nom} (UE: {code})"))
-                    if filiere_mapping:
-                        filiere = list(filiere_mapping.values())[0]
-                    else:
-                        continue
-                
-                # Trouver le niveau correspondant
-                try:
-                    niveau_num_int = int(float(niveau_num))
-                    niveau, _ = Niveau.objects.get_or_create(
-                        nom=f"L{niveau_num_int}",
-                        defaults={'ordre': niveau_num_int}
-                    )
-                except (ValueError, TypeError):
-                    niveau, _ = Niveau.objects.get_or_create(
-                        nom='L1',
-                        defaults={'ordre': 1}
-                    )
-                
-                # Créer ou mettre à jour l'UE
-                ue, created = UE.objects.get_or_create(
-                    code=code,
-                    filiere=filiere,
-                    defaults={
-                        'intitule': intitule,
-                        'niveau': niveau,
-                        'semestre': int(semestre),
-                        'credit': 6
-                    }
-                )
-                
-                if not created:
-                    ue.intitule = intitule
-                    ue.niveau = niveau
-                    ue.semestre = int(semestre)
-                    ue.save()
-                
-                if created:
-                    created_count += 1
-                
-                ue_mapping[code] = ue
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur lors de la création de l'UE: {e}"))
+        """Crée ou met à jour les UEs à partir du dataframe nettoyé"""
+        sans_code = ue_df['code'] == ''
+        sans_filiere = ~sans_code & (ue_df['filiere'] == '')
+        if sans_code.any():
+            self.stdout.write(self.style.WARNING(f"⚠️  Code manquant pour {sans_code.sum()} ligne(s) UE"))
+        for code in ue_df.loc[sans_filiere, 'code']:
+            self.stdout.write(self.style.WARNING(f"⚠️  Filière manquante pour l'UE {code}"))
+        ue_df = ue_df[~sans_code & ~sans_filiere].drop_duplicates('code', keep='last')
+        
+        # Résolution des filières par libellé distinct
+        filiere_par_libelle = {}
+        for libelle in ue_df['filiere'].unique():
+            filiere = self.find_filiere(libelle, filiere_mapping)
+            if not filiere:
+                self.stdout.write(self.style.WARNING(f"⚠️  Filière non trouvée pour {libelle}"))
+                filiere = next(iter(filiere_mapping.values()), None)
+            filiere_par_libelle[libelle] = filiere
+        ue_df = ue_df[ue_df['filiere'].map(filiere_par_libelle).notna()]
+        
+        niveaux = self.create_niveaux(sorted(set(ue_df['niveau']) | {1}))
+        niveau_ids = {ordre: niveau.pk for ordre, niveau in niveaux.items()}
+        
+        df = pd.DataFrame({
+            'code': ue_df['code'],
+            'intitule': ue_df['intitule'],
+            'filiere_id': ue_df['filiere'].map(lambda libelle: filiere_par_libelle[libelle].pk),
+            'niveau_id': ue_df['niveau'].map(niveau_ids).fillna(niveau_ids[1]).astype(int),
+            'semestre': ue_df['semestre'].astype(int),
+        })
+        
+        if self.delta:
+            nouvelles, modifiees, champs = self.split_delta(UE, df, 'code', CHAMPS_UE)
+            UE.objects.bulk_create(self.build_ues(nouvelles), batch_size=self.batch_size)
+            self.update_delta(UE, self.build_ues(modifiees), champs)
+            self.nouvelles_ues.update(nouvelles['code'])
+            self.stdout.write(self.style.SUCCESS(
+                f"📖 UEs: {len(nouvelles)} créées, {len(modifiees)} modifiées, "
+                f"{len(df) - len(nouvelles) - len(modifiees)} inchangées"
+            ))
+        else:
+            existants = UE.objects.count()
+            UE.objects.bulk_create(
+                self.build_ues(df),
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['code'],
+                update_fields=['intitule', 'niveau', 'semestre', 'date_modification'],
+            )
+            created_count = UE.objects.count() - existants
+            self.stdout.write(self.style.SUCCESS(f"📖 UEs créées: {created_count} ({len(df)} importées)"))
         
-        self.stdout.write(self.style.SUCCESS(f"📖 UEs créées: {created_count}"))
-        return ue_mapping
+        return UE.objects.in_bulk(df['code'].tolist(), field_name='code')
     
-    def create_etudiants(self, etudiants_df, filiere_mapping):
-        """Crée les étudiants à partir du dataframe"""
-        created_count = 0
-        etudiant_mapping = {}
-        
-        # Mapping des codes de filière basés sur le matricule
-        code_filiere_map = {
-            'B': 'BCH', 'C': 'CUM', 'D': 'BOV', 'E': 'BOA',
-            'F': 'GEOS', 'G': 'INF', 'H': 'RHY', 'I': 'MAT',
-            'J': 'MIB', 'K': 'CQ', 'L': 'CI', 'M': 'BIOS'
-        }
-        
+    def build_ues(self, df):
+        """Instances UE (avec la clé primaire existante si la colonne pk est présente)"""
+        return [
+            UE(
+                pk=ligne.get('pk'),
+                code=ligne['code'],
+                intitule=ligne['intitule'],
+                filiere_id=int(ligne['filiere_id']),
+                niveau_id=int(ligne['niveau_id']),
+                semestre=int(ligne['semestre']),
+                credit=6,
+            )
+            for ligne in df.to_dict('records')
+        ]
+    
+    def split_delta(self, model, df, key, champs, derives=None):
+        """
+        Sépare les lignes entrantes en nouvelles et modifiées en comparant
+        leurs empreintes à celles des lignes existantes (chargées en une
+        requête). Les lignes modifiées reçoivent la clé primaire existante
+        (colonne pk). Retourne (nouvelles, modifiées, champs modifiés).
+        
+        derives : {colonne: colonne booléenne} des valeurs inventées faute de
+        donnée dans le fichier ; pour une ligne existante, la valeur en base
+        est conservée.
+        """
+        existants = pd.DataFrame.from_records(
+            list(model.objects.values_list('pk', key, *champs)), columns=['pk', key, *champs]
+        ).set_index(key)
+        
+        entrants = df.set_index(key)
+        connus = entrants.index.isin(existants.index)
+        nouvelles = df[~connus]
+        
+        a_comparer = entrants[connus].copy()
+        actuels = existants.loc[a_comparer.index]
+        for col, drapeau in (derives or {}).items():
+            masque = a_comparer[drapeau].astype(bool)
+            a_comparer.loc[masque, col] = actuels.loc[masque, col]
+        
+        differents = empreintes(a_comparer[champs]) != empreintes(actuels[champs])
+        
+        avant = forme_canonique(actuels.loc[differents, champs])
+        apres = forme_canonique(a_comparer.loc[differents, champs])
+        champs_modifies = [col for col in champs if (avant[col] != apres[col]).any()]
+        
+        modifiees = a_comparer[differents].assign(pk=actuels.loc[differents, 'pk']).reset_index()
+        return nouvelles, modifiees, champs_modifies
+    
+    def update_delta(self, model, objets, champs):
+        """bulk_update des seuls champs modifiés (date_modification comprise)"""
+        if not objets or not champs:
+            return
+        maintenant = timezone.now()
+        for objet in objets:
+            objet.date_modification = maintenant
+        champs = [champ.removesuffix('_id') for champ in champs] + ['date_modification']
+        model.objects.bulk_update(objets, champs, batch_size=self.batch_size)
+    
+    def normalize_etudiants(self, etudiants_df, filiere_mapping):
+        """
+        Normalise le dataframe étudiants en colonnes prêtes à insérer
+        (matricule, nom, prenom, email, telephone, filiere_id, niveau_id).
+        Retourne (lignes valides, lignes rejetées).
+        """
         # Déterminer les colonnes
         matricule_col = None
         nom_col = None
@@ -519,94 +775,133 @@ class Command(BaseCommand):
         if not prenom_col and len(etudiants_df.columns) > 2:
             prenom_col = etudiants_df.columns[2]
         
-        for _, row in etudiants_df.iterrows():
-            try:
-                matricule = str(row[matricule_col]).strip() if matricule_col else ''
-                nom = str(row[nom_col]).strip() if nom_col else ''
-                prenom = str(row[prenom_col]).strip() if prenom_col else ''
-                email = str(row[email_col]).strip() if email_col else ''
-                telephone = str(row[telephone_col]).strip() if telephone_col else ''
-                
-                if not matricule or not nom or not prenom:
-                    self.stdout.write(self.style.WARNING(f"⚠️  Données manquantes pour l'étudiant: {row.to_dict()}"))
-                    continue
-                
-                # Déterminer la filière basée sur le code de matricule
-                filiere = None
-                niveau = None
-                
-                # Extraire le code filière du matricule (ex: 22C422 -> C)
-                if len(matricule) >= 3:
-                    code_char = matricule[2].upper()
-                    if code_char in code_filiere_map:
-                        code_filiere = code_filiere_map[code_char]
-                        filiere = filiere_mapping.get(code_filiere)
-                
-                # Si non trouvé, prendre une filière aléatoire
-                if not filiere and filiere_mapping:
-                    filiere = random.choice(list(filiere_mapping.values()))
-                
-                # Déterminer le niveau basé sur l'année du matricule
-                try:
-                    annee_matricule = int(matricule[:2])
-                    if annee_matricule in [21, 22]:
-                        niveau_num = random.choice([1, 2])
-                        niveau, _ = Niveau.objects.get_or_create(
-                            nom=f'L{niveau_num}',
-                            defaults={'ordre': niveau_num}
-                        )
-                    else:
-                        niveau, _ = Niveau.objects.get_or_create(
-                            nom='L1',
-                            defaults={'ordre': 1}
-                        )
-                except:
-                    niveau, _ = Niveau.objects.get_or_create(
-                        nom='L1',
-                        defaults={'ordre': 1}
-                    )
-                
-                # Créer l'email si non fourni
-                if not email:
-                    email = f"{matricule}@univ.local"
-                
-                # Créer le téléphone si non fourni
-                if not telephone:
-                    telephone = f'+2376{random.randint(10000000, 99999999)}'
-                
-                # Créer ou mettre à jour l'étudiant
-                etudiant, created = Etudiant.objects.get_or_create(
-                    matricule=matricule,
-                    defaults={
-                        'nom': nom,
-                        'prenom': prenom,
-                        'email': email,
-                        'telephone': telephone,
-                        'filiere': filiere,
-                        'niveau': niveau,
-                        'statut': 'actif'
-                    }
-                )
-                
-                if not created:
-                    etudiant.nom = nom
-                    etudiant.prenom = prenom
-                    etudiant.email = email
-                    etudiant.telephone = telephone
-                    etudiant.filiere = filiere
-                    etudiant.niveau = niveau
-                    etudiant.save()
-                
-                if created:
-                    created_count += 1
-                
-                etudiant_mapping[matricule] = etudiant
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur lors de la création de l'étudiant {row.get('matricule', 'N/A')}: {e}"))
+        def colonne(col):
+            return texte(etudiants_df[col]) if col else pd.Series('', index=etudiants_df.index)
+        
+        df = pd.DataFrame({
+            'matricule': colonne(matricule_col),
+            'nom': colonne(nom_col),
+            'prenom': colonne(prenom_col),
+            'email': colonne(email_col),
+            'telephone': colonne(telephone_col),
+        })
+        
+        invalides = (df['matricule'] == '') | (df['nom'] == '') | (df['prenom'] == '')
+        rejets = etudiants_df[invalides]
+        df = df[~invalides].copy()
+        
+        # Filière d'après le code du matricule (ex: 22C422 -> C), sinon aléatoire
+        filiere_ids = {key: filiere.pk for key, filiere in filiere_mapping.items()}
+        df['filiere_id'] = df['matricule'].str[2].str.upper().map(CODE_FILIERE_MAP).map(filiere_ids)
+        sans_filiere = df['filiere_id'].isna()
+        df['filiere_aleatoire'] = sans_filiere
+        if sans_filiere.any() and filiere_ids:
+            df.loc[sans_filiere, 'filiere_id'] = np.random.choice(
+                sorted(set(filiere_ids.values())), sans_filiere.sum()
+            )
+        
+        # Niveau d'après l'année du matricule : L1 ou L2 pour 21/22, L1 sinon
+        niveaux = {niveau.ordre: niveau.pk for niveau in Niveau.objects.filter(ordre__in=[1, 2])}
+        annee_matricule = pd.to_numeric(df['matricule'].str[:2], errors='coerce')
+        df['niveau_aleatoire'] = annee_matricule.isin([21, 22])
+        ordre = np.where(df['niveau_aleatoire'], np.random.choice([1, 2], len(df)), 1)
+        df['niveau_id'] = pd.Series(ordre, index=df.index).map(niveaux)
+        
+        # Email et téléphone par défaut
+        df['email'] = df['email'].where(df['email'] != '', df['matricule'] + '@univ.local')
+        df['telephone_aleatoire'] = df['telephone'] == ''
+        telephones = '+2376' + pd.Series(
+            np.random.randint(10000000, 100000000, len(df)), index=df.index
+        ).astype(str)
+        df['telephone'] = df['telephone'].where(df['telephone'] != '', telephones)
+        
+        return df.drop_duplicates('matricule', keep='last'), rejets
+    
+    def create_etudiants(self, etudiants_df, filiere_mapping):
+        """Crée ou met à jour les étudiants à partir du dataframe"""
+        df, rejets = self.normalize_etudiants(etudiants_df, filiere_mapping)
+        if len(rejets):
+            self.stdout.write(self.style.WARNING(f"⚠️  Données manquantes pour {len(rejets)} étudiant(s)"))
+            self.write_rejects(rejets, 'matricule, nom ou prénom manquant')
+        
+        if self.delta:
+            nouvelles, modifiees, champs = self.split_delta(
+                Etudiant, df, 'matricule', CHAMPS_ETUDIANT,
+                derives={
+                    'filiere_id': 'filiere_aleatoire',
+                    'niveau_id': 'niveau_aleatoire',
+                    'telephone': 'telephone_aleatoire',
+                },
+            )
+            with suspendre_creation_comptes():
+                Etudiant.objects.bulk_create(self.build_etudiants(nouvelles), batch_size=self.batch_size)
+            self.update_delta(Etudiant, self.build_etudiants(modifiees), champs)
+            self.nouveaux_etudiants.update(nouvelles['matricule'])
+            self.stdout.write(self.style.SUCCESS(
+                f"👥 Étudiants: {len(nouvelles)} créés, {len(modifiees)} modifiés, "
+                f"{len(df) - len(nouvelles) - len(modifiees)} inchangés"
+            ))
+            return self.load_etudiants(df['matricule'])
+        
+        existants = Etudiant.objects.count()
+        # Les comptes utilisateurs sont créés en masse ensuite (create_comptes_etudiants)
+        with suspendre_creation_comptes():
+            Etudiant.objects.bulk_create(
+                self.build_etudiants(df),
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['matricule'],
+                update_fields=['nom', 'prenom', 'email', 'telephone', 'filiere', 'niveau', 'date_modification'],
+            )
+        created_count = Etudiant.objects.count() - existants
+        
+        self.stdout.write(self.style.SUCCESS(f"👥 Étudiants créés: {created_count} ({len(df)} importés)"))
+        return self.load_etudiants(df['matricule'])
+    
+    def build_etudiants(self, df):
+        """Instances Etudiant (avec la clé primaire existante si la colonne pk est présente)"""
+        return [
+            Etudiant(
+                pk=ligne.get('pk'),
+                matricule=ligne['matricule'],
+                nom=ligne['nom'],
+                prenom=ligne['prenom'],
+                email=ligne['email'],
+                telephone=ligne['telephone'],
+                filiere_id=None if pd.isna(ligne['filiere_id']) else int(ligne['filiere_id']),
+                niveau_id=None if pd.isna(ligne['niveau_id']) else int(ligne['niveau_id']),
+                statut='actif',
+            )
+            for ligne in df.to_dict('records')
+        ]
+    
+    def load_etudiants(self, matricules):
+        """Mapping matricule -> étudiant (une requête par lot, champs utiles à l'import)"""
+        matricules = list(set(matricules))
+        mapping = {}
+        for debut in range(0, len(matricules), self.batch_size):
+            mapping.update(
+                (etudiant.matricule, etudiant)
+                for etudiant in Etudiant.objects.filter(
+                    matricule__in=matricules[debut:debut + self.batch_size]
+                ).only('pk', 'matricule', 'filiere_id', 'niveau_id', 'user_id')
+            )
+        return mapping
+    
+    def create_comptes_etudiants(self, etudiant_mapping):
+        """Crée en masse les comptes des étudiants importés qui n'en ont pas"""
+        sans_compte = sorted(e.pk for e in etudiant_mapping.values() if e.user_id is None)
+        if not sans_compte:
+            self.stdout.write(self.style.SUCCESS("🔑 Comptes étudiants: tous existants"))
+            return
         
-        self.stdout.write(self.style.SUCCESS(f"👥 Étudiants créés: {created_count}"))
-        return etudiant_mapping
+        etudiants = []
+        for debut in range(0, len(sans_compte), self.batch_size):
+            etudiants.extend(Etudiant.objects.filter(
+                pk__in=sans_compte[debut:debut + self.batch_size], user__isnull=True
+            ).only('pk', 'matricule', 'nom', 'prenom', 'email', 'date_naissance', 'user_id'))
+        resultat = StudentAccountService.provision(etudiants, chunk_size=self.batch_size)
+        self.stdout.write(self.style.SUCCESS(f"🔑 Comptes étudiants créés: {resultat['created']}"))
     
     def create_salles(self):
         """Crée 30 salles différentes"""
@@ -729,115 +1024,86 @@ class Command(BaseCommand):
         
         self.stdout.write(self.style.SUCCESS(f"👤 Utilisateurs supplémentaires créés: {created_count}/{len(users)}"))
     
-    def create_paiements(self, etudiants_mapping, annee_academique):
+    def create_paiements(self, etudiants_mapping, annee_academique, offset=0, details=True):
         """Crée les paiements avec statut mixte (certains payés, d'autres non)"""
-        created_count = 0
+        n = len(etudiants_mapping)
+        maintenant = datetime.now()
+        
+        # Alterner les statuts de paiement : 2/3 des étudiants ont payé
+        est_regle = (np.arange(n) + offset) % 3 != 0
+        # Parmi les autres, la moitié a payé partiellement, le reste rien
+        partiel = ~est_regle & (np.random.randint(0, 2, n) == 1)
+        montants = np.where(est_regle, 50000, np.where(partiel, np.random.randint(10000, 40001, n), 0))
+        jours = np.random.randint(1, 31, n)
+        
+        paiements = [
+            Paiement(
+                etudiant=etudiant,
+                annee_academique=annee_academique,
+                montant_attendu=50000,
+                montant=int(montant),
+                est_regle=bool(regle),
+                date_paiement=maintenant - timedelta(days=int(jour)) if regle or part else None,
+            )
+            for etudiant, regle, part, montant, jour in zip(
+                etudiants_mapping.values(), est_regle, partiel, montants, jours
+            )
+        ]
         
-        for i, (matricule, etudiant) in enumerate(etudiants_mapping.items()):
-            try:
-                # Alterner les statuts de paiement
-                est_regle = i % 3 != 0  # 2/3 des étudiants ont payé
-                
-                if est_regle:
-                    montant = 50000  # Paiement complet
-                    date_paiement = datetime.now() - timedelta(days=random.randint(1, 30))
-                else:
-                    # Certains ont payé partiellement, d'autres rien
-                    if random.choice([True, False]):
-                        montant = random.randint(10000, 40000)  # Paiement partiel
-                        date_paiement = datetime.now() - timedelta(days=random.randint(1, 30))
-                    else:
-                        montant = 0  # Pas payé du tout
-                        date_paiement = None
-                
-                paiement, created = Paiement.objects.get_or_create(
-                    etudiant=etudiant,
-                    annee_academique=annee_academique,
-                    defaults={
-                        'montant_attendu': 50000,
-                        'montant': montant,
-                        'est_regle': est_regle,
-                        'date_paiement': date_paiement
-                    }
-                )
-                
-                if created:
-                    created_count += 1
-                else:
-                    # Si le paiement existe déjà, mettre à jour le statut
-                    paiement.montant = montant
-                    paiement.est_regle = est_regle
-                    paiement.date_paiement = date_paiement
-                    paiement.save()
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur lors de la création du paiement pour {matricule}: {e}"))
+        existants = Paiement.objects.count()
+        Paiement.objects.bulk_create(
+            paiements,
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['etudiant', 'annee_academique'],
+            update_fields=['montant', 'est_regle', 'date_paiement', 'date_modification'],
+        )
+        created_count = Paiement.objects.count() - existants
+        
+        self.stdout.write(self.style.SUCCESS(f"💰 Paiements créés: {created_count}"))
+        if not details:
+            return
         
         # Afficher les statistiques
-        total_paiements = Paiement.objects.count()
-        paiements_regles = Paiement.objects.filter(est_regle=True).count()
-        paiements_partiels = Paiement.objects.filter(montant__gt=0, est_regle=False).count()
+        stats = Paiement.objects.aggregate(
+            total=Count('pk'),
+            regles=Count('pk', filter=Q(est_regle=True)),
+            partiels=Count('pk', filter=Q(montant__gt=0, est_regle=False)),
+        )
         
-        self.stdout.write(self.style.SUCCESS(f"💰 Paiements créés: {created_count}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Total: {total_paiements}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Réglés complètement: {paiements_regles}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Partiels: {paiements_partiels}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Non réglés: {total_paiements - paiements_regles - paiements_partiels}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Total: {stats['total']}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Réglés complètement: {stats['regles']}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Partiels: {stats['partiels']}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Non réglés: {stats['total'] - stats['regles'] - stats['partiels']}"))
     
-    def create_inscriptions_ues(self, etudiants_mapping, ue_mapping, annee_academique):
-        """Crée les inscriptions aux UEs pour les étudiants"""
-        created_count = 0
+    def create_inscriptions_ues(self, etudiants_mapping, annee_academique, details=True):
+        """Crée les inscriptions aux UEs pour les étudiants (INSERT … SELECT par lot)"""
+        admin_user = User.objects.filter(is_superuser=True).first()
         
-        # Créer un utilisateur admin pour les created_by
-        try:
-            admin_user = User.objects.filter(is_superuser=True).first()
-        except:
-            admin_user = None
+        # Le croisement étudiants × UEs et l'autorisation d'après le paiement
+        # sont faits par la base ; les lots bornent la taille de la clause IN
+        etudiant_ids = sorted(etudiant.pk for etudiant in etudiants_mapping.values())
+        created_count = 0
+        for debut in range(0, len(etudiant_ids), self.batch_size):
+            created_count += InscriptionService.generate(
+                annee_academique,
+                etudiants=Etudiant.objects.filter(pk__in=etudiant_ids[debut:debut + self.batch_size]),
+                user=admin_user,
+            )
         
-        for matricule, etudiant in etudiants_mapping.items():
-            try:
-                # Vérifier si l'étudiant a payé pour déterminer s'il est autorisé
-                paiement = Paiement.objects.filter(
-                    etudiant=etudiant,
-                    annee_academique=annee_academique
-                ).first()
-                
-                est_autorise = paiement.est_regle if paiement else False
-                
-                # Inscrire l'étudiant aux UEs de sa filière et son niveau
-                ues_inscrire = UE.objects.filter(
-                    filiere=etudiant.filiere,
-                    niveau=etudiant.niveau
-                )
-                
-                for ue in ues_inscrire:
-                    try:
-                        inscription, created = InscriptionUE.objects.get_or_create(
-                            etudiant=etudiant,
-                            ue=ue,
-                            annee_academique=annee_academique,
-                            defaults={
-                                'est_autorise_examen': est_autorise,
-                                'created_by': admin_user
-                            }
-                        )
-                        
-                        if created:
-                            created_count += 1
-                    except Exception as e:
-                        self.stdout.write(self.style.WARNING(f"⚠️  Erreur inscription {matricule} à {ue.code}: {e}"))
-            
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur lors des inscriptions pour {matricule}: {e}"))
+        self.stdout.write(self.style.SUCCESS(f"📝 Inscriptions UE créées: {created_count}"))
+        if not details:
+            return
         
         # Afficher les statistiques
-        total_inscriptions = InscriptionUE.objects.count()
-        autorisees = InscriptionUE.objects.filter(est_autorise_examen=True).count()
+        stats = InscriptionUE.objects.aggregate(
+            total=Count('pk'),
+            autorisees=Count('pk', filter=Q(est_autorise_examen=True)),
+        )
         
-        self.stdout.write(self.style.SUCCESS(f"📝 Inscriptions UE créées: {created_count}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Total: {total_inscriptions}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Autorisées pour examen: {autorisees}"))
-        self.stdout.write(self.style.SUCCESS(f"  - Non autorisées: {total_inscriptions - autorisees}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Total: {stats['total']}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Autorisées pour examen: {stats['autorisees']}"))
+        self.stdout.write(self.style.SUCCESS(f"  - Non autorisées: {stats['total'] - stats['autorisees']}"))
     
     def create_examens(self, ue_mapping, annee_academique, sessions, salles):
         """Crée des examens pour TOUTES les UEs à partir d'aujourd'hui"""
@@ -853,7 +1119,7 @@ class Command(BaseCommand):
         ues_par_filiere_niveau = {}
         
         for ue in ue_mapping.values():
-            key = (ue.filiere.id, ue.niveau.id, ue.semestre)
+            key = (ue.filiere_id, ue.niveau_id, ue.semestre)
             if key not in ues_par_filiere_niveau:
                 ues_par_filiere_niveau[key] = []
             ues_par_filiere_niveau[key].append(ue)
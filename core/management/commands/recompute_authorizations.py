@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import AnneeAcademique, Etudiant, Filiere
+from core.services import InscriptionService
+
+class Command(BaseCommand):
+    help = 'Recalcule les autorisations d\'examen (étudiant actif et paiement réglé) en masse'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--annee',
+            type=str,
+            help='Code de l\'année académique (défaut: année active)',
+        )
+        parser.add_argument(
+            '--filiere',
+            type=str,
+            help='Code de la filière à traiter (défaut: toutes)',
+        )
+        parser.add_argument(
+            '--matricule',
+            type=str,
+            nargs='+',
+            help='Limiter le recalcul à ces matricules',
+        )
+
+    def handle(self, *args, **options):
+        if options['annee']:
+            annee_academique = AnneeAcademique.objects.filter(code=options['annee']).first()
+        else:
+            annee_academique = AnneeAcademique.objects.filter(active=True).first()
+        if annee_academique is None:
+            raise CommandError(f"Année académique introuvable: {options['annee'] or 'aucune année active'}")
+
+        filiere = None
+        if options['filiere']:
+            try:
+                filiere = Filiere.objects.get(code=options['filiere'])
+            except Filiere.DoesNotExist:
+                raise CommandError(f"Filière inconnue: {options['filiere']}")
+
+        etudiants = None
+        if options['matricule']:
+            etudiants = Etudiant.objects.filter(matricule__in=options['matricule'])
+
+        resultat = InscriptionService.recompute_authorizations(
+            annee_academique, filiere=filiere, etudiants=etudiants
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"🔐 Autorisations d'examen {annee_academique}"))
+        self.stdout.write(f"  - Inscriptions autorisées: {resultat['autorisees']}")
+        self.stdout.write(f"  - Autorisations retirées: {resultat['revoquees']}")
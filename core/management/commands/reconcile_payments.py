@@ -0,0 +1,70 @@
+import os
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from core.models import AnneeAcademique
+from core.services import ReconciliationService
+
+class Command(BaseCommand):
+    help = 'Rapproche un relevé bancaire (CSV ou XLSX) avec les paiements des étudiants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', type=str, help='Relevé bancaire (.csv ou .xlsx)')
+        parser.add_argument(
+            '--annee',
+            type=str,
+            help='Code de l\'année académique (défaut: année active)',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Remplacer les montants enregistrés par le total du relevé (peut les diminuer)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Affiche le résultat du rapprochement sans rien enregistrer',
+        )
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        if not os.path.exists(chemin):
+            raise CommandError(f"Fichier non trouvé: {chemin}")
+
+        annee_academique = None
+        if options['annee']:
+            try:
+                annee_academique = AnneeAcademique.objects.get(code=options['annee'])
+            except AnneeAcademique.DoesNotExist:
+                raise CommandError(f"Année académique inconnue: {options['annee']}")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('⚠️  Mode dry-run: Aucun changement ne sera effectué'))
+
+        try:
+            with open(chemin, 'rb') as fichier:
+                resultat = ReconciliationService.reconcile(
+                    fichier,
+                    os.path.basename(chemin),
+                    annee_academique=annee_academique,
+                    remplacer=options['replace'],
+                    dry_run=options['dry_run'],
+                )
+        except ValidationError as e:
+            raise CommandError('; '.join(e.messages))
+
+        self.stdout.write(self.style.SUCCESS(f"🏦 Rapprochement {resultat['annee_academique']}"))
+        self.stdout.write(f"  - Lignes du relevé: {resultat['lignes']}")
+        self.stdout.write(f"  - Lignes rapprochées: {resultat['rapprochees']} ({resultat['etudiants']} étudiants)")
+        self.stdout.write(f"  - Virements déjà importés: {resultat['deja_importees']}")
+        self.stdout.write(f"  - Paiements créés: {resultat['crees']}")
+        self.stdout.write(f"  - Paiements modifiés: {resultat['modifies']}")
+        self.stdout.write(f"  - Paiements inchangés: {resultat['inchanges']}")
+        self.stdout.write(f"  - Nouveaux paiements réglés: {resultat['devenus_regles']}")
+        if resultat['diminues']:
+            self.stdout.write(self.style.WARNING(f"  ⚠️  Montants diminués: {resultat['diminues']}"))
+        if 'autorisees' in resultat:
+            self.stdout.write(f"  - Inscriptions autorisées: {resultat['autorisees']}")
+            self.stdout.write(f"  - Autorisations retirées: {resultat['revoquees']}")
+
+        for ligne in resultat['non_rapprochees']:
+            self.stdout.write(self.style.WARNING(f"  ⚠️  Ligne {ligne['ligne']}: {ligne['motif']}"))
@@ -1,7 +1,15 @@
 # core/management/commands/reset_student_passwords.py
+import hashlib
+import hmac
+import json
+import os
+import time
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import transaction
 from core.models import Etudiant
+from core.services import PasswordHashService
 
 class Command(BaseCommand):
     help = 'Réinitialise les mots de passe de tous les étudiants à "SGE1234"'
@@ -18,10 +26,67 @@ class Command(BaseCommand):
             action='store_true',
             help='Affiche ce qui serait modifié sans effectuer les changements'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.PASSWORD_HASH_WORKERS,
+            help='Nombre de processus de hachage (défaut: PASSWORD_HASH_WORKERS)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.PASSWORD_BULK_CHUNK_SIZE,
+            help='Nombre de comptes hachés puis écrits par lot'
+        )
+        parser.add_argument(
+            '--salt-batch',
+            type=int,
+            default=1,
+            help='Nombre de comptes partageant un même hachage (défaut: 1, un sel par compte)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            default='.reset_student_passwords.checkpoint',
+            help='Fichier de reprise (dernier compte traité et empreinte du mot de passe), supprimé en fin de traitement'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignorer le fichier de reprise et tout retraiter'
+        )
+    
+    def empreinte(self, password, options):
+        """Empreinte du mot de passe cible et des options (HMAC : le mot de passe n'est pas écrit sur disque)"""
+        parametres = json.dumps({'password': password, 'salt_batch': options['salt_batch']}, sort_keys=True)
+        return hmac.new(settings.SECRET_KEY.encode(), parametres.encode(), hashlib.sha256).hexdigest()
+    
+    def load_checkpoint(self, checkpoint_path, empreinte):
+        """Dernier compte traité, si la reprise concerne bien le même mot de passe"""
+        if not os.path.exists(checkpoint_path):
+            return 0
+        try:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except ValueError:
+            checkpoint = {}
+        if not isinstance(checkpoint, dict) or checkpoint.get('empreinte') != empreinte:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {checkpoint_path} concerne un autre mot de passe ou d'autres options : "
+                f"réinitialisation reprise depuis le début"
+            ))
+            return 0
+        return int(checkpoint.get('dernier_id') or 0)
+    
+    def save_checkpoint(self, checkpoint_path, empreinte, dernier_id):
+        with open(checkpoint_path, 'w') as f:
+            json.dump({'empreinte': empreinte, 'dernier_id': dernier_id}, f)
     
     def handle(self, *args, **options):
         password = options['password']
         dry_run = options['dry_run']
+        checkpoint = options['checkpoint']
+        chunk_size = max(1, options['chunk_size'])
         
         self.stdout.write(self.style.SUCCESS('🔐 Réinitialisation des mots de passe étudiants...'))
         self.stdout.write(f"Nouveau mot de passe: {password}")
@@ -39,27 +104,52 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("⚠️  Aucun étudiant avec compte utilisateur trouvé"))
             return
         
+        # Reprise après interruption : les comptes sont traités par id croissant
+        empreinte = self.empreinte(password, options)
+        dernier_id = 0
+        if not options['restart']:
+            dernier_id = self.load_checkpoint(checkpoint, empreinte)
+            if dernier_id:
+                self.stdout.write(self.style.WARNING(f"↻ Reprise après le compte #{dernier_id} ({checkpoint})"))
+        
+        user_ids = list(
+            etudiants.filter(user_id__gt=dernier_id).order_by('user_id').values_list('user_id', flat=True)
+        )
+        deja_traites = total - len(user_ids)
         updated_count = 0
+        debut = time.monotonic()
         
-        for i, etudiant in enumerate(etudiants, 1):
-            try:
-                user = etudiant.user
-                
-                # Afficher les informations
-                self.stdout.write(f"[{i}/{total}] {etudiant.matricule} -> {user.username}")
-                
-                if not dry_run:
-                    # Réinitialiser le mot de passe
-                    user.set_password(password)
-                    user.save()
-                    updated_count += 1
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"❌ Erreur pour {etudiant.matricule}: {e}"))
+        for i in range(0, len(user_ids), chunk_size):
+            lot = user_ids[i:i + chunk_size]
+            
+            if dry_run:
+                updated_count += len(lot)
+                continue
+            
+            hachages = PasswordHashService.hash_passwords(
+                [password] * len(lot), workers=options['workers'], salt_batch=options['salt_batch']
+            )
+            users = [User(pk=user_id, password=hachage) for user_id, hachage in zip(lot, hachages)]
+            
+            with transaction.atomic():
+                User.objects.bulk_update(users, ['password'])
+            
+            self.save_checkpoint(checkpoint, empreinte, lot[-1])
+            
+            updated_count += len(lot)
+            traites = deja_traites + updated_count
+            ecoule = time.monotonic() - debut
+            restant = ecoule / updated_count * (total - traites)
+            self.stdout.write(
+                f"[{traites}/{total}] lot écrit jusqu'au compte #{lot[-1]} "
+                f"({ecoule:.0f}s écoulées, ~{restant:.0f}s restantes)"
+            )
         
         if dry_run:
-            self.stdout.write(self.style.SUCCESS(f'\n✅ {total} mots de passe seraient mis à jour vers "{password}"'))
+            self.stdout.write(self.style.SUCCESS(f'\n✅ {updated_count} mots de passe seraient mis à jour vers "{password}"'))
         else:
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
             self.stdout.write(self.style.SUCCESS(f'\n✅ {updated_count} mots de passe ont été mis à jour vers "{password}"'))
         
         # Afficher quelques exemples de connexion
@@ -1,5 +1,14 @@
 import time
 import json
+import os
+import queue
+import random
+import threading
+import atexit
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from collections import Counter
 from django.utils.deprecation import MiddlewareMixin
 from django.utils import timezone
 from django.contrib.auth.models import AnonymousUser
@@ -13,6 +22,83 @@ from django.contrib import messages
 
 logger = logging.getLogger('audit')
 
+
+class AuditLogBuffer:
+    """
+    File d'attente en mémoire des entrées d'audit, écrites par lots.
+    
+    Un thread d'arrière-plan (un par processus) vide la file toutes les
+    AUDIT_FLUSH_INTERVAL secondes, ou dès que AUDIT_BATCH_SIZE entrées sont
+    en attente, avec un seul bulk_create. Le thread de la requête ne fait
+    jamais d'écriture en base.
+    """
+    
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+    
+    def _ensure_worker(self):
+        # Un thread par processus (gunicorn fork les workers après l'import)
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=settings.AUDIT_QUEUE_MAX_SIZE)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+    
+    def put(self, entry, message=None):
+        """Mettre une entrée en attente (sans bloquer la requête)"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((entry, message))
+        except queue.Full:
+            logger.warning("File d'audit pleine, entrée ignorée : %s", entry.action)
+            return
+        if self._queue.qsize() >= settings.AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+    
+    def flush(self):
+        """Écrire toutes les entrées en attente"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        
+        lot = []
+        while True:
+            try:
+                lot.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not lot:
+            return
+        
+        close_old_connections()
+        try:
+            for debut in range(0, len(lot), settings.AUDIT_BATCH_SIZE):
+                AuditLog.objects.bulk_create([entry for entry, _ in lot[debut:debut + settings.AUDIT_BATCH_SIZE]])
+        except Exception as e:
+            logger.error(f"Erreur d'écriture du lot d'audit ({len(lot)} entrées): {str(e)}")
+        
+        for _, message in lot:
+            if message:
+                logger.info(message)
+
+
+audit_buffer = AuditLogBuffer()
+atexit.register(audit_buffer.flush)
+
+
 class AuditMiddleware(MiddlewareMixin):
     """Middleware pour l'audit des requêtes"""
     
@@ -31,11 +117,41 @@ class AuditMiddleware(MiddlewareMixin):
         duration = end_time - start_time
         
         # Enregistrer l'audit pour certaines requêtes
-        if self.should_log_request(request, response):
+        if self.should_log_request(request, response) and self.is_sampled(request):
             self.log_request(request, response, duration)
         
         return response
     
+    def is_sampled(self, request):
+        """
+        Échantillonnage par préfixe de chemin (AUDIT_SAMPLING_RATES, préfixe le
+        plus long). Les requêtes qui modifient des données sont toujours gardées.
+        """
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+        
+        taux = 1.0
+        longueur = -1
+        for prefixe, valeur in settings.AUDIT_SAMPLING_RATES.items():
+            if request.path.startswith(prefixe) and len(prefixe) > longueur:
+                taux, longueur = valeur, len(prefixe)
+        return taux >= 1 or random.random() < taux
+    
+    def get_request_body(self, request):
+        """Corps JSON de la requête, si sa taille reste sous AUDIT_MAX_BODY_SIZE"""
+        if 'json' not in request.META.get('CONTENT_TYPE', ''):
+            return None
+        try:
+            taille = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return None
+        if not taille:
+            return None
+        if taille > settings.AUDIT_MAX_BODY_SIZE:
+            return {'_tronque': True, '_taille': taille}
+        body = json.loads(request.body.decode('utf-8', errors='ignore'))
+        return self.sanitize_body(body)
+    
     def should_log_request(self, request, response):
         """Déterminer si la requête doit être journalisée"""
         # Ne pas logger les requêtes statiques
@@ -79,17 +195,19 @@ class AuditMiddleware(MiddlewareMixin):
             if action_type in ['scan', 'paiement', 'examen']:
                 try:
                     # Pour les requêtes POST avec JSON
-                    if request.method in ['POST', 'PUT', 'PATCH'] and request.body:
-                        body = json.loads(request.body.decode('utf-8', errors='ignore'))
+                    if request.method in ['POST', 'PUT', 'PATCH']:
                         # Ne pas logger les mots de passe ou données sensibles
-                        sanitized_body = self.sanitize_body(body)
-                        details['request_body'] = sanitized_body
-                except:
+                        body = self.get_request_body(request)
+                        if body is not None:
+                            details['request_body'] = body
+                except Exception:
                     pass
             
-            # Créer l'entrée d'audit
-            AuditLog.objects.create(
-                utilisateur=user,
+            # L'écriture est différée : l'heure réelle de la requête est conservée
+            details['requested_at'] = timezone.now().isoformat()
+            
+            entry = AuditLog(
+                utilisateur_id=user.pk if user else None,
                 action_type=action_type,
                 action=f"{request.method} {request.path}",
                 details=details,
@@ -98,7 +216,7 @@ class AuditMiddleware(MiddlewareMixin):
             )
             
             # Journaliser également dans le fichier log
-            logger.info(
+            message = (
                 f"Audit - User: {user.username if user else 'Anonymous'} - "
                 f"IP: {self.get_client_ip(request)} - "
                 f"Action: {request.method} {request.path} - "
@@ -106,6 +224,12 @@ class AuditMiddleware(MiddlewareMixin):
                 f"Duration: {duration:.3f}s"
             )
             
+            if settings.AUDIT_ASYNC:
+                audit_buffer.put(entry, message)
+            else:
+                entry.save()
+                logger.info(message)
+            
         except Exception as e:
             # Logger l'erreur mais ne pas interrompre le flux
             logger.error(f"Erreur dans AuditMiddleware: {str(e)}")
@@ -192,205 +316,146 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
 
 
 
-class SessionManagementMiddleware:
-    """Middleware pour gérer les sessions utilisateur"""
+class ActivityTrackerMiddleware:
+    """
+    Suivi de l'activité des sessions et déconnexion après inactivité.
+    
+    Avec un cache partagé entre processus (Redis), les horodatages sont
+    conservés dans le cache, par session et par onglet (cookie `tab_id` s'il
+    existe), et la session n'est modifiée qu'une fois, pour lui attribuer un
+    identifiant de suivi stable. Avec un cache local à chaque processus
+    (LocMemCache), un worker ne verrait pas l'activité servie par les autres :
+    l'horodatage est alors gardé dans la session. Dans les deux cas il n'est
+    réécrit qu'une fois par ACTIVITY_UPDATE_INTERVAL secondes.
+    """
+    
+    CACHE_KEY = 'activity:{activity_id}:{tab_id}'
+    SESSION_KEY = 'derniere_activite'
+    CACHES_LOCAUX = (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    )
+    EXEMPT_VIEWS = ('universal_login_view', 'student_login_view')
     
     def __init__(self, get_response):
         self.get_response = get_response
+        self.cache_partage = settings.CACHES['default']['BACKEND'] not in self.CACHES_LOCAUX
     
     def __call__(self, request):
-        # Vérifier si l'utilisateur est authentifié
-        if request.user.is_authenticated:
-            # Vérifier la validité de la session
-            session_key = request.session.session_key
-            
-            # Mettre à jour le timestamp de dernière activité
-            request.session['last_activity'] = str(timezone.now())
-            
-            # Vérifier si la session est expirée (optionnel)
-            if 'last_activity' in request.session:
-                last_activity_str = request.session['last_activity']
-                try:
-                    last_activity = timezone.datetime.fromisoformat(last_activity_str)
-                    timeout_duration = timezone.timedelta(minutes=30)
-                    
-                    if timezone.now() - last_activity > timeout_duration:
-                        # Session expirée - déconnecter l'utilisateur
-                        user = request.user
-                        logout(request)
-                        
-                        # Log l'action
-                        AuditLog.objects.create(
-                            utilisateur=user,
-                            action_type='system',
-                            action='Session expirée - Déconnexion automatique',
-                            details={'session_key': session_key},
-                            ip=request.META.get('REMOTE_ADDR')
-                        )
-                        
-                        messages.info(request, "Votre session a expiré. Veuillez vous reconnecter.")
-                        return redirect('login')
-                except:
-                    pass
-        
-        response = self.get_response(request)
-        return response
+        return self.get_response(request)
     
-
-
-
-
-
-class MultiTabSessionMiddleware:
-    """
-    Middleware pour gérer plusieurs sessions simultanées dans différents onglets
-    """
+    def get_cache_key(self, request):
+        activity_id = request.session.get('activity_id')
+        if not activity_id:
+            # Seule écriture de session : identifiant stable (la clé d'une
+            # session signed_cookies change à chaque modification)
+            activity_id = get_random_string(16)
+            request.session['activity_id'] = activity_id
+        tab_id = request.COOKIES.get('tab_id') or 'default'
+        return self.CACHE_KEY.format(activity_id=activity_id, tab_id=tab_id[:64])
     
-    def __init__(self, get_response):
-        self.get_response = get_response
+    def get_last_activity(self, request):
+        if self.cache_partage:
+            return cache.get(self.get_cache_key(request))
+        return request.session.get(self.SESSION_KEY)
     
-    def __call__(self, request):
-        # Vérifier le cookie d'onglet
-        tab_id = request.COOKIES.get('tab_id')
-        
-        if tab_id:
-            request.tab_id = tab_id
-            
-            # Si l'utilisateur est authentifié, vérifier la cohérence
-            if request.user.is_authenticated:
-                session_tab_id = request.session.get('tab_id')
-                
-                # Si le tab_id de la session ne correspond pas au cookie
-                if session_tab_id and session_tab_id != tab_id:
-                    # Mettre à jour le tab_id dans la session
-                    request.session['tab_id'] = tab_id
-        
-        # Traiter la requête
-        response = self.get_response(request)
-        
-        # Mettre à jour le timestamp d'activité
-        if request.user.is_authenticated and hasattr(request, 'tab_id'):
-            # Initialiser last_activity comme dictionnaire si ce n'est pas déjà le cas
-            if 'last_activity' not in request.session:
-                request.session['last_activity'] = {}
-            elif isinstance(request.session['last_activity'], str):
-                # Si last_activity est une chaîne, la convertir en dictionnaire
-                try:
-                    request.session['last_activity'] = json.loads(request.session['last_activity'])
-                except (json.JSONDecodeError, TypeError):
-                    request.session['last_activity'] = {}
-            
-            # Mettre à jour le timestamp pour cet onglet
-            tab_id = getattr(request, 'tab_id', None)
-            if tab_id:
-                request.session['last_activity'][tab_id] = timezone.now().isoformat()
-                request.session.modified = True
-        
-        return response
+    def set_last_activity(self, request, maintenant):
+        if self.cache_partage:
+            cache.set(self.get_cache_key(request), maintenant, settings.SESSION_COOKIE_AGE)
+        else:
+            request.session[self.SESSION_KEY] = int(maintenant)
     
     def process_view(self, request, view_func, view_args, view_kwargs):
-        """Vérifier les sessions avant d'exécuter la vue"""
-        # Ignorer pour les vues de login
-        if view_func.__name__ in ['universal_login_view', 'student_login_view']:
+        if not request.user.is_authenticated:
             return None
-        
-        # Ignorer pour la vue logout
-        if request.path.startswith('/logout'):
+        if view_func.__name__ in self.EXEMPT_VIEWS or request.path.startswith('/logout'):
             return None
         
-        # Vérifier l'expiration de session pour cet onglet
-        if request.user.is_authenticated and hasattr(request, 'tab_id'):
-            tab_id = request.tab_id
+        maintenant = time.time()
+        derniere_activite = self.get_last_activity(request)
+        
+        if derniere_activite is not None and maintenant - derniere_activite > settings.SESSION_IDLE_TIMEOUT:
+            # Session inactive trop longtemps : déconnecter l'utilisateur
+            user = request.user
+            if self.cache_partage:
+                cache.delete(self.get_cache_key(request))
+            logout(request)
             
-            # Récupérer last_activity en s'assurant que c'est un dictionnaire
-            last_activity_data = request.session.get('last_activity')
-            if isinstance(last_activity_data, str):
-                try:
-                    last_activity_data = json.loads(last_activity_data)
-                except (json.JSONDecodeError, TypeError):
-                    last_activity_data = {}
+            AuditLog.objects.create(
+                utilisateur=user,
+                action_type='system',
+                action='Session expirée - Déconnexion automatique',
+                details={'inactivite_secondes': int(maintenant - derniere_activite)},
+                ip=request.META.get('REMOTE_ADDR')
+            )
             
-            if last_activity_data and isinstance(last_activity_data, dict):
-                last_activity_str = last_activity_data.get(tab_id)
-                
-                if last_activity_str:
-                    try:
-                        last_active = timezone.datetime.fromisoformat(last_activity_str)
-                        timeout = timezone.timedelta(hours=2)  # 2 heures d'inactivité
-                        
-                        if timezone.now() - last_active > timeout:
-                            # Session expirée pour cet onglet
-                            logout(request)
-                            from django.contrib import messages
-                            messages.info(request, "Votre session a expiré en raison d'une inactivité prolongée.")
-                            from django.shortcuts import redirect
-                            return redirect('login')
-                    except (ValueError, TypeError):
-                        # En cas d'erreur de parsing, on ignore
-                        pass
+            messages.info(request, "Votre session a expiré en raison d'une inactivité prolongée.")
+            return redirect('login')
         
+        # Mise à jour grossière : au plus une écriture par intervalle
+        if derniere_activite is None or maintenant - derniere_activite >= settings.ACTIVITY_UPDATE_INTERVAL:
+            self.set_last_activity(request, maintenant)
+        
+        request.last_activity = derniere_activite or maintenant
         return None
 
 
-
-class TabSpecificSessionMiddleware:
+class ProfilingMiddleware:
     """
-    Crée des sessions spécifiques à chaque onglet en ajoutant un suffixe
-    basé sur l'ID d'onglet au cookie de session
+    Profilage des requêtes (nombre de requêtes SQL, temps base de données,
+    requêtes dupliquées, temps Python, vue appelée).
+    
+    Actif pour toutes les requêtes si PROFILING_ENABLED (avec échantillonnage
+    PROFILING_SAMPLE_RATE), ou pour un membre du staff qui envoie l'en-tête
+    `X-Profile: 1`. Les résultats sont agrégés par ProfilingService et
+    consultables dans l'admin (/admin/profilage/).
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
     
+    def is_enabled(self, request):
+        if request.META.get('HTTP_X_PROFILE') == '1':
+            return request.user.is_staff
+        if settings.PROFILING_ENABLED:
+            return random.random() < settings.PROFILING_SAMPLE_RATE
+        return False
+    
     def __call__(self, request):
-        # Lire l'ID d'onglet depuis le cookie ou l'en-tête
-        tab_id = self.get_tab_id(request)
+        if request.path.startswith(('/static/', '/media/')) or not self.is_enabled(request):
+            return self.get_response(request)
         
-        if tab_id:
-            # Modifier le nom du cookie de session pour cet onglet
-            original_session_key = request.session.session_key
-            
-            # Si c'est une nouvelle session ou un nouvel onglet
-            if not original_session_key or not request.session.get('tab_bound'):
-                # Générer une nouvelle clé de session pour cet onglet
-                request.session.cycle_key()
-                request.session['tab_bound'] = True
-                request.session['tab_id'] = tab_id
-                request.session['created_at'] = timezone.now().isoformat()
+        from .services import ProfilingService
+        requetes = []
         
-        response = self.get_response(request)
+        def mesurer(execute, sql, params, many, context):
+            debut = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                requetes.append((sql, time.perf_counter() - debut))
         
-        # Nettoyer les anciennes sessions
-        self.cleanup_old_tabs(request)
+        debut = time.perf_counter()
+        with connection.execute_wrapper(mesurer):
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
         
-        return response
-    
-    def get_tab_id(self, request):
-        """Obtenir ou générer un ID d'onglet"""
-        tab_id = request.COOKIES.get('tab_id')
+        db_time = sum(temps for _, temps in requetes)
+        empreintes = Counter(ProfilingService.fingerprint(sql) for sql, _ in requetes)
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name or match._func_path) if match else ''
         
-        if not tab_id:
-            # Générer un ID basé sur le timestamp et un random
-            import uuid
-            tab_id = f"tab_{int(time.time())}_{uuid.uuid4().hex[:8]}"
-            request.new_tab = True
-        else:
-            request.new_tab = False
+        try:
+            ProfilingService.record(f"{request.method} {match.route if match else request.path}", {
+                'view_name': view_name,
+                'queries': len(requetes),
+                'db_time': db_time,
+                'python_time': max(duree - db_time, 0),
+                'duplicates': {sql: n for sql, n in empreintes.items() if n > 1},
+            })
+        except Exception as e:
+            logger.error(f"Erreur dans ProfilingMiddleware: {str(e)}")
         
-        return tab_id
-    
-    def cleanup_old_tabs(self, request):
-        """Nettoyer les données de session des onglets inactifs"""
-        if 'tab_sessions' in request.session:
-            # Garder seulement les sessions actives des dernières 24h
-            twenty_four_hours_ago = timezone.now() - timezone.timedelta(hours=24)
-            
-            active_tabs = {}
-            for tab_id, tab_data in request.session['tab_sessions'].items():
-                last_activity = timezone.datetime.fromisoformat(tab_data['last_activity'])
-                if last_activity > twenty_four_hours_ago:
-                    active_tabs[tab_id] = tab_data
-            
-            request.session['tab_sessions'] = active_tabs
-
-
+        response['X-Profile-Queries'] = str(len(requetes))
+        response['X-Profile-DB-Time'] = f"{db_time * 1000:.1f}ms"
+        return response
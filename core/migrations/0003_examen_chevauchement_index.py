@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 06:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_etudiant_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='examen',
+            index=models.Index(fields=['salle', 'date', 'heure_debut', 'heure_fin'], name='core_examen_salle_i_f8b7a5_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-19 06:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_examen_chevauchement_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepartitionSalle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordre', models.PositiveSmallIntegerField(default=1)),
+                ('etudiants', models.JSONField(blank=True, default=list)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('examen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='repartitions', to='core.examen')),
+                ('salle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='repartitions', to='core.salle')),
+            ],
+            options={
+                'verbose_name': 'Répartition en salle',
+                'verbose_name_plural': 'Répartitions en salle',
+                'ordering': ['examen', 'ordre'],
+                'unique_together': {('examen', 'salle')},
+            },
+        ),
+    ]
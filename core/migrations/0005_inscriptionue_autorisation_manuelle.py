@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_repartitionsalle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inscriptionue',
+            name='autorisation_manuelle',
+            field=models.BooleanField(default=False, help_text='Autorisation fixée à la main : le recalcul automatique ne la modifie pas'),
+        ),
+    ]
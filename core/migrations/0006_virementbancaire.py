@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_inscriptionue_autorisation_manuelle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VirementBancaire',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100, unique=True)),
+                ('montant', models.IntegerField()),
+                ('date_virement', models.DateTimeField(blank=True, null=True)),
+                ('fichier', models.CharField(blank=True, max_length=255)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('paiement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='virements', to='core.paiement')),
+            ],
+            options={
+                'verbose_name': 'Virement bancaire',
+                'verbose_name_plural': 'Virements bancaires',
+                'ordering': ['-date_creation'],
+            },
+        ),
+    ]
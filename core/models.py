@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -237,6 +238,35 @@ class Paiement(models.Model):
         return f"{self.etudiant} - {self.annee_academique} - {'Réglé' if self.est_regle else 'Non réglé'}"
 
 
+# ---------------------------------------------------------
+# 6 bis. Virement bancaire rapproché
+# ---------------------------------------------------------
+class VirementBancaire(models.Model):
+    """
+    Ligne de relevé bancaire déjà portée sur un paiement.
+    
+    `reference` est l'identifiant de l'opération fourni par la banque, ou à
+    défaut une empreinte de la ligne : réimporter un relevé, ou deux relevés
+    qui se recouvrent, ne compte jamais deux fois le même virement.
+    """
+    paiement = models.ForeignKey(Paiement, on_delete=models.CASCADE, related_name='virements')
+    reference = models.CharField(max_length=100, unique=True)
+    montant = models.IntegerField()
+    date_virement = models.DateTimeField(null=True, blank=True)
+    fichier = models.CharField(max_length=255, blank=True)
+    
+    # Pour traçabilité
+    date_creation = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.reference} - {self.montant}"
+    
+    class Meta:
+        verbose_name = "Virement bancaire"
+        verbose_name_plural = "Virements bancaires"
+        ordering = ['-date_creation']
+
+
 # ---------------------------------------------------------
 # 7. Inscription UE
 # ---------------------------------------------------------
@@ -247,6 +277,10 @@ class InscriptionUE(models.Model):
     date_inscription = models.DateTimeField(auto_now_add=True)
 
     est_autorise_examen = models.BooleanField(default=False)
+    autorisation_manuelle = models.BooleanField(
+        default=False,
+        help_text="Autorisation fixée à la main : le recalcul automatique ne la modifie pas"
+    )
     
     # Pour traçabilité
     date_creation = models.DateTimeField(auto_now_add=True)
@@ -383,24 +417,36 @@ class Examen(models.Model):
     def clean(self):
         # Vérifier conflit dans la même salle
         if self.salle and self.date and self.heure_debut and self.heure_fin:
-            conflits = Examen.objects.filter(
-                salle=self.salle,
-                date=self.date,
-            ).exclude(pk=self.pk)
-            
-            for conflit in conflits:
-                if (self.heure_debut < conflit.heure_fin and 
-                    self.heure_fin > conflit.heure_debut):
-                    raise ValidationError(
-                        f"Conflit d'horaire avec l'examen {conflit.ue.code} "
-                        f"({conflit.heure_debut}-{conflit.heure_fin})"
-                    )
+            conflit = Examen.chevauchements(
+                self.salle, self.date, self.heure_debut, self.heure_fin, exclude_pk=self.pk
+            ).first()
+            if conflit:
+                raise ValidationError(
+                    f"Conflit d'horaire avec l'examen {conflit.ue.code} "
+                    f"({conflit.heure_debut}-{conflit.heure_fin})"
+                )
         
         # Vérifier heure fin > heure début
         if self.heure_debut and self.heure_fin:
             if self.heure_fin <= self.heure_debut:
                 raise ValidationError("L'heure de fin doit être après l'heure de début")
     
+    @classmethod
+    def chevauchements(cls, salle, date, heure_debut, heure_fin, exclude_pk=None):
+        """
+        Examens qui occupent la salle (salle principale ou salle de leur
+        répartition) sur un horaire qui chevauche [heure_debut, heure_fin[.
+        
+        Le test d'intersection est fait en SQL et s'appuie sur l'index
+        (salle, date, heure_debut, heure_fin).
+        """
+        return cls.objects.filter(
+            Q(salle=salle) | Q(repartitions__salle=salle),
+            date=date,
+            heure_debut__lt=heure_fin,
+            heure_fin__gt=heure_debut,
+        ).exclude(pk=exclude_pk).distinct().select_related('ue').order_by('heure_debut')
+    
     @property
     def duree(self):
         """Retourne la durée de l'examen en minutes, ou None si incomplet."""
@@ -456,6 +502,7 @@ class Examen(models.Model):
         ordering = ['date', 'heure_debut']
         indexes = [
             models.Index(fields=['date', 'salle']),
+            models.Index(fields=['salle', 'date', 'heure_debut', 'heure_fin']),
             models.Index(fields=['ue', 'annee_academique']),
             models.Index(fields=['session', 'type_examen']),
         ]
@@ -466,6 +513,40 @@ class Examen(models.Model):
 
 
 
+# ---------------------------------------------------------
+# 10 bis. Répartition d'un examen entre plusieurs salles
+# ---------------------------------------------------------
+class RepartitionSalle(models.Model):
+    """
+    Part d'un examen accueillie dans une salle.
+    
+    `etudiants` liste les ids des étudiants de la salle dans l'ordre des
+    places : l'étudiant en position n occupe la place n + 1. Une ligne par
+    salle suffit, quel que soit l'effectif.
+    """
+    examen = models.ForeignKey(Examen, on_delete=models.CASCADE, related_name='repartitions')
+    salle = models.ForeignKey(Salle, on_delete=models.CASCADE, related_name='repartitions')
+    ordre = models.PositiveSmallIntegerField(default=1)
+    etudiants = models.JSONField(default=list, blank=True)
+    
+    # Pour traçabilité
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
+    
+    @property
+    def nombre_places(self):
+        return len(self.etudiants)
+    
+    def __str__(self):
+        return f"{self.examen} - {self.salle.code} ({self.nombre_places} places)"
+    
+    class Meta:
+        unique_together = ("examen", "salle")
+        verbose_name = "Répartition en salle"
+        verbose_name_plural = "Répartitions en salle"
+        ordering = ['examen', 'ordre']
+
+
 # ---------------------------------------------------------
 # 11. Contrôle d'accès
 # ---------------------------------------------------------
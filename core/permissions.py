@@ -1,46 +1,47 @@
 from rest_framework import permissions
 from django.contrib.auth.models import Group
+from .services import RoleService
 
 class IsAdministrateur(permissions.BasePermission):
     """Permission pour les administrateurs"""
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Administrateur').exists() or request.user.is_superuser
+        return request.user.is_superuser or RoleService.has_role(request.user, 'Administrateur')
 
 
 class IsSurveillant(permissions.BasePermission):
     """Permission pour les surveillants"""
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Surveillant').exists()
+        return RoleService.has_role(request.user, 'Surveillant')
 
 
 class IsEnseignant(permissions.BasePermission):
     """Permission pour les enseignants"""
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Enseignant').exists()
+        return RoleService.has_role(request.user, 'Enseignant')
 
 
 class IsResponsableScolarite(permissions.BasePermission):
     """Permission pour les responsables de scolarité"""
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='ResponsableScolarite').exists()
+        return RoleService.has_role(request.user, 'ResponsableScolarite')
 
 
 class CanScanQRCode(permissions.BasePermission):
     """Permission pour scanner les QR codes"""
     def has_permission(self, request, view):
-        return request.user.has_perm('gestion_examen.can_scan_qr')
+        return request.user.has_perm('core.can_scan_qr')
 
 
 class CanManageExams(permissions.BasePermission):
     """Permission pour gérer les examens"""
     def has_permission(self, request, view):
-        return request.user.has_perm('gestion_examen.can_manage_exams')
+        return request.user.has_perm('core.can_manage_exams')
 
 
 class CanProcessJustificatif(permissions.BasePermission):
     """Permission pour traiter les justificatifs"""
     def has_permission(self, request, view):
-        return request.user.has_perm('gestion_examen.can_process_justificatif')
+        return request.user.has_perm('core.can_process_justificatif')
 
 
 class IsOwnerOrAdmin(permissions.BasePermission):
@@ -7,7 +7,7 @@ from .models import (
     Paiement, JustificatifAbsence, UE, Salle, SessionExamen,
     AnneeAcademique, Filiere, Niveau, AuditLog
 )
-from .services import QRCodeService, ExamenService, ReportingService
+from .services import QRCodeService, ExamenService, ReportingService, PlacementService
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -52,7 +52,7 @@ class EtudiantSerializer(serializers.ModelSerializer):
     def get_qr_code(self, obj):
         """Générer le QR code à la volée"""
         request = self.context.get('request')
-        if request and request.user.has_perm('gestion_examen.can_scan_qr'):
+        if request and request.user.has_perm('core.can_scan_qr'):
             return QRCodeService.generate_qr_code(obj)
         return None
     
@@ -91,6 +91,21 @@ class ExamenSerializer(serializers.ModelSerializer):
                     'heure_fin': "L'heure de fin doit être après l'heure de début"
                 })
         
+        # Vérifier qu'aucun examen n'occupe déjà la salle sur ce créneau
+        champs = {
+            champ: data.get(champ, getattr(self.instance, champ, None))
+            for champ in ('salle', 'date', 'heure_debut', 'heure_fin')
+        }
+        if all(champs.values()):
+            conflit = Examen.chevauchements(
+                exclude_pk=self.instance.pk if self.instance else None, **champs
+            ).first()
+            if conflit:
+                raise serializers.ValidationError({
+                    'salle': f"Conflit d'horaire avec l'examen {conflit.ue.code} "
+                             f"({conflit.heure_debut}-{conflit.heure_fin})"
+                })
+        
         return data
 
 
@@ -132,6 +147,41 @@ class ScanSerializer(serializers.Serializer):
         return data
 
 
+class PlanningExamenSerializer(serializers.Serializer):
+    """Serializer pour une ligne d'un planning d'examens proposé"""
+    id = serializers.IntegerField(required=False, help_text="Examen existant replanifié")
+    salle = serializers.IntegerField()
+    date = serializers.DateField()
+    heure_debut = serializers.TimeField()
+    heure_fin = serializers.TimeField()
+    
+    def validate(self, data):
+        """Validation des horaires"""
+        if data['heure_fin'] <= data['heure_debut']:
+            raise serializers.ValidationError({
+                'heure_fin': "L'heure de fin doit être après l'heure de début"
+            })
+        return data
+
+
+class RepartitionSerializer(serializers.Serializer):
+    """Serializer pour les paramètres d'une répartition en salles"""
+    ordre = serializers.ChoiceField(choices=PlacementService.ORDRES, default='matricule')
+    seed = serializers.IntegerField(required=False, allow_null=True)
+    salles = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False,
+        help_text="Salles imposées, dans l'ordre de remplissage"
+    )
+    
+    def validate_salles(self, value):
+        """Toutes les salles imposées doivent exister"""
+        salles = Salle.objects.in_bulk(value)
+        inconnues = [salle_id for salle_id in value if salle_id not in salles]
+        if inconnues:
+            raise serializers.ValidationError(f"Salles inconnues: {', '.join(map(str, inconnues))}")
+        return [salles[salle_id] for salle_id in value]
+
+
 class JustificatifAbsenceSerializer(serializers.ModelSerializer):
     """Serializer pour les justificatifs d'absence"""
     etudiant_matricule = serializers.CharField(source='etudiant.matricule', read_only=True)
@@ -195,6 +245,12 @@ class InscriptionUESerializer(serializers.ModelSerializer):
         model = InscriptionUE
         fields = '__all__'
         read_only_fields = ('date_inscription', 'date_creation', 'date_modification', 'created_by')
+    
+    def validate(self, data):
+        # Une autorisation fixée explicitement n'est plus recalculée
+        if 'est_autorise_examen' in data:
+            data.setdefault('autorisation_manuelle', True)
+        return data
 
 
 class PresenceReportSerializer(serializers.Serializer):
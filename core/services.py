@@ -1,21 +1,103 @@
 from django.utils import timezone
-from django.db import transaction
+from django.db import transaction, connection
 from django.core.exceptions import ValidationError
-from django.db.models import Q, Count
+from django.db.models import Q, F, Count, Max, Func, Exists, OuterRef, Window, RowRange
+from django.db.models.functions import Trim, Upper
 import qrcode
 import io
 from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.contrib.auth.models import User, Group
 from PIL import Image
 import base64
+import hashlib
+import re
 import json
-from datetime import timedelta
+import time
+import secrets
+import string
+import unicodedata
+import csv
+import random
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta, timezone as dt_timezone
 
 from .models import (
     Etudiant, Examen, ControleAcces, InscriptionUE,
-    Paiement, JustificatifAbsence, AuditLog, SessionExamen
+    Paiement, JustificatifAbsence, AuditLog, SessionExamen, UE, Salle, AnneeAcademique,
+    RepartitionSalle, VirementBancaire
 )
 
 
+class RoleService:
+    """
+    Rôles (noms de groupes) d'un utilisateur.
+    
+    Les groupes sont chargés au plus une fois par requête (mémorisés sur
+    l'objet user) et mis en cache entre les requêtes sous une clé versionnée.
+    La version de l'utilisateur est incrémentée par le signal m2m_changed sur
+    User.groups ; la génération globale, quand un groupe est renommé ou
+    supprimé (la cascade n'envoie pas m2m_changed).
+    """
+    
+    CACHE_KEY = 'roles:{user_id}:v{version}:g{generation}'
+    VERSION_KEY = 'roles:version:{user_id}'
+    GENERATION_KEY = 'roles:generation'
+    
+    @classmethod
+    def _get_version(cls, user_id):
+        """(version de l'utilisateur, génération globale), lues en un aller-retour"""
+        version_key = cls.VERSION_KEY.format(user_id=user_id)
+        valeurs = cache.get_many([version_key, cls.GENERATION_KEY])
+        return valeurs.get(version_key, 0), valeurs.get(cls.GENERATION_KEY, 0)
+    
+    @classmethod
+    def get_roles(cls, user):
+        """Ensemble des noms de groupes de l'utilisateur"""
+        if user is None or not user.is_authenticated:
+            return frozenset()
+        
+        roles = getattr(user, '_roles_cache', None)
+        if roles is None:
+            version, generation = cls._get_version(user.pk)
+            key = cls.CACHE_KEY.format(user_id=user.pk, version=version, generation=generation)
+            roles = cache.get(key)
+            if roles is None:
+                roles = frozenset(user.groups.values_list('name', flat=True))
+                cache.set(key, roles, settings.ROLE_CACHE_TIMEOUT)
+            user._roles_cache = roles
+        return roles
+    
+    @classmethod
+    def has_role(cls, user, *noms):
+        """L'utilisateur appartient-il à l'un des groupes donnés ?"""
+        return not cls.get_roles(user).isdisjoint(noms)
+    
+    @classmethod
+    def invalidate(cls, user_ids):
+        """Changer de version pour les utilisateurs dont les groupes ont changé"""
+        for user_id in user_ids:
+            version_key = cls.VERSION_KEY.format(user_id=user_id)
+            if not cache.add(version_key, 1, None):
+                try:
+                    cache.incr(version_key)
+                except ValueError:
+                    cache.set(version_key, 1, None)
+    
+    @classmethod
+    def invalidate_all(cls):
+        """Changer de génération : rôles de tous les utilisateurs relus en base"""
+        if not cache.add(cls.GENERATION_KEY, 1, None):
+            try:
+                cache.incr(cls.GENERATION_KEY)
+            except ValueError:
+                cache.set(cls.GENERATION_KEY, 1, None)
+
+
 class QRCodeService:
     """Service pour la génération et validation des QR codes"""
     
@@ -156,7 +238,7 @@ class ExamenService:
         queryset = Examen.objects.filter(date=aujourdhui)
         
         # Filtrer par surveillant si c'est un surveillant
-        if user and user.groups.filter(name='Surveillant').exists():
+        if user and RoleService.has_role(user, 'Surveillant'):
             queryset = queryset.filter(surveillant=user)
         
         return queryset.select_related(
@@ -196,19 +278,16 @@ class ExamenService:
     @transaction.atomic
     def creer_examen(data, created_by):
         """Créer un examen avec validation"""
-        # Vérifier les conflits d'horaire
-        conflits = Examen.objects.filter(
-            salle=data['salle'],
-            date=data['date'],
-        ).exclude(pk=data.get('id'))
-        
-        for conflit in conflits:
-            if (data['heure_debut'] < conflit.heure_fin and 
-                data['heure_fin'] > conflit.heure_debut):
-                raise ValidationError(
-                    f"Conflit d'horaire avec l'examen {conflit.ue.code} "
-                    f"({conflit.heure_debut}-{conflit.heure_fin})"
-                )
+        # Vérifier les conflits d'horaire (intersection testée en SQL)
+        conflit = Examen.chevauchements(
+            data['salle'], data['date'], data['heure_debut'], data['heure_fin'],
+            exclude_pk=data.get('id')
+        ).first()
+        if conflit:
+            raise ValidationError(
+                f"Conflit d'horaire avec l'examen {conflit.ue.code} "
+                f"({conflit.heure_debut}-{conflit.heure_fin})"
+            )
         
         # Créer l'examen
         examen = Examen.objects.create(**data)
@@ -229,6 +308,153 @@ class ExamenService:
         )
         
         return examen
+    
+    @staticmethod
+    def salles_reparties(examens):
+        """
+        Salles de la répartition en base de chaque examen : {pk: {salle_id}}.
+        
+        Un examen déplacé perd sa répartition : elle n'est retenue que si la
+        date, l'horaire et la salle de l'examen sont encore ceux de la base.
+        """
+        par_pk = {examen.pk: examen for examen in examens if examen.pk}
+        salles = defaultdict(set)
+        if par_pk:
+            repartitions = RepartitionSalle.objects.filter(examen_id__in=par_pk).values_list(
+                'examen_id', 'salle_id',
+                'examen__date', 'examen__heure_debut', 'examen__heure_fin', 'examen__salle_id',
+            )
+            for examen_id, salle_id, *creneau in repartitions:
+                examen = par_pk[examen_id]
+                if tuple(creneau) == (examen.date, examen.heure_debut, examen.heure_fin, examen.salle_id):
+                    salles[examen_id].add(salle_id)
+        return salles
+    
+    @staticmethod
+    def valider_planning(examens, inclure_existants=True):
+        """
+        Détecter les chevauchements de salle d'un planning complet.
+        
+        Chaque examen (enregistré ou non) occupe sa salle et les salles de sa
+        répartition. Ces occupations sont triées par (salle, date, heure de
+        début) puis balayées une seule fois : un examen qui commence avant la
+        fin la plus tardive des précédents de la même salle et du même jour
+        est en conflit avec celui-ci. Avec `inclure_existants`, les examens
+        déjà en base sur ces salles et ces dates sont chargés en une requête.
+        Retourne la liste des paires (examen du planning, examen en conflit).
+        """
+        planning = [
+            examen for examen in examens
+            if examen.salle_id and examen.date and examen.heure_debut and examen.heure_fin
+        ]
+        proposes = {id(examen) for examen in planning}
+        reparties = ExamenService.salles_reparties(planning)
+        if inclure_existants and planning:
+            salles = {examen.salle_id for examen in planning}.union(*reparties.values())
+            existants = list(Examen.objects.filter(
+                Q(salle_id__in=salles) | Q(repartitions__salle_id__in=salles),
+                date__in={examen.date for examen in planning},
+            ).exclude(
+                pk__in=[examen.pk for examen in planning if examen.pk]
+            ).distinct().select_related('ue', 'salle'))
+            reparties.update(ExamenService.salles_reparties(existants))
+            planning.extend(existants)
+        
+        occupations = sorted(
+            (
+                (salle_id, examen)
+                for examen in planning
+                for salle_id in {examen.salle_id, *reparties.get(examen.pk, ())}
+            ),
+            key=lambda occupation: (
+                occupation[0], occupation[1].date, occupation[1].heure_debut, occupation[1].heure_fin
+            ),
+        )
+        conflits = []
+        signales = set()  # une paire en conflit dans plusieurs salles n'est signalée qu'une fois
+        dernier = None  # (salle, examen) du jour courant qui finit le plus tard
+        for salle_id, examen in occupations:
+            meme_creneau = dernier is not None and (dernier[0], dernier[1].date) == (salle_id, examen.date)
+            if meme_creneau and examen.heure_debut < dernier[1].heure_fin:
+                paire = None
+                if id(examen) in proposes:
+                    paire = (examen, dernier[1])
+                elif id(dernier[1]) in proposes:
+                    paire = (dernier[1], examen)
+                if paire and (id(paire[0]), id(paire[1])) not in signales:
+                    signales.add((id(paire[0]), id(paire[1])))
+                    conflits.append(paire)
+            if not meme_creneau or examen.heure_fin > dernier[1].heure_fin:
+                dernier = (salle_id, examen)
+        return conflits
+
+
+class RosterService:
+    """Liste d'appel d'un examen (inscrits, scans, paiements) en quatre requêtes"""
+    
+    @staticmethod
+    def get_roster(examen, salle=None):
+        """
+        Construire la liste d'appel de l'examen.
+        
+        Retourne un dict avec `etudiants_data` (une entrée par inscrit autorisé,
+        avec sa salle et sa place), `scans` (les contrôles de ces étudiants),
+        `total_inscrits`, `total_presents` et `total_refuses`. Avec `salle`,
+        seule la part de l'examen attendue à cette porte est retenue (voir
+        PlacementService.filter_porte).
+        """
+        places = PlacementService.get_places(examen.pk)
+        
+        inscriptions = InscriptionUE.objects.filter(
+            ue_id=examen.ue_id,
+            annee_academique_id=examen.annee_academique_id,
+            est_autorise_examen=True
+        ).select_related(
+            'etudiant',
+            'etudiant__filiere',
+            'etudiant__niveau'
+        ).order_by('etudiant__nom', 'etudiant__prenom')
+        
+        scans = ControleAcces.objects.filter(examen=examen).select_related('etudiant', 'scanned_by')
+        
+        if salle is not None and places:
+            inscriptions = PlacementService.filter_porte(inscriptions, examen, salle, places)
+            scans = PlacementService.filter_porte(scans, examen, salle, places)
+        
+        scans = list(scans)
+        scans_par_etudiant = {scan.etudiant_id: scan for scan in scans}
+        
+        paiements_regles = set(Paiement.objects.filter(
+            etudiant__inscriptionue__ue_id=examen.ue_id,
+            etudiant__inscriptionue__annee_academique_id=examen.annee_academique_id,
+            annee_academique_id=examen.annee_academique_id,
+            est_regle=True
+        ).values_list('etudiant_id', flat=True))
+        
+        etudiants_data = []
+        for inscription in inscriptions:
+            scan = scans_par_etudiant.get(inscription.etudiant_id)
+            place = places.get(inscription.etudiant_id)
+            etudiants_data.append({
+                'etudiant': inscription.etudiant,
+                'inscription': inscription,
+                'scan': scan,
+                'salle': place[1] if place else None,
+                'place': place[2] if place else None,
+                'sans_place': bool(places) and place is None,
+                'paiement_regle': inscription.etudiant_id in paiements_regles,
+                'present': scan.autorise if scan else False,
+                'autorise': scan.autorise if scan else False,
+                'raison_refus': scan.raison_refus if scan else None,
+            })
+        
+        return {
+            'etudiants_data': etudiants_data,
+            'scans': scans,
+            'total_inscrits': len(etudiants_data),
+            'total_presents': sum(1 for scan in scans if scan.autorise),
+            'total_refuses': sum(1 for scan in scans if not scan.autorise),
+        }
 
 
 class ScanService:
@@ -373,7 +599,8 @@ class ScanService:
                 'date': examen.date,
                 'heure_debut': examen.heure_debut,
                 'heure_fin': examen.heure_fin
-            }
+            },
+            'placement': PlacementService.get_place(examen, etudiant.id),
         }
     
     @staticmethod
@@ -430,7 +657,7 @@ class ScanService:
         queryset = ControleAcces.objects.filter(examen_id=examen_id)
         
         # Si c'est un surveillant, ne voir que ses scans
-        if user.groups.filter(name='Surveillant').exists():
+        if RoleService.has_role(user, 'Surveillant'):
             queryset = queryset.filter(scanned_by=user)
         
         return queryset.select_related(
@@ -510,6 +737,11 @@ class ReportingService:
             
             rapport['presences'].append(presence_data)
         
+        statistiques = rapport['statistiques']
+        statistiques['taux_presence'] = (
+            round((statistiques['total_presents'] / statistiques['total_inscrits'] * 100), 2)
+            if statistiques['total_inscrits'] > 0 else 0
+        )
         return rapport
     
     @staticmethod
@@ -543,4 +775,1764 @@ class ReportingService:
             )
         )
         
-        return stats
\ No newline at end of file
+        return stats
+
+
+class DashboardSnapshotService:
+    """Instantané des statistiques du tableau de bord, partagé entre workers via le cache"""
+    
+    CACHE_KEY = 'dashboard:snapshot:{scope}'
+    LOCK_KEY = 'dashboard:snapshot:{scope}:lock'
+    
+    ICON_MAP = {
+        'scan': 'qrcode',
+        'paiement': 'money-bill-wave',
+        'inscription': 'user-plus',
+        'examen': 'calendar-alt',
+        'justificatif': 'file-medical',
+        'system': 'cog',
+        'connexion': 'sign-in-alt',
+    }
+    
+    @staticmethod
+    def get_interval():
+        """Durée de validité d'un instantané (en secondes)"""
+        return getattr(settings, 'DASHBOARD_SNAPSHOT_INTERVAL', 30)
+    
+    @staticmethod
+    def get_scope(user):
+        """Déterminer la portée de l'instantané selon le rôle"""
+        # Les surveillants ne voient que leurs examens du jour
+        if user and RoleService.has_role(user, 'Surveillant'):
+            return f'surveillant:{user.pk}'
+        return 'global'
+    
+    @classmethod
+    def get_snapshot(cls, user):
+        """Récupérer l'instantané, recalculé au plus une fois par intervalle et par portée"""
+        interval = cls.get_interval()
+        scope = cls.get_scope(user)
+        cache_key = cls.CACHE_KEY.format(scope=scope)
+        lock_key = cls.LOCK_KEY.format(scope=scope)
+        
+        snapshot = cache.get(cache_key)
+        if snapshot and snapshot['expires_at'] > time.time():
+            return snapshot
+        
+        # Un seul worker recalcule, les autres servent l'instantané précédent
+        verrou = cache.add(lock_key, 1, interval)
+        if snapshot and not verrou:
+            return snapshot
+        
+        try:
+            data, examens = cls.compute(user if scope != 'global' else None)
+        finally:
+            if verrou:
+                cache.delete(lock_key)
+        
+        etag = hashlib.md5(
+            json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode('utf-8')
+        ).hexdigest()
+        
+        # Conserver la date de modification si le contenu n'a pas changé
+        if snapshot and snapshot['etag'] == etag:
+            last_modified = snapshot['last_modified']
+        else:
+            last_modified = timezone.now().replace(microsecond=0)
+        
+        snapshot = {
+            'data': data,
+            'examens': examens,
+            'etag': etag,
+            'last_modified': last_modified,
+            'expires_at': time.time() + interval,
+        }
+        cache.set(cache_key, snapshot, interval * 10)
+        return snapshot
+    
+    @classmethod
+    def compute(cls, user=None):
+        """Calculer les statistiques du tableau de bord"""
+        maintenant = timezone.now()
+        aujourdhui = maintenant.date()
+        
+        stats = {
+            'total_etudiants': Etudiant.objects.count(),
+            'examens_aujourdhui': Examen.objects.filter(date=aujourdhui).count(),
+            'scans_aujourdhui': ControleAcces.objects.filter(
+                date_scan__date=aujourdhui
+            ).count(),
+            'examens_en_cours': Examen.objects.filter(
+                date=aujourdhui,
+                heure_debut__lte=maintenant.time(),
+                heure_fin__gte=maintenant.time()
+            ).count(),
+        }
+        
+        examens = list(ExamenService.get_examens_du_jour(user))
+        
+        recent_activity = [
+            {
+                'description': activity.action,
+                'user': activity.utilisateur.get_full_name() if activity.utilisateur else "Système",
+                'timestamp': activity.timestamp,
+                'action_type': activity.action_type,
+                'icon': cls.ICON_MAP.get(activity.action_type, 'info-circle'),
+                'ip': activity.ip,
+            }
+            for activity in AuditLog.objects.select_related('utilisateur').order_by('-timestamp')[:10]
+        ]
+        
+        data = {
+            'stats': stats,
+            'examens_du_jour': [
+                {
+                    'id': examen.id,
+                    'ue': examen.ue.code,
+                    'salle': examen.salle.code if examen.salle else None,
+                    'heure_debut': examen.heure_debut,
+                    'heure_fin': examen.heure_fin,
+                    'statut': examen.statut,
+                }
+                for examen in examens
+            ],
+            'recent_activity': recent_activity,
+        }
+        return data, examens
+
+
+class ScanEventService:
+    """
+    Diffusion des scans d'un examen aux interfaces de scan (journal dans le cache).
+    
+    Chaque scan reçoit une position par cache.incr (atomique, sans verrou) et
+    est stocké sous sa propre clé ; les interfaces relisent les positions
+    postérieures à leur curseur « jeton-position ». Le jeton change quand le
+    compteur disparaît du cache : les anciens curseurs provoquent un 'reset'.
+    """
+    
+    JETON_KEY = 'scan_events:{examen_id}'
+    POSITION_KEY = 'scan_events:{examen_id}:position'
+    EVENT_KEY = 'scan_events:{examen_id}:{jeton}:{position}'
+    MAX_EVENTS = 100
+    JOURNAL_TIMEOUT = 6 * 3600
+    # Délai au-delà duquel une position sans événement est abandonnée
+    # (publication interrompue entre incr et set)
+    PUBLICATION_TIMEOUT = 5
+    
+    @staticmethod
+    def serialize(controle):
+        """Représentation d'un contrôle d'accès (mêmes champs que ControleAccesSerializer)"""
+        etudiant = controle.etudiant
+        return {
+            'id': controle.id,
+            'date_scan': controle.date_scan.isoformat() if controle.date_scan else None,
+            'etudiant_matricule': etudiant.matricule if etudiant else None,
+            'etudiant_nom': etudiant.nom if etudiant else None,
+            'etudiant_prenom': etudiant.prenom if etudiant else None,
+            'examen_ue': controle.examen.ue.code,
+            'autorise': controle.autorise,
+            'scan_method': controle.scan_method,
+            'raison_refus': controle.raison_refus,
+        }
+    
+    @staticmethod
+    def format_cursor(jeton, position):
+        return f"{jeton}-{position}"
+    
+    @staticmethod
+    def parse_cursor(value):
+        """Curseur « jeton-position » (None si absent ou mal formé)"""
+        jeton, _, position = (value or '').partition('-')
+        if not jeton or not position.isdigit():
+            return None
+        return jeton, int(position)
+    
+    @classmethod
+    def get_journal(cls, examen_id):
+        """(jeton, position) du journal de l'examen, créé vide s'il est absent"""
+        jeton_key = cls.JETON_KEY.format(examen_id=examen_id)
+        position_key = cls.POSITION_KEY.format(examen_id=examen_id)
+        valeurs = cache.get_many([jeton_key, position_key])
+        if jeton_key in valeurs and position_key in valeurs:
+            return valeurs[jeton_key], valeurs[position_key]
+        
+        # Journal absent ou incomplet (éviction) : un seul processus le recrée
+        if position_key in valeurs:
+            cache.delete(position_key)
+        if cache.add(position_key, 0, cls.JOURNAL_TIMEOUT):
+            cache.set(jeton_key, secrets.token_hex(4), cls.JOURNAL_TIMEOUT)
+        valeurs = cache.get_many([jeton_key, position_key])
+        return valeurs.get(jeton_key, ''), valeurs.get(position_key, 0)
+    
+    @classmethod
+    def publish(cls, controle):
+        """Publier un nouveau scan et les compteurs à jour pour tous les abonnés"""
+        examen_id = controle.examen_id
+        event = {
+            'scan': cls.serialize(controle),
+            'statistiques': ExamenService.get_statistiques_examen(controle.examen),
+            'publie': time.time(),
+        }
+        
+        jeton, _ = cls.get_journal(examen_id)
+        position_key = cls.POSITION_KEY.format(examen_id=examen_id)
+        try:
+            position = cache.incr(position_key)
+        except ValueError:
+            # Compteur expiré entre-temps : nouveau journal
+            jeton, _ = cls.get_journal(examen_id)
+            position = cache.incr(position_key)
+        
+        cache.set(
+            cls.EVENT_KEY.format(examen_id=examen_id, jeton=jeton, position=position),
+            event, cls.JOURNAL_TIMEOUT,
+        )
+        # Le journal ne garde que les MAX_EVENTS derniers scans
+        cache.delete(cls.EVENT_KEY.format(
+            examen_id=examen_id, jeton=jeton, position=position - cls.MAX_EVENTS
+        ))
+        cache.touch(position_key, cls.JOURNAL_TIMEOUT)
+        cache.touch(cls.JETON_KEY.format(examen_id=examen_id), cls.JOURNAL_TIMEOUT)
+    
+    @classmethod
+    def get_cursor(cls, examen_id):
+        """Curseur de la fin du journal de l'examen"""
+        return cls.format_cursor(*cls.get_journal(examen_id))
+    
+    @classmethod
+    def get_events_since(cls, examen_id, cursor):
+        """Scans publiés après le curseur, avec les compteurs les plus récents
+        
+        Si le journal a été perdu ou a déjà écarté des événements postérieurs au
+        curseur, 'reset' demande au client de recharger l'historique depuis l'API.
+        """
+        jeton, position = cls.get_journal(examen_id)
+        curseur = cls.parse_cursor(cursor)
+        
+        if (curseur is None or curseur[0] != jeton
+                or curseur[1] > position or curseur[1] < position - cls.MAX_EVENTS):
+            return {
+                'cursor': cls.format_cursor(jeton, position),
+                'scans': [],
+                'statistiques': None,
+                'reset': True,
+            }
+        
+        positions = range(curseur[1] + 1, position + 1)
+        cles = {
+            p: cls.EVENT_KEY.format(examen_id=examen_id, jeton=jeton, position=p)
+            for p in positions
+        }
+        trouves = cache.get_many(list(cles.values()))
+        
+        # Une position sans événement est une publication en cours (incr fait,
+        # set pas encore) : on s'arrête avant elle pour ne pas la sauter, sauf
+        # si un événement postérieur est déjà ancien (publication interrompue)
+        limite = time.time() - cls.PUBLICATION_TIMEOUT
+        events = []
+        dernier = curseur[1]
+        for p in positions:
+            event = trouves.get(cles[p])
+            if event is None:
+                suivants = (trouves.get(cles[q]) for q in range(p + 1, position + 1))
+                if any(suivant is not None and suivant['publie'] < limite for suivant in suivants):
+                    dernier = p
+                    continue
+                break
+            events.append(event)
+            dernier = p
+        
+        return {
+            'cursor': cls.format_cursor(jeton, dernier),
+            'scans': [event['scan'] for event in events],
+            'statistiques': events[-1]['statistiques'] if events else None,
+            'reset': False,
+        }
+
+
+class CompteursService:
+    """Compteurs globaux de l'application (une seule requête, cache court)"""
+    
+    CACHE_KEY = 'compteurs:globaux'
+    
+    @staticmethod
+    def get_querysets():
+        """Ensembles comptés, dans l'ordre des clés renvoyées"""
+        return {
+            'total_etudiants': Etudiant.objects.all(),
+            'total_ues': UE.objects.all(),
+            'total_examens': Examen.objects.all(),
+            'total_salles': Salle.objects.all(),
+            'paiements_regles': Paiement.objects.filter(est_regle=True),
+            'paiements_en_attente': Paiement.objects.filter(est_regle=False),
+            'justificatifs_en_attente': JustificatifAbsence.objects.filter(statut='en_attente'),
+        }
+    
+    @classmethod
+    def compute(cls):
+        """SELECT (SELECT COUNT(...)), (SELECT COUNT(...)), ... en un aller-retour"""
+        colonnes, params = [], []
+        for nom, queryset in cls.get_querysets().items():
+            sous_requete = queryset.order_by().values(n=Func('pk', function='COUNT'))
+            sql, sql_params = sous_requete.query.sql_with_params()
+            colonnes.append(f'({sql}) AS {connection.ops.quote_name(nom)}')
+            params.extend(sql_params)
+        
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT ' + ', '.join(colonnes), params)
+            ligne = cursor.fetchone()
+        
+        return dict(zip(cls.get_querysets().keys(), ligne))
+    
+    @classmethod
+    def get_compteurs(cls):
+        """Compteurs mis en cache pendant OPERATIONS_COUNTERS_TIMEOUT secondes"""
+        compteurs = cache.get(cls.CACHE_KEY)
+        if compteurs is None:
+            compteurs = cls.compute()
+            cache.set(cls.CACHE_KEY, compteurs, settings.OPERATIONS_COUNTERS_TIMEOUT)
+        return compteurs
+
+
+class TimetableService:
+    """
+    Emploi du temps d'examens pré-calculé par étudiant.
+    
+    La liste des examens (avec UE, salle et surveillant) est mise en cache par
+    étudiant et reconstruite après modification d'une inscription, d'un examen,
+    d'une UE ou d'une salle (voir signals.py). Un compteur de génération permet de tout invalider après
+    une mise à jour en masse.
+    """
+    
+    CACHE_KEY = 'timetable:{generation}:{etudiant_id}'
+    GENERATION_KEY = 'timetable:generation'
+    ICAL_SALT = 'core.timetable.ical'
+    
+    @classmethod
+    def _get_generation(cls):
+        generation = cache.get(cls.GENERATION_KEY)
+        if generation is None:
+            generation = 1
+            cache.add(cls.GENERATION_KEY, generation, None)
+        return generation
+    
+    @classmethod
+    def _cache_key(cls, etudiant_id):
+        return cls.CACHE_KEY.format(generation=cls._get_generation(), etudiant_id=etudiant_id)
+    
+    @staticmethod
+    def get_queryset(etudiant):
+        """Examens de l'étudiant : UE inscrite et autorisée pour la même année académique"""
+        inscriptions = InscriptionUE.objects.filter(
+            etudiant=etudiant,
+            ue=OuterRef('ue'),
+            annee_academique=OuterRef('annee_academique'),
+            est_autorise_examen=True
+        )
+        return Examen.objects.filter(Exists(inscriptions))
+    
+    @classmethod
+    def build(cls, etudiant):
+        """Recalculer l'emploi du temps (une requête)"""
+        examens = list(
+            cls.get_queryset(etudiant)
+            .select_related('ue', 'salle', 'surveillant', 'annee_academique')
+            .order_by('date', 'heure_debut')
+        )
+        # Tout ce qui est affiché entre dans l'ETag, y compris l'UE et la salle
+        empreinte = json.dumps(
+            [
+                (e.id, e.date, e.heure_debut, e.heure_fin, e.type_examen, e.date_modification,
+                 e.ue.code, e.ue.intitule, e.salle.code if e.salle else None)
+                for e in examens
+            ],
+            cls=DjangoJSONEncoder
+        )
+        return {
+            'examens': examens,
+            'etag': hashlib.md5(empreinte.encode()).hexdigest(),
+            'last_modified': max((e.date_modification for e in examens), default=None),
+        }
+    
+    @classmethod
+    def get_timetable(cls, etudiant):
+        """Emploi du temps de l'étudiant (une lecture de cache si à jour)"""
+        key = cls._cache_key(etudiant.pk)
+        timetable = cache.get(key)
+        if timetable is None:
+            timetable = cls.build(etudiant)
+            cache.set(key, timetable, settings.TIMETABLE_CACHE_TIMEOUT)
+        return timetable
+    
+    @classmethod
+    def get_examens(cls, etudiant, a_venir=None):
+        """Examens de l'étudiant ; a_venir=True/False pour filtrer sur la date du jour"""
+        examens = cls.get_timetable(etudiant)['examens']
+        if a_venir is None:
+            return list(examens)
+        today = timezone.now().date()
+        if a_venir:
+            return [e for e in examens if e.date >= today]
+        return [e for e in examens if e.date < today]
+    
+    @classmethod
+    def get_examen_ids(cls, etudiant):
+        return [e.id for e in cls.get_timetable(etudiant)['examens']]
+    
+    @classmethod
+    def invalidate(cls, etudiant_ids):
+        """Forcer la reconstruction pour les étudiants donnés"""
+        generation = cls._get_generation()
+        cache.delete_many([
+            cls.CACHE_KEY.format(generation=generation, etudiant_id=etudiant_id)
+            for etudiant_id in etudiant_ids
+        ])
+    
+    @classmethod
+    def invalidate_examen(cls, examen):
+        """Invalider les emplois du temps des étudiants inscrits à l'UE de l'examen"""
+        etudiant_ids = InscriptionUE.objects.filter(
+            ue_id=examen.ue_id,
+            annee_academique_id=examen.annee_academique_id
+        ).values_list('etudiant_id', flat=True)
+        cls.invalidate(list(etudiant_ids))
+    
+    @classmethod
+    def invalidate_all(cls):
+        """Invalider tous les emplois du temps (après une mise à jour en masse)"""
+        try:
+            cache.incr(cls.GENERATION_KEY)
+        except ValueError:
+            cache.set(cls.GENERATION_KEY, 2, None)
+    
+    # ---- Flux iCal ----
+    
+    @classmethod
+    def get_ical_token(cls, etudiant):
+        """Jeton signé identifiant l'étudiant dans l'URL du calendrier"""
+        return signing.dumps(etudiant.pk, salt=cls.ICAL_SALT)
+    
+    @classmethod
+    def get_etudiant_id_from_token(cls, token):
+        try:
+            return signing.loads(token, salt=cls.ICAL_SALT)
+        except signing.BadSignature:
+            return None
+    
+    @staticmethod
+    def _ical_text(value):
+        return (str(value or '').replace('\\', '\\\\').replace(';', '\\;')
+                .replace(',', '\\,').replace('\n', '\\n'))
+    
+    @staticmethod
+    def _ical_datetime(date, heure):
+        moment = timezone.make_aware(datetime.combine(date, heure))
+        return moment.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    
+    @classmethod
+    def to_ical(cls, etudiant, timetable):
+        """Calendrier iCalendar (RFC 5545) des examens de l'étudiant"""
+        maintenant = timezone.now().astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        lignes = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//SGESE//Examens//FR',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            f'X-WR-CALNAME:{cls._ical_text("Examens " + etudiant.matricule)}',
+        ]
+        for examen in timetable['examens']:
+            lignes += [
+                'BEGIN:VEVENT',
+                f'UID:examen-{examen.id}-{etudiant.pk}@sgese',
+                f'DTSTAMP:{maintenant}',
+                f'DTSTART:{cls._ical_datetime(examen.date, examen.heure_debut)}',
+                f'DTEND:{cls._ical_datetime(examen.date, examen.heure_fin)}',
+                f'SUMMARY:{cls._ical_text(f"Examen {examen.ue.code} - {examen.ue.intitule}")}',
+                f'LOCATION:{cls._ical_text(examen.salle.code if examen.salle else "")}',
+                f'DESCRIPTION:{cls._ical_text(examen.get_type_examen_display())}',
+                'END:VEVENT',
+            ]
+        lignes.append('END:VCALENDAR')
+        return '\r\n'.join(lignes) + '\r\n'
+
+
+class ProfilingService:
+    """
+    Agrégation par endpoint des mesures de ProfilingMiddleware.
+    
+    Les compteurs sont conservés dans le cache partagé : les valeurs sont
+    approximatives en cas d'écritures concurrentes, ce qui suffit pour repérer
+    les vues les plus coûteuses.
+    """
+    
+    INDEX_KEY = 'profiling:endpoints'
+    ENDPOINT_KEY = 'profiling:endpoint:{endpoint}'
+    MAX_FINGERPRINTS = 20
+    
+    _LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _LISTES_IN = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+    
+    @classmethod
+    def fingerprint(cls, sql):
+        """Forme normalisée d'une requête (littéraux et listes IN remplacés)"""
+        normalise = cls._LITTERAUX.sub('?', sql)
+        normalise = cls._LISTES_IN.sub('IN (...)', normalise)
+        return ' '.join(normalise.split())
+    
+    @classmethod
+    def record(cls, endpoint, mesures):
+        """Ajouter les mesures d'une requête aux statistiques de l'endpoint"""
+        timeout = settings.PROFILING_REPORT_TIMEOUT
+        key = cls.ENDPOINT_KEY.format(endpoint=hashlib.md5(endpoint.encode()).hexdigest())
+        
+        stats = cache.get(key) or {
+            'endpoint': endpoint,
+            'view_name': mesures['view_name'],
+            'requests': 0,
+            'queries_total': 0,
+            'queries_max': 0,
+            'db_time_total': 0.0,
+            'python_time_total': 0.0,
+            'duplicates_total': 0,
+            'duplicates': {},
+        }
+        stats['requests'] += 1
+        stats['queries_total'] += mesures['queries']
+        stats['queries_max'] = max(stats['queries_max'], mesures['queries'])
+        stats['db_time_total'] += mesures['db_time']
+        stats['python_time_total'] += mesures['python_time']
+        stats['duplicates_total'] += sum(n - 1 for n in mesures['duplicates'].values())
+        
+        for empreinte, nombre in mesures['duplicates'].items():
+            stats['duplicates'][empreinte] = stats['duplicates'].get(empreinte, 0) + nombre
+        if len(stats['duplicates']) > cls.MAX_FINGERPRINTS:
+            stats['duplicates'] = dict(sorted(
+                stats['duplicates'].items(), key=lambda item: item[1], reverse=True
+            )[:cls.MAX_FINGERPRINTS])
+        
+        cache.set(key, stats, timeout)
+        
+        index = cache.get(cls.INDEX_KEY) or []
+        if key not in index:
+            index.append(key)
+            cache.set(cls.INDEX_KEY, index, timeout)
+    
+    @classmethod
+    def get_report(cls, tri='queries_avg'):
+        """Endpoints triés du plus coûteux au moins coûteux"""
+        index = cache.get(cls.INDEX_KEY) or []
+        rapport = []
+        for stats in cache.get_many(index).values():
+            requetes = stats['requests'] or 1
+            rapport.append({
+                'endpoint': stats['endpoint'],
+                'view_name': stats['view_name'],
+                'requests': stats['requests'],
+                'queries_avg': round(stats['queries_total'] / requetes, 1),
+                'queries_max': stats['queries_max'],
+                'db_time_avg_ms': round(stats['db_time_total'] / requetes * 1000, 1),
+                'python_time_avg_ms': round(stats['python_time_total'] / requetes * 1000, 1),
+                'duplicates_avg': round(stats['duplicates_total'] / requetes, 1),
+                'top_duplicates': [
+                    {'sql': sql, 'count': nombre}
+                    for sql, nombre in sorted(stats['duplicates'].items(), key=lambda item: item[1], reverse=True)[:5]
+                ],
+            })
+        rapport.sort(key=lambda ligne: ligne.get(tri, 0), reverse=True)
+        return rapport
+    
+    @classmethod
+    def reset(cls):
+        index = cache.get(cls.INDEX_KEY) or []
+        cache.delete_many(index + [cls.INDEX_KEY])
+
+
+def _initialiser_worker_hachage():
+    """Initialisation d'un processus de hachage (nécessaire si les workers sont lancés en spawn)"""
+    import django
+    django.setup()
+
+
+def _hacher_mot_de_passe(password):
+    from django.contrib.auth.hashers import make_password
+    return make_password(password)
+
+
+class PasswordHashService:
+    """
+    Hachage de mots de passe en masse sur plusieurs processus.
+    
+    PBKDF2 est volontairement lent (plusieurs centaines de millisecondes par
+    hachage) : sur des dizaines de milliers de comptes, le calcul est réparti
+    entre PASSWORD_HASH_WORKERS processus.
+    """
+    
+    @staticmethod
+    def hash_passwords(passwords, workers=None, salt_batch=1):
+        """
+        Hachages des mots de passe, dans le même ordre.
+        
+        Avec salt_batch > 1, un même mot de passe n'est haché qu'une fois
+        pour salt_batch comptes consécutifs (même sel). À réserver à un mot
+        de passe commun déjà connu de tous, par exemple un mot de passe
+        initial à changer : un hachage partagé n'apprend alors rien de plus.
+        """
+        passwords = list(passwords)
+        workers = workers or settings.PASSWORD_HASH_WORKERS
+        
+        # Hachages à calculer : un par (mot de passe, lot de sel)
+        occurrences = {}
+        cles = []
+        for password in passwords:
+            rang = occurrences.get(password, 0)
+            occurrences[password] = rang + 1
+            cles.append((password, rang // max(salt_batch, 1)))
+        uniques = list(dict.fromkeys(cles))
+        
+        if workers == 1 or len(uniques) <= 1:
+            hachages = [_hacher_mot_de_passe(password) for password, _ in uniques]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initialiser_worker_hachage) as pool:
+                chunksize = max(1, len(uniques) // (workers * 4))
+                hachages = list(pool.map(_hacher_mot_de_passe, [p for p, _ in uniques], chunksize=chunksize))
+        
+        par_cle = dict(zip(uniques, hachages))
+        return [par_cle[cle] for cle in cles]
+
+
+class StudentAccountService:
+    """
+    Provisionnement en masse des comptes utilisateurs étudiants.
+    
+    Équivalent ensembliste du signal create_student_user : par lot, une
+    requête pour les comptes existants, un bulk_create des comptes manquants
+    (mots de passe hachés en parallèle), un insert dans la table des groupes
+    et un bulk_update de Etudiant.user.
+    """
+    
+    GROUP_NAME = 'Etudiant'
+    
+    @staticmethod
+    def get_username(etudiant):
+        return f"etu_{etudiant.matricule.lower()}"
+    
+    @staticmethod
+    def get_initial_password(etudiant):
+        """Date de naissance (JJMMAAAA) ou, à défaut, mot de passe aléatoire"""
+        if etudiant.date_naissance:
+            return etudiant.date_naissance.strftime("%d%m%Y")
+        chars = string.ascii_letters + string.digits
+        return ''.join(secrets.choice(chars) for _ in range(8))
+    
+    @classmethod
+    def provision(cls, etudiants, password=None, workers=None, chunk_size=None,
+                  salt_batch=1, progress=None):
+        """
+        Créer les comptes manquants, les ajouter au groupe Etudiant et les
+        rattacher aux étudiants. Retourne les compteurs {created, linked, total}.
+        
+        progress(traites, total) est appelé après chaque lot.
+        """
+        etudiants = list(etudiants)
+        chunk_size = chunk_size or settings.PASSWORD_BULK_CHUNK_SIZE
+        groupe, _ = Group.objects.get_or_create(name=cls.GROUP_NAME)
+        resultat = {'created': 0, 'linked': 0, 'total': len(etudiants)}
+        
+        for i in range(0, len(etudiants), chunk_size):
+            lot = etudiants[i:i + chunk_size]
+            created, linked = cls._provision_lot(lot, groupe, password, workers, salt_batch)
+            resultat['created'] += created
+            resultat['linked'] += linked
+            if progress:
+                progress(i + len(lot), len(etudiants))
+        
+        return resultat
+    
+    @classmethod
+    def _provision_lot(cls, etudiants, groupe, password, workers, salt_batch):
+        par_username = {cls.get_username(etudiant): etudiant for etudiant in etudiants}
+        existants = set(
+            User.objects.filter(username__in=par_username).values_list('username', flat=True)
+        )
+        a_creer = [(username, etudiant) for username, etudiant in par_username.items() if username not in existants]
+        
+        # Hachage hors transaction : c'est l'étape la plus longue
+        hachages = PasswordHashService.hash_passwords(
+            [password or cls.get_initial_password(etudiant) for _, etudiant in a_creer],
+            workers=workers, salt_batch=salt_batch,
+        )
+        
+        Membre = User.groups.through
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(
+                    username=username,
+                    email=etudiant.email or f"{username}@ecole.edu",
+                    first_name=etudiant.prenom,
+                    last_name=etudiant.nom,
+                    is_active=True,
+                    password=hachage,
+                )
+                for (username, etudiant), hachage in zip(a_creer, hachages)
+            ])
+            
+            # Identifiants relus en base (bulk_create ne les renvoie pas sur tous les SGBD)
+            user_ids = dict(
+                User.objects.filter(username__in=par_username).values_list('username', 'pk')
+            )
+            
+            membres = set(
+                Membre.objects.filter(group=groupe, user_id__in=user_ids.values())
+                .values_list('user_id', flat=True)
+            )
+            nouveaux_membres = [user_id for user_id in user_ids.values() if user_id not in membres]
+            Membre.objects.bulk_create(
+                [Membre(user_id=user_id, group_id=groupe.pk) for user_id in nouveaux_membres],
+                ignore_conflicts=True,
+            )
+            
+            a_lier = []
+            for username, etudiant in par_username.items():
+                if etudiant.user_id != user_ids[username]:
+                    etudiant.user_id = user_ids[username]
+                    a_lier.append(etudiant)
+            Etudiant.objects.bulk_update(a_lier, ['user'])
+            
+            # bulk_create n'envoie pas m2m_changed
+            transaction.on_commit(lambda: RoleService.invalidate(nouveaux_membres))
+        
+        return len(a_creer), len(a_lier)
+
+
+class EligibilityService:
+    """
+    Caches dérivés des paiements et des autorisations d'examen.
+    
+    Aucun cache n'est tenu par étudiant (la feuille d'émargement et le scan
+    lisent la base) : les agrégats concernés (compteurs des opérations,
+    instantané global du tableau de bord) sont invalidés en une fois.
+    """
+    
+    @staticmethod
+    def invalidate():
+        cache.delete_many([
+            CompteursService.CACHE_KEY,
+            DashboardSnapshotService.CACHE_KEY.format(scope='global'),
+        ])
+
+
+class ReconciliationService:
+    """
+    Rapprochement d'un relevé bancaire (CSV ou XLSX) avec les paiements.
+    
+    Chaque ligne est associée à un étudiant par son matricule, ou à défaut
+    par un matricule trouvé dans le libellé / la référence du virement, via
+    un dictionnaire chargé en une requête. Chaque virement est enregistré
+    sous sa référence d'opération (ou une empreinte de la ligne) : seuls les
+    virements encore inconnus s'ajoutent aux paiements de l'année, créés ou
+    mis à jour en masse, avec une seule entrée d'audit pour tout le relevé ;
+    les autorisations d'examen des étudiants concernés sont ensuite recalculées.
+    """
+    
+    # Candidats par ordre de priorité, comparés mot à mot aux en-têtes
+    # (minuscules, sans accents) ; les champs sont attribués dans cet ordre
+    COLONNES = {
+        'matricule': ('matricule',),
+        'montant': ('montant credit', 'credit', 'montant', 'amount'),
+        'date': ('date', 'date operation', 'date valeur'),
+        'operation': ('id operation', 'operation', 'id transaction', 'transaction', 'id virement'),
+        'reference': ('reference', 'libelle', 'motif', 'communication', 'description'),
+    }
+    # Mots qui écartent un en-tête d'un champ (colonne de débit, type ou date d'opération...)
+    EXCLUSIONS = {
+        'montant': ('debit',),
+        'operation': ('date', 'type', 'montant', 'libelle'),
+        'reference': ('date',),
+    }
+    FORMATS_DATE = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d/%m/%y')
+    
+    @staticmethod
+    def read_statement(fichier, nom_fichier):
+        """Lignes du relevé (dictionnaires aux en-têtes en minuscules)"""
+        if nom_fichier.lower().endswith(('.xlsx', '.xlsm')):
+            from openpyxl import load_workbook
+            classeur = load_workbook(fichier, read_only=True, data_only=True)
+            lignes = classeur.active.iter_rows(values_only=True)
+            entetes = [str(entete or '').strip().lower() for entete in next(lignes, [])]
+            return [dict(zip(entetes, ligne)) for ligne in lignes if any(ligne)]
+        
+        contenu = fichier.read()
+        if isinstance(contenu, bytes):
+            try:
+                contenu = contenu.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                contenu = contenu.decode('cp1252', errors='replace')
+        try:
+            dialecte = csv.Sniffer().sniff(contenu[:4096], delimiters=';,\t')
+        except csv.Error:
+            dialecte = csv.excel
+        lecteur = csv.DictReader(io.StringIO(contenu), dialect=dialecte)
+        return [
+            {(cle or '').strip().lower(): valeur for cle, valeur in ligne.items()}
+            for ligne in lecteur
+        ]
+    
+    @staticmethod
+    def header_words(entete):
+        """'Date d'opération' -> ('date', 'd', 'operation')"""
+        texte = unicodedata.normalize('NFKD', str(entete or '')).encode('ascii', 'ignore').decode('ascii')
+        return tuple(re.findall(r'[a-z0-9]+', texte.lower()))
+    
+    @classmethod
+    def find_columns(cls, entetes):
+        """
+        Nom de colonne du relevé pour chaque champ attendu.
+        
+        Un en-tête identique à un candidat l'emporte sur un en-tête qui
+        contient seulement ses mots ; une colonne ne sert qu'à un champ.
+        """
+        mots = {entete: cls.header_words(entete) for entete in entetes}
+        colonnes = dict.fromkeys(cls.COLONNES)
+        utilisees = set()
+        
+        for exact in (True, False):
+            for champ, candidats in cls.COLONNES.items():
+                if colonnes[champ]:
+                    continue
+                exclus = cls.EXCLUSIONS.get(champ, ())
+                for candidat in candidats:
+                    attendus = tuple(candidat.split())
+                    colonnes[champ] = next((
+                        entete for entete, mots_entete in mots.items()
+                        if entete not in utilisees
+                        and not any(mot in mots_entete for mot in exclus)
+                        and (mots_entete == attendus if exact else set(attendus) <= set(mots_entete))
+                    ), None)
+                    if colonnes[champ]:
+                        utilisees.add(colonnes[champ])
+                        break
+        return colonnes
+    
+    @staticmethod
+    def parse_montant(valeur):
+        """'50 000,00' / '50,000.00' / 50000 -> 50000 (None si illisible)"""
+        if valeur is None or valeur == '':
+            return None
+        if isinstance(valeur, (int, float)):
+            return int(round(valeur))
+        texte = re.sub(r'[^\d,.\-]', '', str(valeur))
+        if ',' in texte and '.' in texte:
+            # Le dernier séparateur est le séparateur décimal
+            if texte.rfind(',') > texte.rfind('.'):
+                texte = texte.replace('.', '').replace(',', '.')
+            else:
+                texte = texte.replace(',', '')
+        else:
+            texte = texte.replace(',', '.')
+        try:
+            return int(round(float(texte)))
+        except ValueError:
+            return None
+    
+    @classmethod
+    def parse_date(cls, valeur):
+        if isinstance(valeur, datetime):
+            return valeur if timezone.is_aware(valeur) else timezone.make_aware(valeur)
+        if isinstance(valeur, date):
+            return timezone.make_aware(datetime.combine(valeur, datetime.min.time()))
+        for format_date in cls.FORMATS_DATE:
+            try:
+                return timezone.make_aware(datetime.strptime(str(valeur).strip(), format_date))
+            except (TypeError, ValueError):
+                continue
+        return None
+    
+    @staticmethod
+    def normalize_matricule(valeur):
+        return str(valeur or '').strip().upper()
+    
+    @classmethod
+    def reference_ligne(cls, ligne, colonnes, occurrences):
+        """
+        Référence unique du virement : identifiant d'opération de la banque,
+        sinon empreinte de la ligne (numérotée si elle se répète dans le relevé).
+        """
+        if colonnes['operation']:
+            operation = str(ligne.get(colonnes['operation']) or '').strip()
+            if operation:
+                return operation[:100]
+        contenu = '|'.join(
+            str(ligne.get(colonnes[champ]) or '').strip()
+            for champ in ('date', 'montant', 'matricule', 'reference') if colonnes[champ]
+        )
+        occurrences[contenu] += 1
+        empreinte = hashlib.sha1(f"{contenu}|{occurrences[contenu]}".encode('utf-8')).hexdigest()
+        return f"ligne:{empreinte}"
+    
+    @classmethod
+    def match(cls, lignes, colonnes, matricules):
+        """
+        Virements rapprochés [{'etudiant_id', 'reference', 'montant', 'date'}]
+        et lignes non rapprochées [(numéro de ligne, motif)].
+        """
+        virements = []
+        non_rapprochees = []
+        occurrences = defaultdict(int)
+        for numero, ligne in enumerate(lignes, start=2):
+            montant = cls.parse_montant(ligne.get(colonnes['montant']))
+            if montant is None:
+                non_rapprochees.append((numero, 'montant illisible'))
+                continue
+            
+            etudiant_id = None
+            if colonnes['matricule']:
+                etudiant_id = matricules.get(cls.normalize_matricule(ligne.get(colonnes['matricule'])))
+            if etudiant_id is None and colonnes['reference']:
+                reference = str(ligne.get(colonnes['reference']) or '').upper()
+                etudiant_id = next(
+                    (matricules[jeton] for jeton in re.findall(r'[A-Z0-9\-]+', reference) if jeton in matricules),
+                    None,
+                )
+            if etudiant_id is None:
+                non_rapprochees.append((numero, 'étudiant non identifié'))
+                continue
+            
+            virements.append({
+                'etudiant_id': etudiant_id,
+                'reference': cls.reference_ligne(ligne, colonnes, occurrences),
+                'montant': montant,
+                'date': cls.parse_date(ligne.get(colonnes['date'])) if colonnes['date'] else None,
+                'numero': numero,
+            })
+        
+        return virements, non_rapprochees
+    
+    @staticmethod
+    def known_references(references):
+        """Références déjà portées sur un paiement (une requête par lot)"""
+        references = list(references)
+        connues = set()
+        taille = settings.RECONCILIATION_BATCH_SIZE
+        for debut in range(0, len(references), taille):
+            connues.update(VirementBancaire.objects.filter(
+                reference__in=references[debut:debut + taille]
+            ).values_list('reference', flat=True))
+        return connues
+    
+    @classmethod
+    def reconcile(cls, fichier, nom_fichier, annee_academique=None, user=None, remplacer=False, dry_run=False):
+        """
+        Rapprocher un relevé et mettre à jour les paiements de l'année.
+        
+        Par défaut, seuls les virements absents des imports précédents
+        s'ajoutent aux montants enregistrés : réimporter un relevé ne change
+        rien et un montant n'est jamais diminué. Avec remplacer=True (demande
+        explicite), le total du relevé devient le montant payé par chaque
+        étudiant concerné, même s'il est inférieur.
+        """
+        annee_academique = annee_academique or AnneeAcademique.objects.filter(active=True).first()
+        if annee_academique is None:
+            raise ValidationError("Aucune année académique active")
+        
+        lignes = cls.read_statement(fichier, nom_fichier)
+        colonnes = cls.find_columns(lignes[0].keys() if lignes else [])
+        if not colonnes['montant'] or not (colonnes['matricule'] or colonnes['reference']):
+            raise ValidationError("Colonnes introuvables : un montant et un matricule ou une référence sont requis")
+        
+        # Matricules comparés en majuscules des deux côtés
+        matricules = dict(Etudiant.objects.annotate(
+            matricule_normalise=Upper(Trim('matricule'))
+        ).values_list('matricule_normalise', 'pk'))
+        virements, non_rapprochees = cls.match(lignes, colonnes, matricules)
+        
+        # Virements déjà importés (ou répétés dans ce relevé sous le même identifiant)
+        connues = cls.known_references(virement['reference'] for virement in virements)
+        totaux, nouveaux_virements = {}, []
+        deja_importes = 0
+        for virement in virements:
+            total = totaux.setdefault(virement['etudiant_id'], {'releve': 0, 'nouveaux': 0, 'date': None})
+            total['releve'] += virement['montant']
+            if virement['reference'] in connues:
+                deja_importes += 1
+                continue
+            connues.add(virement['reference'])
+            nouveaux_virements.append(virement)
+            total['nouveaux'] += virement['montant']
+            if virement['date'] and (total['date'] is None or virement['date'] > total['date']):
+                total['date'] = virement['date']
+        
+        existants = {
+            paiement.etudiant_id: paiement
+            for paiement in Paiement.objects.filter(annee_academique=annee_academique, etudiant_id__in=totaux)
+        }
+        maintenant = timezone.now()
+        paiements, nouveaux, modifies = {}, [], []
+        devenus_regles = diminues = 0
+        
+        for etudiant_id, total in totaux.items():
+            paiement = existants.get(etudiant_id)
+            if paiement is None:
+                paiement = Paiement(
+                    etudiant_id=etudiant_id,
+                    annee_academique=annee_academique,
+                    montant_attendu=settings.PAIEMENT_MONTANT_ATTENDU,
+                    created_by=user,
+                )
+                nouveaux.append(paiement)
+                etait_regle = False
+                montant = total['releve'] if remplacer else total['nouveaux']
+            else:
+                etait_regle = paiement.est_regle
+                montant = total['releve'] if remplacer else paiement.montant + total['nouveaux']
+                diminues += montant < paiement.montant
+                if montant == paiement.montant and (montant >= paiement.montant_attendu) == paiement.est_regle:
+                    paiements[etudiant_id] = paiement
+                    continue
+                modifies.append(paiement)
+            
+            paiement.montant = montant
+            paiement.est_regle = montant >= paiement.montant_attendu
+            paiement.date_paiement = total['date'] or paiement.date_paiement or maintenant
+            paiement.date_modification = maintenant
+            paiements[etudiant_id] = paiement
+            devenus_regles += paiement.est_regle and not etait_regle
+        
+        resultat = {
+            'annee_academique': annee_academique.code,
+            'lignes': len(lignes),
+            'rapprochees': len(lignes) - len(non_rapprochees),
+            'deja_importees': deja_importes,
+            'etudiants': len(totaux),
+            'crees': len(nouveaux),
+            'modifies': len(modifies),
+            'diminues': diminues,
+            'inchanges': len(totaux) - len(nouveaux) - len(modifies),
+            'devenus_regles': devenus_regles,
+            'non_rapprochees': [{'ligne': numero, 'motif': motif} for numero, motif in non_rapprochees],
+        }
+        if dry_run:
+            return resultat
+        
+        etudiant_ids = [paiement.etudiant_id for paiement in nouveaux + modifies]
+        with transaction.atomic():
+            Paiement.objects.bulk_create(nouveaux, batch_size=settings.RECONCILIATION_BATCH_SIZE)
+            Paiement.objects.bulk_update(
+                modifies,
+                ['montant', 'est_regle', 'date_paiement', 'date_modification'],
+                batch_size=settings.RECONCILIATION_BATCH_SIZE,
+            )
+            # La contrainte d'unicité sur la référence rejette un import concurrent du même relevé
+            VirementBancaire.objects.bulk_create(
+                [
+                    VirementBancaire(
+                        paiement=paiements[virement['etudiant_id']],
+                        reference=virement['reference'],
+                        montant=virement['montant'],
+                        date_virement=virement['date'],
+                        fichier=nom_fichier[:255],
+                    )
+                    for virement in nouveaux_virements
+                ],
+                batch_size=settings.RECONCILIATION_BATCH_SIZE,
+            )
+            # bulk_create/bulk_update n'envoient pas post_save : une entrée pour tout le relevé
+            AuditLog.objects.create(
+                utilisateur=user,
+                action_type='paiement',
+                action=f"Rapprochement bancaire {nom_fichier} - {annee_academique}",
+                details={key: value for key, value in resultat.items() if key != 'non_rapprochees'}
+                | {'fichier': nom_fichier, 'remplacer': remplacer, 'non_rapprochees': len(non_rapprochees)},
+            )
+            transaction.on_commit(EligibilityService.invalidate)
+            
+            # Répercuter les paiements sur les autorisations d'examen des étudiants concernés
+            resultat['autorisees'] = resultat['revoquees'] = 0
+            for debut in range(0, len(etudiant_ids), settings.RECONCILIATION_BATCH_SIZE):
+                autorisations = InscriptionService.recompute_authorizations(
+                    annee_academique,
+                    etudiants=etudiant_ids[debut:debut + settings.RECONCILIATION_BATCH_SIZE],
+                    user=user,
+                )
+                resultat['autorisees'] += autorisations['autorisees']
+                resultat['revoquees'] += autorisations['revoquees']
+        
+        return resultat
+
+
+class InscriptionService:
+    """
+    Génération et autorisation ensemblistes des inscriptions UE.
+    
+    Une seule requête INSERT … SELECT croise les étudiants et les UEs de même
+    (filière, niveau), calcule l'autorisation d'examen à partir de la table
+    des paiements et ignore les inscriptions déjà présentes : la base fait le
+    travail, sans aller-retour par étudiant.
+    
+    Règle d'autorisation : l'étudiant est actif et son paiement de l'année
+    est réglé. `recompute_authorizations` la réapplique en deux UPDATE … WHERE
+    EXISTS après une campagne de paiements ou un changement de statut.
+    """
+    
+    STATUT_AUTORISE = 'actif'
+    
+    @staticmethod
+    def generate(annee_academique, etudiants=None, filiere=None, niveau=None, user=None):
+        """
+        Créer les inscriptions manquantes et retourner leur nombre.
+        
+        `etudiants` (queryset) restreint la génération à un ensemble
+        d'étudiants ; `filiere` et `niveau` la restreignent à un groupe.
+        """
+        qn = connection.ops.quote_name
+        inscription = qn(InscriptionUE._meta.db_table)
+        etudiant = qn(Etudiant._meta.db_table)
+        ue = qn(UE._meta.db_table)
+        paiement = qn(Paiement._meta.db_table)
+        maintenant = connection.ops.adapt_datetimefield_value(timezone.now())
+        
+        filtres = []
+        params_filtres = []
+        if etudiants is not None:
+            sql, sql_params = etudiants.values('pk').query.sql_with_params()
+            filtres.append(f'e.{qn("id")} IN ({sql})')
+            params_filtres.extend(sql_params)
+        if filiere is not None:
+            filtres.append(f'e.{qn("filiere_id")} = %s')
+            params_filtres.append(filiere.pk)
+        if niveau is not None:
+            filtres.append(f'e.{qn("niveau_id")} = %s')
+            params_filtres.append(niveau.pk)
+        
+        sql = f"""
+            INSERT INTO {inscription} (
+                {qn('etudiant_id')}, {qn('ue_id')}, {qn('annee_academique_id')},
+                {qn('est_autorise_examen')}, {qn('autorisation_manuelle')}, {qn('date_inscription')},
+                {qn('date_creation')}, {qn('date_modification')}, {qn('created_by_id')}
+            )
+            SELECT e.{qn('id')}, u.{qn('id')}, %s,
+                e.{qn('statut')} = %s AND EXISTS (
+                    SELECT 1 FROM {paiement} p
+                    WHERE p.{qn('etudiant_id')} = e.{qn('id')}
+                      AND p.{qn('annee_academique_id')} = %s
+                      AND p.{qn('est_regle')} = %s
+                ),
+                %s, %s, %s, %s, %s
+            FROM {etudiant} e
+            INNER JOIN {ue} u
+                ON u.{qn('filiere_id')} = e.{qn('filiere_id')}
+               AND u.{qn('niveau_id')} = e.{qn('niveau_id')}
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {inscription} i
+                WHERE i.{qn('etudiant_id')} = e.{qn('id')}
+                  AND i.{qn('ue_id')} = u.{qn('id')}
+                  AND i.{qn('annee_academique_id')} = %s
+            )
+        """
+        params = [
+            annee_academique.pk,
+            InscriptionService.STATUT_AUTORISE, annee_academique.pk, True,
+            False, maintenant, maintenant, maintenant, user.pk if user else None,
+            annee_academique.pk,
+        ]
+        if filtres:
+            sql += ' AND ' + ' AND '.join(filtres)
+            params.extend(params_filtres)
+        
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                creees = max(cursor.rowcount, 0)
+            
+            if creees:
+                # Pas de signal post_save : une entrée d'audit et une invalidation globale
+                AuditLog.objects.create(
+                    utilisateur=user,
+                    action_type='inscription',
+                    action=f"Génération des inscriptions UE - {annee_academique}",
+                    details={
+                        'annee_academique': annee_academique.code,
+                        'filiere': filiere.code if filiere else None,
+                        'niveau': niveau.nom if niveau else None,
+                        'creees': creees,
+                    },
+                )
+                transaction.on_commit(TimetableService.invalidate_all)
+                transaction.on_commit(EligibilityService.invalidate)
+        
+        return creees
+    
+    @classmethod
+    def authorization_rule(cls):
+        """Condition (sur InscriptionUE) d'une inscription autorisée à l'examen"""
+        return Q(
+            Exists(Etudiant.objects.filter(pk=OuterRef('etudiant_id'), statut=cls.STATUT_AUTORISE)),
+            Exists(Paiement.objects.filter(
+                etudiant_id=OuterRef('etudiant_id'),
+                annee_academique_id=OuterRef('annee_academique_id'),
+                est_regle=True,
+            )),
+        )
+    
+    @classmethod
+    def recompute_authorizations(cls, annee_academique=None, filiere=None, etudiants=None,
+                                 inscriptions=None, user=None, forcer=False):
+        """
+        Réappliquer la règle d'autorisation et retourner les lignes modifiées.
+        
+        La portée est l'intersection des critères fournis : année académique,
+        filière (de l'UE), ensemble d'étudiants (queryset ou ids) ou queryset
+        d'inscriptions. Seules les lignes dont l'autorisation change sont
+        écrites : une inscription déjà correcte n'est pas touchée. Les
+        autorisations fixées à la main sont conservées, sauf si forcer=True :
+        elles repassent alors sous la règle.
+        """
+        queryset = inscriptions if inscriptions is not None else InscriptionUE.objects.all()
+        if annee_academique is not None:
+            queryset = queryset.filter(annee_academique=annee_academique)
+        if filiere is not None:
+            queryset = queryset.filter(ue__filiere=filiere)
+        if etudiants is not None:
+            queryset = queryset.filter(etudiant__in=etudiants)
+        
+        regle = cls.authorization_rule()
+        maintenant = timezone.now()
+        with transaction.atomic():
+            if forcer:
+                queryset.filter(autorisation_manuelle=True).update(autorisation_manuelle=False)
+            else:
+                queryset = queryset.filter(autorisation_manuelle=False)
+            autorisees = queryset.filter(regle, est_autorise_examen=False).update(
+                est_autorise_examen=True, date_modification=maintenant
+            )
+            revoquees = queryset.filter(~regle, est_autorise_examen=True).update(
+                est_autorise_examen=False, date_modification=maintenant
+            )
+            resultat = {'autorisees': autorisees, 'revoquees': revoquees}
+            
+            if autorisees or revoquees:
+                AuditLog.objects.create(
+                    utilisateur=user,
+                    action_type='inscription',
+                    action="Recalcul des autorisations d'examen"
+                           + (f" - {annee_academique}" if annee_academique else ""),
+                    details=resultat | {
+                        'annee_academique': annee_academique.code if annee_academique else None,
+                        'filiere': filiere.code if filiere else None,
+                    },
+                )
+                # Les emplois du temps ne listent que les examens autorisés
+                transaction.on_commit(TimetableService.invalidate_all)
+                transaction.on_commit(EligibilityService.invalidate)
+        
+        return resultat
+
+
+class ExamSchedulerService:
+    """
+    Planification sous contraintes des examens d'une session.
+    
+    Les examens sont les sommets d'un graphe de conflits dont les arêtes sont
+    pondérées par le nombre d'étudiants inscrits aux deux UEs (auto-jointure
+    sur InscriptionUE). Une coloration gloutonne de type DSATUR donne à chaque
+    examen un créneau (date, heures) et la plus petite salle libre de
+    capacité suffisante ; une recherche locale déplace ensuite les examens
+    restés en conflit. Coût d'un placement : POIDS_SIMULTANE par étudiant
+    convoqué à deux examens simultanés, 1 par étudiant ayant deux examens le
+    même jour. Un surveillant ne surveille jamais deux examens à la fois.
+    """
+    
+    POIDS_SIMULTANE = 1000
+    
+    @staticmethod
+    def creneaux(session):
+        """Créneaux (date, heure_debut, heure_fin) des jours ouvrés de la session"""
+        heures = [
+            (datetime.strptime(debut, '%H:%M').time(), datetime.strptime(fin, '%H:%M').time())
+            for debut, fin in settings.EXAM_CRENEAUX
+        ]
+        creneaux = []
+        jour = session.date_debut
+        while jour <= session.date_fin:
+            if jour.weekday() < 5:
+                creneaux.extend((jour, debut, fin) for debut, fin in heures)
+            jour += timedelta(days=1)
+        return creneaux
+    
+    @staticmethod
+    def conflict_graph(session):
+        """
+        Effectif de chaque UE de la session et nombre d'étudiants communs par
+        paire d'UEs, calculés par la base en deux requêtes.
+        """
+        ues_session = Examen.objects.filter(session=session).values('ue_id')
+        effectifs = dict(
+            InscriptionUE.objects.filter(annee_academique_id=session.annee_academique_id, ue_id__in=ues_session)
+            .values('ue_id').annotate(nombre=Count('pk')).values_list('ue_id', 'nombre')
+        )
+        
+        qn = connection.ops.quote_name
+        inscription = qn(InscriptionUE._meta.db_table)
+        sous_requete, sous_params = ues_session.query.sql_with_params()
+        sql = f"""
+            SELECT a.{qn('ue_id')}, b.{qn('ue_id')}, COUNT(*)
+            FROM {inscription} a
+            INNER JOIN {inscription} b
+                ON b.{qn('etudiant_id')} = a.{qn('etudiant_id')}
+               AND b.{qn('annee_academique_id')} = a.{qn('annee_academique_id')}
+               AND b.{qn('ue_id')} > a.{qn('ue_id')}
+            WHERE a.{qn('annee_academique_id')} = %s
+              AND a.{qn('ue_id')} IN ({sous_requete})
+              AND b.{qn('ue_id')} IN ({sous_requete})
+            GROUP BY a.{qn('ue_id')}, b.{qn('ue_id')}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [session.annee_academique_id, *sous_params, *sous_params])
+            communs = {(ue_a, ue_b): nombre for ue_a, ue_b, nombre in cursor.fetchall()}
+        return effectifs, communs
+    
+    @classmethod
+    def plan(cls, session, iterations=None, seed=None):
+        """
+        Calculer un planning sans l'enregistrer.
+        
+        Retourne (planifies, rapport) : les examens placés, qui portent leurs
+        nouvelles date, heures et salle (les autres restent inchangés), et le
+        bilan du planning.
+        """
+        iterations = settings.EXAM_PLANNING_ITERATIONS if iterations is None else iterations
+        examens = list(Examen.objects.filter(session=session).select_related('ue').order_by('pk'))
+        creneaux = cls.creneaux(session)
+        salles = sorted(Salle.objects.all(), key=lambda salle: (salle.capacite, salle.code))
+        effectifs, communs = cls.conflict_graph(session)
+        effectif = [effectifs.get(examen.ue_id, 0) for examen in examens]
+        capacite_max = salles[-1].capacite if salles else 0
+        
+        # Graphe : voisins[i][j] = étudiants communs ; exclus[i] = même surveillant
+        voisins = [defaultdict(int) for _ in examens]
+        exclus = [set() for _ in examens]
+        par_ue = defaultdict(list)
+        par_surveillant = defaultdict(list)
+        for i, examen in enumerate(examens):
+            par_ue[examen.ue_id].append(i)
+            if examen.surveillant_id:
+                par_surveillant[examen.surveillant_id].append(i)
+        for (ue_a, ue_b), nombre in communs.items():
+            for i in par_ue.get(ue_a, ()):
+                for j in par_ue.get(ue_b, ()):
+                    voisins[i][j] += nombre
+                    voisins[j][i] += nombre
+        for indices in par_ue.values():
+            for i in indices:
+                for j in indices:
+                    if i != j:
+                        voisins[i][j] = effectif[i]
+        for indices in par_surveillant.values():
+            for i in indices:
+                exclus[i].update(j for j in indices if j != i)
+        
+        # Salles déjà prises sur ces créneaux par des examens d'autres sessions
+        # (salle principale ou salle de leur répartition)
+        occupees = [set() for _ in creneaux]
+        autres = list(Examen.objects.filter(
+            date__range=(session.date_debut, session.date_fin), salle__isnull=False
+        ).exclude(session=session).values_list('date', 'heure_debut', 'heure_fin', 'salle_id'))
+        autres += RepartitionSalle.objects.filter(
+            examen__date__range=(session.date_debut, session.date_fin)
+        ).exclude(examen__session=session).values_list(
+            'examen__date', 'examen__heure_debut', 'examen__heure_fin', 'salle_id'
+        )
+        for jour, debut, fin, salle_id in autres:
+            for k, (date_creneau, heure_debut, heure_fin) in enumerate(creneaux):
+                if date_creneau == jour and heure_debut < fin and heure_fin > debut:
+                    occupees[k].add(salle_id)
+        
+        creneau = [None] * len(examens)
+        salle = [None] * len(examens)
+        
+        def choisir_salle(k, i):
+            # Plus petite salle libre suffisante ; à défaut la plus grande si aucune ne suffit
+            libres = [s for s in salles if s.pk not in occupees[k]]
+            for candidate in libres:
+                if candidate.capacite >= effectif[i]:
+                    return candidate
+            if libres and effectif[i] > capacite_max:
+                return libres[-1]
+            return None
+        
+        def couts(i):
+            # Coût de chaque créneau pour l'examen i, les autres restant en place
+            par_creneau = defaultdict(int)
+            par_jour = defaultdict(int)
+            interdits = {creneau[j] for j in exclus[i] if creneau[j] is not None}
+            for j, nombre in voisins[i].items():
+                if creneau[j] is not None:
+                    par_creneau[creneau[j]] += nombre
+                    par_jour[creneaux[creneau[j]][0]] += nombre
+            resultat = {}
+            for k, (jour, _, _) in enumerate(creneaux):
+                if k in interdits:
+                    continue
+                resultat[k] = cls.POIDS_SIMULTANE * par_creneau[k] + par_jour[jour] - par_creneau[k]
+            return resultat
+        
+        def placer(i, k, choix):
+            if creneau[i] is not None:
+                occupees[creneau[i]].discard(salle[i].pk)
+            creneau[i], salle[i] = k, choix
+            occupees[k].add(choix.pk)
+        
+        def meilleur_creneau(i):
+            # Créneau le moins coûteux (le plus tôt à coût égal) disposant d'une salle
+            for k, _ in sorted(couts(i).items(), key=lambda item: (item[1], item[0])):
+                choix = choisir_salle(k, i)
+                if choix is not None:
+                    return k, choix
+            return None
+        
+        # 1. Coloration gloutonne DSATUR : d'abord l'examen dont les voisins
+        #    occupent le plus de créneaux distincts, puis le plus contraint
+        non_places = set(range(len(examens)))
+        degre = [sum(v.values()) for v in voisins]
+        non_planifies = []
+        while non_places:
+            i = max(non_places, key=lambda i: (
+                len({creneau[j] for j in voisins[i] if creneau[j] is not None}),
+                degre[i], effectif[i], -i,
+            ))
+            non_places.discard(i)
+            choix = meilleur_creneau(i)
+            if choix is None:
+                non_planifies.append(i)
+                continue
+            placer(i, *choix)
+        
+        # 2. Recherche locale : déplacer les examens en conflit tant que le coût baisse
+        aleatoire = random.Random(seed)
+        places = [i for i in range(len(examens)) if creneau[i] is not None]
+        restantes = iterations
+        ameliore = True
+        while ameliore and restantes > 0:
+            ameliore = False
+            en_conflit = [i for i in places if couts(i).get(creneau[i], 0) > 0]
+            aleatoire.shuffle(en_conflit)
+            for i in en_conflit[:restantes]:
+                restantes -= 1
+                cout_i = couts(i)
+                actuel = cout_i.get(creneau[i], 0)
+                for k, cout in sorted(cout_i.items(), key=lambda item: (item[1], item[0])):
+                    if cout >= actuel:
+                        break
+                    choix = choisir_salle(k, i)
+                    if choix is not None:
+                        placer(i, k, choix)
+                        ameliore = True
+                        break
+        
+        # 3. Report sur les examens et bilan
+        simultanes = meme_jour = 0
+        for i in places:
+            for j, nombre in voisins[i].items():
+                if j > i and creneau[j] is not None:
+                    if creneau[j] == creneau[i]:
+                        simultanes += nombre
+                    elif creneaux[creneau[j]][0] == creneaux[creneau[i]][0]:
+                        meme_jour += nombre
+            examens[i].date, examens[i].heure_debut, examens[i].heure_fin = creneaux[creneau[i]]
+            examens[i].salle = salle[i]
+        
+        # Contrôle final : chevauchements avec les examens de la session restés sans créneau
+        planifies = [examens[i] for i in places]
+        rapport = {
+            'session': str(session),
+            'examens': len(examens),
+            'planifies': len(places),
+            'creneaux': len(creneaux),
+            'jours': len({creneaux[creneau[i]][0] for i in places}),
+            'conflits_simultanes': simultanes,
+            'conflits_meme_jour': meme_jour,
+            'non_planifies': [examens[i].ue.code for i in non_planifies],
+            'capacite_insuffisante': [
+                examens[i].ue.code for i in places if salle[i].capacite < effectif[i]
+            ],
+            'chevauchements_salle': [
+                f"{examen.ue.code}/{conflit.ue.code}"
+                for examen, conflit in ExamenService.valider_planning(planifies)
+            ],
+        }
+        return planifies, rapport
+    
+    @classmethod
+    def schedule(cls, session, iterations=None, seed=None, user=None, dry_run=False):
+        """
+        Planifier la session et enregistrer le résultat en une passe
+        (bulk_update, sans signal par examen) sauf en mode dry-run.
+        """
+        planifies, rapport = cls.plan(session, iterations=iterations, seed=seed)
+        if dry_run:
+            return planifies, rapport
+        
+        maintenant = timezone.now()
+        for examen in planifies:
+            examen.date_modification = maintenant
+        
+        # Examens déplacés : leur répartition en salles ne vaut plus
+        avant = {
+            pk: creneau
+            for pk, *creneau in Examen.objects.filter(pk__in=[examen.pk for examen in planifies]).values_list(
+                'pk', 'date', 'heure_debut', 'heure_fin', 'salle_id'
+            )
+        }
+        deplaces = [
+            examen.pk for examen in planifies
+            if avant.get(examen.pk) != [examen.date, examen.heure_debut, examen.heure_fin, examen.salle_id]
+        ]
+        
+        with transaction.atomic():
+            Examen.objects.bulk_update(
+                planifies,
+                ['date', 'heure_debut', 'heure_fin', 'salle', 'date_modification'],
+            )
+            PlacementService.clear(deplaces)
+            # bulk_update n'envoie pas post_save : une entrée pour toute la session
+            AuditLog.objects.create(
+                utilisateur=user,
+                action_type='examen',
+                action=f"Planification de la session {session}",
+                details={
+                    key: (len(value) if isinstance(value, list) else value)
+                    for key, value in rapport.items()
+                },
+                content_object=session,
+            )
+            transaction.on_commit(TimetableService.invalidate_all)
+        
+        return planifies, rapport
+    
+    @staticmethod
+    def double_bookings(session):
+        """
+        Étudiants convoqués à deux examens qui se chevauchent dans la session.
+        
+        Une fonction fenêtre calcule, pour chaque (étudiant, jour) trié par
+        heure de début, la fin la plus tardive des examens précédents : seules
+        les convocations qui commencent avant cette fin remontent de la base.
+        Les examens des étudiants concernés sont ensuite relus en une requête
+        et appariés par un balayage.
+        """
+        convocations = InscriptionUE.objects.filter(
+            annee_academique_id=session.annee_academique_id,
+            ue__examen__session=session,
+        )
+        touches = set(
+            convocations.annotate(
+                jour=F('ue__examen__date'),
+                debut=F('ue__examen__heure_debut'),
+                fin_precedente=Window(
+                    Max('ue__examen__heure_fin'),
+                    partition_by=[F('etudiant_id'), F('ue__examen__date')],
+                    order_by=[F('ue__examen__heure_debut').asc(), F('ue__examen__id').asc()],
+                    frame=RowRange(start=None, end=-1),
+                ),
+            ).filter(debut__lt=F('fin_precedente')).values_list('etudiant_id', 'jour')
+        )
+        
+        lignes = []
+        if touches:
+            lignes = convocations.filter(
+                etudiant_id__in={etudiant_id for etudiant_id, _ in touches}
+            ).values_list(
+                'etudiant_id', 'etudiant__matricule', 'etudiant__nom', 'etudiant__prenom',
+                'ue__examen__id', 'ue__code', 'ue__examen__date',
+                'ue__examen__heure_debut', 'ue__examen__heure_fin',
+            ).order_by('etudiant_id', 'ue__examen__date', 'ue__examen__heure_debut', 'ue__examen__id')
+        
+        conflits = []
+        paires = {}
+        dernier = None  # examen de l'étudiant et du jour courants qui finit le plus tard
+        for etudiant_id, matricule, nom, prenom, examen_id, ue_code, jour, debut, fin in lignes:
+            examen = {'id': examen_id, 'ue': ue_code, 'heure_debut': debut, 'heure_fin': fin}
+            meme_jour = dernier is not None and dernier[0] == (etudiant_id, jour)
+            if meme_jour and debut < dernier[1]['heure_fin']:
+                conflits.append({
+                    'etudiant_id': etudiant_id,
+                    'matricule': matricule,
+                    'nom': nom,
+                    'prenom': prenom,
+                    'date': jour,
+                    'examen': examen,
+                    'conflit': dernier[1],
+                })
+                cle = (dernier[1]['id'], examen_id)
+                paire = paires.setdefault(cle, {
+                    'examens': list(cle),
+                    'ues': [dernier[1]['ue'], ue_code],
+                    'date': jour,
+                    'etudiants': 0,
+                })
+                paire['etudiants'] += 1
+            if not meme_jour or fin > dernier[1]['heure_fin']:
+                dernier = ((etudiant_id, jour), examen)
+        
+        return {
+            'session': str(session),
+            'etudiants': len({conflit['etudiant_id'] for conflit in conflits}),
+            'paires': sorted(paires.values(), key=lambda paire: (-paire['etudiants'], paire['date'])),
+            'conflits': conflits,
+        }
+
+
+class PlacementService:
+    """
+    Répartition des étudiants autorisés d'un examen entre plusieurs salles.
+    
+    Les étudiants sont triés par matricule (ou mélangés avec une graine) et
+    remplissent les salles l'une après l'autre ; chaque salle est stockée en
+    une ligne RepartitionSalle (liste ordonnée des ids = numéros de place).
+    Le plan d'un examen est mis en cache sous forme de dictionnaire
+    etudiant_id -> (salle, place) pour les scans. Un étudiant autorisé après
+    la répartition n'a pas de place : il est attendu, sans numéro, à la
+    porte de la salle principale de l'examen (groupe de débordement).
+    """
+    
+    ORDRES = ('matricule', 'aleatoire')
+    CACHE_KEY = 'placement:{examen_id}'
+    
+    @staticmethod
+    def salles_libres(examen):
+        """
+        Salles libres pendant l'examen, la salle de l'examen en tête puis les
+        plus grandes d'abord (le moins de salles possible).
+        """
+        simultanes = Examen.objects.filter(
+            date=examen.date,
+            heure_debut__lt=examen.heure_fin,
+            heure_fin__gt=examen.heure_debut,
+        ).exclude(pk=examen.pk)
+        occupees = Salle.objects.filter(
+            Q(examen__in=simultanes) | Q(repartitions__examen__in=simultanes)
+        ).values('pk')
+        salles = list(Salle.objects.exclude(pk__in=occupees).order_by('-capacite', 'code'))
+        salles.sort(key=lambda salle: salle.pk != examen.salle_id)
+        return salles
+    
+    @classmethod
+    def allocate(cls, examen, salles=None, ordre='matricule', seed=None, user=None):
+        """
+        Répartir les étudiants autorisés de l'examen et retourner les
+        répartitions créées (une par salle utilisée).
+        
+        `salles` impose les salles (dans l'ordre de remplissage) ; sinon les
+        salles libres sont choisies par salles_libres().
+        """
+        if ordre not in cls.ORDRES:
+            raise ValidationError(f"Ordre de placement inconnu: {ordre}")
+        
+        etudiants = list(
+            InscriptionUE.objects.filter(
+                ue_id=examen.ue_id,
+                annee_academique_id=examen.annee_academique_id,
+                est_autorise_examen=True,
+            ).order_by('etudiant__matricule').values_list('etudiant_id', flat=True)
+        )
+        if ordre == 'aleatoire':
+            random.Random(seed).shuffle(etudiants)
+        
+        salles = list(salles) if salles is not None else cls.salles_libres(examen)
+        if sum(salle.capacite for salle in salles) < len(etudiants):
+            raise ValidationError(
+                f"Capacité insuffisante: {len(etudiants)} étudiants pour "
+                f"{sum(salle.capacite for salle in salles)} places libres"
+            )
+        
+        repartitions = []
+        debut = 0
+        for salle in salles:
+            if debut >= len(etudiants):
+                break
+            repartitions.append(RepartitionSalle(
+                examen=examen,
+                salle=salle,
+                ordre=len(repartitions) + 1,
+                etudiants=etudiants[debut:debut + salle.capacite],
+            ))
+            debut += salle.capacite
+        
+        with transaction.atomic():
+            RepartitionSalle.objects.filter(examen=examen).delete()
+            RepartitionSalle.objects.bulk_create(repartitions)
+            # La salle principale de l'examen est la première de la répartition
+            if repartitions and examen.salle_id != repartitions[0].salle_id:
+                examen.salle = repartitions[0].salle
+                examen.date_modification = timezone.now()
+                Examen.objects.filter(pk=examen.pk).update(
+                    salle=examen.salle, date_modification=examen.date_modification
+                )
+            AuditLog.objects.create(
+                utilisateur=user,
+                action_type='examen',
+                action=f"Répartition en salles {examen.ue.code} - {examen.date}",
+                details={
+                    'examen_id': examen.id,
+                    'ordre': ordre,
+                    'seed': seed,
+                    'salles': {repartition.salle.code: repartition.nombre_places for repartition in repartitions},
+                },
+                content_object=examen,
+            )
+            transaction.on_commit(lambda: cls.invalidate(examen.pk))
+            # update() n'envoie pas post_save : emplois du temps et flux iCal à reconstruire
+            transaction.on_commit(lambda: TimetableService.invalidate_examen(examen))
+        
+        return repartitions
+    
+    @classmethod
+    def get_places(cls, examen_id):
+        """Plan de l'examen : {etudiant_id: (salle_id, code salle, place)}, vide sans répartition"""
+        key = cls.CACHE_KEY.format(examen_id=examen_id)
+        places = cache.get(key)
+        if places is None:
+            places = {
+                etudiant_id: (repartition.salle_id, repartition.salle.code, numero)
+                for repartition in RepartitionSalle.objects.filter(examen_id=examen_id).select_related('salle')
+                for numero, etudiant_id in enumerate(repartition.etudiants, start=1)
+            }
+            cache.set(key, places, settings.PLACEMENT_CACHE_TIMEOUT)
+        return places
+    
+    @classmethod
+    def get_place(cls, examen, etudiant_id):
+        """Salle et place d'un étudiant ; la salle de l'examen sans numéro s'il n'est pas réparti"""
+        place = cls.get_places(examen.pk).get(etudiant_id)
+        if place is not None:
+            return {'salle': place[1], 'place': place[2]}
+        return {'salle': examen.salle.code if examen.salle_id else None, 'place': None}
+    
+    @staticmethod
+    def filter_porte(queryset, examen, salle, places, champ='etudiant_id'):
+        """
+        Restreindre un queryset (inscriptions, scans) aux étudiants attendus à
+        la porte de `salle` : sa part de la répartition, plus les étudiants
+        sans place si c'est la salle principale de l'examen.
+        """
+        if salle.pk == examen.salle_id:
+            autres = [etudiant_id for etudiant_id, place in places.items() if place[0] != salle.pk]
+            return queryset.exclude(**{f'{champ}__in': autres})
+        ids = [etudiant_id for etudiant_id, place in places.items() if place[0] == salle.pk]
+        return queryset.filter(**{f'{champ}__in': ids})
+    
+    @classmethod
+    def clear(cls, examen_ids):
+        """Supprimer la répartition d'examens déplacés ; leur plan en cache est vidé après commit"""
+        examen_ids = list(examen_ids)
+        if not examen_ids:
+            return
+        RepartitionSalle.objects.filter(examen_id__in=examen_ids).delete()
+        transaction.on_commit(lambda: cache.delete_many(
+            [cls.CACHE_KEY.format(examen_id=examen_id) for examen_id in examen_ids]
+        ))
+    
+    @classmethod
+    def invalidate(cls, examen_id):
+        cache.delete(cls.CACHE_KEY.format(examen_id=examen_id))
@@ -1,17 +1,21 @@
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
 from .models import (
     ControleAcces, AuditLog, Paiement, InscriptionUE, 
-    Examen, JustificatifAbsence
+    Examen, JustificatifAbsence, UE, Salle
 )
 import json
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
+from rest_framework.authtoken.models import Token
 from .models import Etudiant
 import secrets
 import string
+import threading
+from contextlib import contextmanager
 
 @receiver(pre_save, sender=ControleAcces)
 def verifier_acces_etudiant_pre_save(sender, instance, **kwargs):
@@ -38,6 +42,70 @@ def log_controle_acces(sender, instance, created, **kwargs):
             content_object=instance
         )
 
+@receiver(post_save, sender=ControleAcces)
+def publier_controle_acces(sender, instance, created, **kwargs):
+    """Diffuser les nouveaux scans aux interfaces de scan abonnées"""
+    if created:
+        from .services import ScanEventService
+        transaction.on_commit(lambda: ScanEventService.publish(instance))
+
+@receiver(pre_save, sender=Paiement)
+def memoriser_reglement_paiement(sender, instance, **kwargs):
+    """Retenir montant et règlement d'origine pour ne recalculer que s'ils changent"""
+    instance._reglement_origine = None
+    if instance.pk:
+        instance._reglement_origine = Paiement.objects.filter(pk=instance.pk).values_list(
+            'montant', 'est_regle', 'etudiant_id', 'annee_academique_id'
+        ).first()
+
+@receiver(post_save, sender=Paiement)
+@receiver(post_delete, sender=Paiement)
+def recalculer_autorisations_paiement(sender, instance, **kwargs):
+    """Répercuter un paiement sur les autorisations d'examen de l'étudiant
+    
+    Seuls un nouveau paiement, une suppression ou un changement de montant ou
+    de règlement déclenchent le recalcul ; les autorisations fixées à la main
+    ne sont jamais modifiées.
+    """
+    origine = getattr(instance, '_reglement_origine', None)
+    if kwargs.get('created') is False and origine == (
+            instance.montant, instance.est_regle, instance.etudiant_id, instance.annee_academique_id):
+        return
+    from .services import InscriptionService
+    concernes = {(instance.etudiant_id, instance.annee_academique_id)}
+    if origine:
+        # Paiement réaffecté : l'ancien étudiant ou l'ancienne année perd ce paiement
+        concernes.add((origine[2], origine[3]))
+    
+    def recalculer():
+        for etudiant_id, annee_id in concernes:
+            InscriptionService.recompute_authorizations(
+                inscriptions=InscriptionUE.objects.filter(annee_academique_id=annee_id),
+                etudiants=[etudiant_id],
+            )
+    transaction.on_commit(recalculer)
+
+@receiver(pre_save, sender=Etudiant)
+def memoriser_statut_etudiant(sender, instance, **kwargs):
+    """Retenir le statut d'origine pour ne recalculer que s'il change"""
+    instance._statut_origine = None
+    if instance.pk:
+        instance._statut_origine = Etudiant.objects.filter(pk=instance.pk).values_list(
+            'statut', flat=True
+        ).first()
+
+@receiver(post_save, sender=Etudiant)
+def recalculer_autorisations_etudiant(sender, instance, created, **kwargs):
+    """Répercuter un changement de statut sur les autorisations d'examen de l'étudiant
+    
+    Les autorisations fixées à la main ne sont jamais modifiées.
+    """
+    if created or getattr(instance, '_statut_origine', None) == instance.statut:
+        return
+    from .services import InscriptionService
+    etudiant_id = instance.pk
+    transaction.on_commit(lambda: InscriptionService.recompute_authorizations(etudiants=[etudiant_id]))
+
 @receiver(post_save, sender=Paiement)
 def log_paiement(sender, instance, created, **kwargs):
     """Journaliser les paiements"""
@@ -70,6 +138,73 @@ def log_examen(sender, instance, created, **kwargs):
         content_object=instance
     )
 
+@receiver(pre_save, sender=Examen)
+def memoriser_ue_examen(sender, instance, **kwargs):
+    """
+    Retenir l'UE/année d'origine pour invalider aussi les anciens inscrits,
+    ainsi que le créneau et la salle d'origine (répartition à supprimer)
+    """
+    instance._timetable_origine = None
+    if instance.pk:
+        instance._timetable_origine = Examen.objects.filter(pk=instance.pk).values(
+            'ue_id', 'annee_academique_id', 'date', 'heure_debut', 'heure_fin', 'salle_id'
+        ).first()
+
+@receiver(post_save, sender=Examen)
+def supprimer_repartition_examen(sender, instance, created, **kwargs):
+    """Un examen déplacé (date, horaire ou salle) perd sa répartition en salles"""
+    origine = getattr(instance, '_timetable_origine', None)
+    if created or not origine:
+        return
+    creneau = (origine['date'], origine['heure_debut'], origine['heure_fin'], origine['salle_id'])
+    if creneau != (instance.date, instance.heure_debut, instance.heure_fin, instance.salle_id):
+        from .services import PlacementService
+        PlacementService.clear([instance.pk])
+
+@receiver(post_save, sender=Examen)
+@receiver(post_delete, sender=Examen)
+def invalider_emplois_du_temps_examen(sender, instance, **kwargs):
+    """Reconstruire l'emploi du temps des étudiants concernés par l'examen"""
+    from .services import TimetableService
+    origine = getattr(instance, '_timetable_origine', None)
+    
+    def invalider():
+        TimetableService.invalidate_examen(instance)
+        if origine and (origine['ue_id'], origine['annee_academique_id']) != (
+                instance.ue_id, instance.annee_academique_id):
+            TimetableService.invalidate(InscriptionUE.objects.filter(
+                ue_id=origine['ue_id'],
+                annee_academique_id=origine['annee_academique_id']
+            ).values_list('etudiant_id', flat=True))
+    transaction.on_commit(invalider)
+
+@receiver(post_save, sender=InscriptionUE)
+@receiver(post_delete, sender=InscriptionUE)
+def invalider_emploi_du_temps_inscription(sender, instance, **kwargs):
+    """Reconstruire l'emploi du temps de l'étudiant après modification d'une inscription"""
+    from .services import TimetableService
+    transaction.on_commit(lambda: TimetableService.invalidate([instance.etudiant_id]))
+
+@receiver(post_save, sender=UE)
+def invalider_emplois_du_temps_ue(sender, instance, created, **kwargs):
+    """Code et intitulé de l'UE figurent dans les emplois du temps des inscrits"""
+    if created:
+        return
+    from .services import TimetableService
+    ue_id = instance.pk
+    transaction.on_commit(lambda: TimetableService.invalidate(
+        InscriptionUE.objects.filter(ue_id=ue_id).values_list('etudiant_id', flat=True)
+    ))
+
+@receiver(post_save, sender=Salle)
+@receiver(post_delete, sender=Salle)
+def invalider_emplois_du_temps_salle(sender, instance, created=False, **kwargs):
+    """Salle renommée ou supprimée (examens remis à NULL sans signal) : tout reconstruire"""
+    if created:
+        return
+    from .services import TimetableService
+    transaction.on_commit(TimetableService.invalidate_all)
+
 @receiver(user_logged_in)
 def log_user_login(sender, request, user, **kwargs):
     """Journaliser les connexions"""
@@ -121,6 +256,25 @@ def log_justificatif(sender, instance, created, **kwargs):
 
 
 
+_etat_signaux = threading.local()
+
+
+@contextmanager
+def suspendre_creation_comptes():
+    """
+    Désactiver create_student_user dans le thread courant.
+    
+    Pour les imports en masse : les comptes sont ensuite créés en une fois
+    avec StudentAccountService.provision().
+    """
+    precedent = getattr(_etat_signaux, 'creation_comptes_suspendue', False)
+    _etat_signaux.creation_comptes_suspendue = True
+    try:
+        yield
+    finally:
+        _etat_signaux.creation_comptes_suspendue = precedent
+
+
 def generate_initial_password():
     """Générer un mot de passe initial basé sur la date de naissance"""
     # Vous pouvez ajuster cette logique selon vos besoins
@@ -130,7 +284,7 @@ def generate_initial_password():
 @receiver(post_save, sender=Etudiant)
 def create_student_user(sender, instance, created, **kwargs):
     """Créer un utilisateur Django lorsqu'un étudiant est créé"""
-    if created:
+    if created and not getattr(_etat_signaux, 'creation_comptes_suspendue', False):
         # Générer un nom d'utilisateur unique
         username = f"etu_{instance.matricule.lower()}"
         
@@ -153,4 +307,50 @@ def create_student_user(sender, instance, created, **kwargs):
             
             # Associer l'utilisateur à l'étudiant
             instance.user = user
-            instance.save(update_fields=['user'])
\ No newline at end of file
+            instance.save(update_fields=['user'])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalider_roles_utilisateur(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalider le cache des rôles quand les groupes d'un utilisateur changent"""
+    from .services import RoleService
+    if action == 'pre_clear' and reverse:
+        # group.user_set.clear() : mémoriser les utilisateurs avant suppression
+        instance._roles_user_ids = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_roles_user_ids', [])
+    else:
+        user_ids = pk_set or []
+    transaction.on_commit(lambda: RoleService.invalidate(user_ids))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalider_roles_groupe(sender, instance, created=False, **kwargs):
+    """Groupe renommé ou supprimé : les rôles en cache de ses membres sont périmés"""
+    if created:
+        return
+    from .services import RoleService
+    transaction.on_commit(RoleService.invalidate_all)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalider_cache_jeton(sender, instance, **kwargs):
+    """Retirer du cache un jeton d'API supprimé ou régénéré"""
+    from .authentication import token_cache
+    key, user_id = instance.key, instance.user_id
+    transaction.on_commit(lambda: (token_cache.invalidate(key), token_cache.invalidate_user(user_id)))
+
+
+@receiver(post_save, sender=User)
+def invalider_cache_jetons_utilisateur(sender, instance, **kwargs):
+    """Un compte modifié (désactivation, droits...) doit être revalidé en base"""
+    from .authentication import token_cache
+    user_id = instance.pk
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
@@ -1,3 +1,1130 @@
-from django.test import TestCase
+"""
+Budgets de requêtes SQL par URL.
 
-# Create your tests here.
+Chaque URL de core/urls.py et chaque couple (action, méthode HTTP) du routeur
+de l'API est appelé sur un jeu de données de départ, puis après l'ajout de nombreux étudiants
+(inscriptions, paiements, scans, justificatifs). Le nombre de requêtes doit
+rester identique entre les deux mesures (aucune boucle par ligne) et ne pas
+dépasser le budget déclaré dans BUDGETS.
+
+Toute nouvelle URL nommée doit recevoir un budget (ou figurer dans EXCLUSIONS
+avec une justification), sinon test_toutes_les_urls_ont_un_budget échoue ;
+de même pour les actions du routeur (test_toutes_les_actions_du_routeur_ont_un_budget).
+Les écritures sont annulées après chaque mesure.
+"""
+from collections import namedtuple
+from datetime import time, timedelta
+import difflib
+import io
+import json
+import tempfile
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User, Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, get_resolver, URLPattern, URLResolver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .api_urls import router
+from .authentication import token_cache
+from .models import (
+    AnneeAcademique, Filiere, Niveau, UE, Etudiant, Paiement, InscriptionUE,
+    Salle, SessionExamen, Examen, ControleAcces, JustificatifAbsence, RepartitionSalle,
+    VirementBancaire
+)
+from .services import (
+    ExamenService, ExamSchedulerService, PlacementService, ReconciliationService, RoleService, RosterService,
+    TimetableService
+)
+
+
+MOT_DE_PASSE = 'motdepasse-test'
+
+# Étudiants créés au départ, puis ajoutés avant la seconde mesure
+ETUDIANTS_DEPART = 4
+ETUDIANTS_AJOUTES = 12
+
+
+# nom de l'URL, rôle connecté (None = anonyme), méthode HTTP (corps en JSON,
+# ou en multipart s'il contient un fichier), budget, kwargs de l'URL et corps
+# de la requête (fonctions recevant le test, appelées avant la mesure)
+Cas = namedtuple('Cas', 'nom role methode budget kwargs data')
+
+
+def cas(nom, role='admin', budget=20, kwargs=None, methode='get', data=None):
+    return Cas(nom, role, methode, budget, kwargs, data)
+
+
+def examen(test):
+    return {'pk': test.examen.pk}
+
+
+def examen_id(test):
+    return {'examen_id': test.examen.pk}
+
+
+def planning_session(test):
+    """Planning proposé : l'examen passé déplacé sur le créneau de l'examen du jour"""
+    aujourdhui = timezone.localdate().isoformat()
+    return {'examens': [
+        {'id': test.examen_passe.pk, 'salle': test.salle.pk, 'date': aujourdhui,
+         'heure_debut': '08:00', 'heure_fin': '10:00'},
+        {'salle': test.salle.pk, 'date': aujourdhui, 'heure_debut': '09:00', 'heure_fin': '11:00'},
+    ]}
+
+
+def etudiant(test):
+    return {'pk': test.etudiant.pk}
+
+
+def numero(test):
+    """Numéro unique par appel : chaque cas est mesuré deux fois"""
+    test.numero += 1
+    return test.numero
+
+
+def nouvel_etudiant(test):
+    """Étudiant sans paiement, inscription ni justificatif"""
+    n = numero(test)
+    return Etudiant.objects.create(
+        matricule=f'NEW{n:05d}', nom=f'Nouveau{n}', prenom=f'Prenom{n}',
+        filiere=test.filiere, niveau=test.niveau
+    )
+
+
+def certificat():
+    return SimpleUploadedFile('certificat.pdf', b'%PDF-1.4 test', content_type='application/pdf')
+
+
+def a_supprimer(creer):
+    """kwargs d'une suppression : objet jetable créé avant la mesure"""
+    return lambda test: {'pk': creer(test).pk}
+
+
+def releve_bancaire(test):
+    """Relevé couvrant tous les étudiants, avec des montants différents à chaque appel"""
+    test.versements += 1
+    lignes = ['matricule;montant'] + [
+        f'{matricule};{50000 + test.versements}'
+        for matricule in Etudiant.objects.order_by('pk').values_list('matricule', flat=True)
+    ]
+    return {'fichier': SimpleUploadedFile('releve.csv', '\n'.join(lignes).encode('utf-8'))}
+
+
+BUDGETS = [
+    # Pages publiques et authentification
+    cas('home', role=None, budget=2),
+    cas('login', role=None, budget=2),
+    cas('password_reset', role=None, budget=2),
+    cas('password_reset_done', role=None, budget=2),
+    cas('password_reset_complete', role=None, budget=2),
+    cas('password_change', budget=8),
+    cas('password_change_done', budget=8),
+
+    # Tableaux de bord
+    cas('dashboard', budget=20),
+    cas('dashboard_stats', budget=15),
+    cas('operations', budget=15),
+    cas('student_dashboard', role='etudiant', budget=12),
+    cas('student_examens', role='etudiant', budget=12),
+    cas('student_examens_ical', role=None, budget=4,
+        kwargs=lambda test: {'token': TimetableService.get_ical_token(test.etudiant)}),
+    cas('student_qr', role='etudiant', budget=12),
+    cas('download_qr', role='etudiant', budget=8),
+    cas('generate_qr_code_api', role='etudiant', budget=8),
+    cas('add_justificatif', role='etudiant', budget=15),
+    cas('add_justificatif_examen', role='etudiant', budget=15, kwargs=examen_id),
+    cas('profile', budget=12),
+    cas('documentation', budget=8),
+
+    # Examens et scan
+    cas('examen_list', budget=15),
+    cas('examen_list1', budget=15),
+    cas('examen_detail', budget=20, kwargs=examen),
+    cas('examen_rapport', budget=15, kwargs=examen),
+    cas('examen_create', budget=15),
+    cas('examen_update', budget=15, kwargs=examen),
+    cas('examen_delete', budget=10, kwargs=examen),
+    cas('scan_interface', role='surveillant', budget=15),
+    cas('scan_examen', role='surveillant', budget=15, kwargs=examen_id),
+    cas('scan_events_since', role='surveillant', budget=10, kwargs=examen_id),
+
+    # CRUD
+    cas('annee_list', budget=10),
+    cas('annee_create', budget=8),
+    cas('annee_update', budget=10, kwargs=lambda test: {'pk': test.annee.pk}),
+    cas('annee_delete', budget=10, kwargs=lambda test: {'pk': test.annee.pk}),
+    cas('filiere_list', budget=10),
+    cas('filiere_create', budget=8),
+    cas('filiere_update', budget=10, kwargs=lambda test: {'pk': test.filiere.pk}),
+    cas('filiere_delete', budget=10, kwargs=lambda test: {'pk': test.filiere.pk}),
+    cas('niveau_list', budget=10),
+    cas('niveau_create', budget=8),
+    cas('niveau_update', budget=10, kwargs=lambda test: {'pk': test.niveau.pk}),
+    cas('niveau_delete', budget=10, kwargs=lambda test: {'pk': test.niveau.pk}),
+    cas('ue_list', budget=12),
+    cas('ue_create', budget=12),
+    cas('ue_update', budget=12, kwargs=lambda test: {'pk': test.ue.pk}),
+    cas('ue_delete', budget=10, kwargs=lambda test: {'pk': test.ue.pk}),
+    cas('etudiant_list', budget=12),
+    cas('etudiant_create', budget=12),
+    cas('etudiant_detail', budget=15, kwargs=etudiant),
+    cas('etudiant_update', budget=12, kwargs=etudiant),
+    cas('etudiant_delete', budget=10, kwargs=etudiant),
+    cas('paiement_list', budget=12),
+    cas('paiement_create', budget=12),
+    cas('paiement_update', budget=12, kwargs=lambda test: {'pk': test.paiement.pk}),
+    cas('paiement_delete', budget=10, kwargs=lambda test: {'pk': test.paiement.pk}),
+    cas('inscription_list', budget=12),
+    cas('inscription_create', budget=12),
+    cas('inscription_update', budget=12, kwargs=lambda test: {'pk': test.inscription.pk}),
+    cas('inscription_delete', budget=10, kwargs=lambda test: {'pk': test.inscription.pk}),
+    cas('salle_list', budget=10),
+    cas('salle_create', budget=8),
+    cas('salle_update', budget=10, kwargs=lambda test: {'pk': test.salle.pk}),
+    cas('salle_delete', budget=10, kwargs=lambda test: {'pk': test.salle.pk}),
+    cas('session_list', budget=10),
+    cas('session_create', budget=10),
+    cas('session_update', budget=10, kwargs=lambda test: {'pk': test.session.pk}),
+    cas('session_delete', budget=10, kwargs=lambda test: {'pk': test.session.pk}),
+
+    # API : routeur
+    cas('api-root', budget=6),
+    cas('anneeacademique-list', budget=10),
+    cas('anneeacademique-detail', budget=10, kwargs=lambda test: {'pk': test.annee.pk}),
+    cas('filiere-list', budget=10),
+    cas('filiere-detail', budget=10, kwargs=lambda test: {'pk': test.filiere.pk}),
+    cas('niveau-list', budget=10),
+    cas('niveau-detail', budget=10, kwargs=lambda test: {'pk': test.niveau.pk}),
+    cas('ue-list', budget=10),
+    cas('ue-detail', budget=10, kwargs=lambda test: {'pk': test.ue.pk}),
+    cas('salle-list', budget=10),
+    cas('salle-detail', budget=10, kwargs=lambda test: {'pk': test.salle.pk}),
+    cas('sessionexamen-list', budget=10),
+    cas('sessionexamen-detail', budget=10, kwargs=lambda test: {'pk': test.session.pk}),
+    cas('sessionexamen-doubles-reservations', budget=10, kwargs=lambda test: {'pk': test.session.pk}),
+    cas('etudiant-list', budget=12),
+    cas('etudiant-detail', budget=12, kwargs=etudiant),
+    cas('etudiant-my-profile', role='etudiant', budget=10),
+    cas('etudiant-qr-code', budget=12, kwargs=etudiant),
+    cas('etudiant-paiements', budget=12, kwargs=etudiant),
+    cas('etudiant-inscriptions', budget=12, kwargs=etudiant),
+    cas('examen-list', budget=15),
+    cas('examen-detail', budget=15, kwargs=examen),
+    cas('examen-scans', role='surveillant', budget=12, kwargs=examen),
+    cas('examen-scanner', role='surveillant', budget=25, kwargs=examen, methode='post',
+        data=lambda test: {'method': 'matricule', 'matricule': test.prochain_etudiant_a_scanner().matricule}),
+    cas('examen-rapport-presence', role='surveillant', budget=15, kwargs=examen),
+    cas('examen-export-presence-csv', role='surveillant', budget=15, kwargs=examen),
+    cas('examen-valider-planning', budget=10, methode='post', data=planning_session),
+    cas('examen-repartition', budget=10, kwargs=examen),
+    cas('controleacces-list', budget=12),
+    cas('controleacces-detail', budget=12, kwargs=lambda test: {'pk': test.controle.pk}),
+    cas('paiement-list', budget=12),
+    cas('paiement-detail', budget=12, kwargs=lambda test: {'pk': test.paiement.pk}),
+    cas('paiement-rapprochement', budget=17, methode='post', data=releve_bancaire),
+    cas('inscriptionue-list', budget=12),
+    cas('inscriptionue-detail', budget=12, kwargs=lambda test: {'pk': test.inscription.pk}),
+    cas('justificatifabsence-list', budget=12),
+    cas('justificatifabsence-detail', budget=12, kwargs=lambda test: {'pk': test.justificatif.pk}),
+    cas('justificatifabsence-mes-justificatifs', role='etudiant', budget=12),
+    cas('justificatifabsence-traitement', budget=15, methode='post',
+        kwargs=lambda test: {'pk': test.prochain_justificatif_en_attente().pk},
+        data=lambda test: {'statut': 'accepte', 'commentaire': 'ok'}),
+    cas('auditlog-list', budget=10),
+    cas('auditlog-detail', budget=10,
+        kwargs=lambda test: {'pk': test.admin.auditlog_set.order_by('pk').first().pk}),
+
+    # API : routeur, écritures (les suppressions portent sur un objet jetable)
+    cas('anneeacademique-list', budget=6, methode='post',
+        data=lambda test: {'code': f'{2100 + numero(test)}-{2101 + test.numero}'}),
+    cas('anneeacademique-detail', budget=7, methode='put', kwargs=lambda test: {'pk': test.annee.pk},
+        data=lambda test: {'code': '2025-2026', 'active': True}),
+    cas('anneeacademique-detail', budget=6, methode='patch', kwargs=lambda test: {'pk': test.annee.pk},
+        data=lambda test: {'active': True}),
+    cas('anneeacademique-detail', budget=10, methode='delete', kwargs=a_supprimer(
+        lambda test: AnneeAcademique.objects.create(code=f'{2100 + numero(test)}-{2101 + test.numero}'))),
+    cas('filiere-list', budget=6, methode='post',
+        data=lambda test: {'nom': 'Mathématiques', 'code': f'MAT{numero(test)}'}),
+    cas('filiere-detail', budget=7, methode='put', kwargs=lambda test: {'pk': test.filiere.pk},
+        data=lambda test: {'nom': 'Informatique', 'code': 'INF'}),
+    cas('filiere-detail', budget=6, methode='patch', kwargs=lambda test: {'pk': test.filiere.pk},
+        data=lambda test: {'nom': 'Informatique'}),
+    cas('filiere-detail', budget=8, methode='delete', kwargs=a_supprimer(
+        lambda test: Filiere.objects.create(nom='Mathématiques', code=f'MAT{numero(test)}'))),
+    cas('niveau-list', budget=7, methode='post',
+        data=lambda test: {'nom': f'M{numero(test)}', 'ordre': 100 + test.numero}),
+    cas('niveau-detail', budget=8, methode='put', kwargs=lambda test: {'pk': test.niveau.pk},
+        data=lambda test: {'nom': 'L1', 'ordre': 1}),
+    cas('niveau-detail', budget=7, methode='patch', kwargs=lambda test: {'pk': test.niveau.pk},
+        data=lambda test: {'nom': 'L1'}),
+    cas('niveau-detail', budget=8, methode='delete', kwargs=a_supprimer(
+        lambda test: Niveau.objects.create(nom=f'M{numero(test)}', ordre=100 + test.numero))),
+    cas('ue-list', budget=9, methode='post',
+        data=lambda test: {'code': f'INF2{numero(test):02d}', 'intitule': 'Réseaux', 'filiere': test.filiere.pk,
+                           'niveau': test.niveau.pk, 'semestre': 2}),
+    cas('ue-detail', budget=10, methode='put', kwargs=lambda test: {'pk': test.ue.pk},
+        data=lambda test: {'code': 'INF101', 'intitule': 'Algorithmique', 'filiere': test.filiere.pk,
+                           'niveau': test.niveau.pk, 'semestre': 1}),
+    cas('ue-detail', budget=7, methode='patch', kwargs=lambda test: {'pk': test.ue.pk},
+        data=lambda test: {'intitule': 'Algorithmique'}),
+    cas('ue-detail', budget=9, methode='delete', kwargs=a_supprimer(
+        lambda test: UE.objects.create(code=f'INF2{numero(test):02d}', intitule='Réseaux',
+                                       filiere=test.filiere, niveau=test.niveau, semestre=2))),
+    cas('salle-list', budget=6, methode='post',
+        data=lambda test: {'code': f'B{numero(test):03d}', 'capacite': 40}),
+    cas('salle-detail', budget=7, methode='put', kwargs=lambda test: {'pk': test.salle.pk},
+        data=lambda test: {'code': 'A001', 'capacite': 500, 'batiment': 'A'}),
+    cas('salle-detail', budget=6, methode='patch', kwargs=lambda test: {'pk': test.salle.pk},
+        data=lambda test: {'capacite': 500}),
+    cas('salle-detail', budget=8, methode='delete', kwargs=a_supprimer(
+        lambda test: Salle.objects.create(code=f'B{numero(test):03d}', capacite=40))),
+    cas('sessionexamen-list', budget=6, methode='post',
+        data=lambda test: {'nom': f'Rattrapage {numero(test)}', 'type_session': 'rattrapage',
+                           'annee_academique': test.annee.pk, 'date_debut': test.session.date_debut.isoformat(),
+                           'date_fin': test.session.date_fin.isoformat()}),
+    cas('sessionexamen-detail', budget=7, methode='put', kwargs=lambda test: {'pk': test.session.pk},
+        data=lambda test: {'nom': 'Session normale', 'type_session': 'normale', 'annee_academique': test.annee.pk,
+                           'date_debut': test.session.date_debut.isoformat(),
+                           'date_fin': test.session.date_fin.isoformat(), 'active': True}),
+    cas('sessionexamen-detail', budget=6, methode='patch', kwargs=lambda test: {'pk': test.session.pk},
+        data=lambda test: {'nom': 'Session normale'}),
+    cas('sessionexamen-detail', budget=7, methode='delete', kwargs=a_supprimer(
+        lambda test: SessionExamen.objects.create(
+            nom=f'Rattrapage {numero(test)}', type_session='rattrapage', annee_academique=test.annee,
+            date_debut=test.session.date_debut, date_fin=test.session.date_fin))),
+    cas('etudiant-list', budget=14, methode='post',
+        data=lambda test: {'matricule': f'NEW{numero(test):05d}', 'nom': 'Nouveau', 'prenom': 'Test',
+                           'filiere': test.filiere.pk, 'niveau': test.niveau.pk}),
+    cas('etudiant-detail', budget=10, methode='put', kwargs=etudiant,
+        data=lambda test: {'matricule': test.etudiant.matricule, 'nom': test.etudiant.nom,
+                           'prenom': test.etudiant.prenom, 'filiere': test.filiere.pk, 'niveau': test.niveau.pk}),
+    cas('etudiant-detail', budget=7, methode='patch', kwargs=etudiant,
+        data=lambda test: {'nom': test.etudiant.nom}),
+    cas('etudiant-detail', budget=11, methode='delete', kwargs=a_supprimer(nouvel_etudiant)),
+    cas('examen-list', budget=13, methode='post',
+        data=lambda test: {'ue': test.ue.pk, 'annee_academique': test.annee.pk, 'session': test.session.pk,
+                           'date': test.examen_passe.date.isoformat(), 'heure_debut': '14:00',
+                           'heure_fin': '16:00'}),
+    cas('examen-detail', budget=20, methode='put', kwargs=examen,
+        data=lambda test: {'ue': test.ue.pk, 'annee_academique': test.annee.pk, 'session': test.session.pk,
+                           'date': test.examen.date.isoformat(), 'heure_debut': '00:00', 'heure_fin': '23:59',
+                           'salle': test.salle.pk, 'surveillant': test.surveillant.pk}),
+    cas('examen-detail', budget=15, methode='patch', kwargs=examen,
+        data=lambda test: {'type_examen': 'normal'}),
+    cas('examen-detail', budget=11, methode='delete', kwargs=a_supprimer(
+        lambda test: Examen.objects.create(
+            ue=test.ue, annee_academique=test.annee, session=test.session, date=test.examen_passe.date,
+            heure_debut=time(14, 0), heure_fin=time(16, 0)))),
+    cas('examen-repartition', budget=17, methode='post', kwargs=examen,
+        data=lambda test: {'ordre': 'matricule', 'salles': [test.salle.pk]}),
+    cas('paiement-list', budget=11, methode='post',
+        data=lambda test: {'etudiant': nouvel_etudiant(test).pk, 'annee_academique': test.annee.pk,
+                           'montant': 50000, 'montant_attendu': 50000, 'est_regle': True}),
+    cas('paiement-detail', budget=12, methode='put', kwargs=lambda test: {'pk': test.paiement.pk},
+        data=lambda test: {'etudiant': test.paiement.etudiant_id, 'annee_academique': test.annee.pk,
+                           'montant': 50000, 'montant_attendu': 50000, 'est_regle': True}),
+    cas('paiement-detail', budget=10, methode='patch', kwargs=lambda test: {'pk': test.paiement.pk},
+        data=lambda test: {'montant': 50000}),
+    cas('paiement-detail', budget=9, methode='delete', kwargs=a_supprimer(
+        lambda test: Paiement.objects.create(etudiant=nouvel_etudiant(test), annee_academique=test.annee))),
+    cas('inscriptionue-list', budget=10, methode='post',
+        data=lambda test: {'etudiant': nouvel_etudiant(test).pk, 'ue': test.ue.pk,
+                           'annee_academique': test.annee.pk}),
+    cas('inscriptionue-detail', budget=10, methode='put', kwargs=lambda test: {'pk': test.inscription.pk},
+        data=lambda test: {'etudiant': test.inscription.etudiant_id, 'ue': test.ue.pk,
+                           'annee_academique': test.annee.pk, 'est_autorise_examen': True}),
+    cas('inscriptionue-detail', budget=7, methode='patch', kwargs=lambda test: {'pk': test.inscription.pk},
+        data=lambda test: {'est_autorise_examen': True}),
+    cas('inscriptionue-detail', budget=7, methode='delete', kwargs=a_supprimer(
+        lambda test: InscriptionUE.objects.create(
+            etudiant=nouvel_etudiant(test), ue=test.ue, annee_academique=test.annee))),
+    cas('justificatifabsence-list', budget=11, methode='post',
+        data=lambda test: {'etudiant': nouvel_etudiant(test).pk, 'examen': test.examen_passe.pk,
+                           'type_justificatif': 'medical', 'fichier': certificat()}),
+    cas('justificatifabsence-detail', budget=10, methode='put', kwargs=lambda test: {'pk': test.justificatif.pk},
+        data=lambda test: {'etudiant': test.justificatif.etudiant_id, 'examen': test.examen_passe.pk,
+                           'type_justificatif': 'medical', 'fichier': certificat(),
+                           'description': 'Certificat médical'}),
+    cas('justificatifabsence-detail', budget=7, methode='patch', kwargs=lambda test: {'pk': test.justificatif.pk},
+        data=lambda test: {'description': 'Certificat médical'}),
+    cas('justificatifabsence-detail', budget=7, methode='delete', kwargs=a_supprimer(
+        lambda test: JustificatifAbsence.objects.create(
+            etudiant=nouvel_etudiant(test), examen=test.examen_passe, fichier='justificatifs/test.pdf'))),
+
+    # API : vues spécifiques
+    cas('api_token_auth', role=None, budget=10, methode='post',
+        data=lambda test: {'username': 'admin', 'password': MOT_DE_PASSE}),
+    cas('current_user', budget=8),
+    cas('statistiques', budget=20),
+    cas('scan_rapide', role='surveillant', budget=15),
+    cas('scan_examen_api', role='surveillant', budget=25, kwargs=examen_id, methode='post',
+        data=lambda test: {'qr_data': json.dumps({'matricule': test.prochain_etudiant_a_scanner().matricule}),
+                           'scan_method': 'qrcode'}),
+    cas('verify_qr', role=None, budget=8, methode='post',
+        data=lambda test: {'examen_id': test.examen.pk,
+                           'qr_data': json.dumps({'matricule': test.etudiant.matricule,
+                                                  'qr_token': str(test.etudiant.qr_token)})}),
+]
+
+# URLs nommées sans budget, avec la raison
+EXCLUSIONS = {
+    'logout': "détruit la session de test",
+    'password_reset_confirm': "nécessite un jeton de réinitialisation valide",
+    'change_password': "modifie le mot de passe utilisé par api_token_auth",
+}
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    AUDIT_ASYNC=False,
+    PROFILING_ENABLED=False,
+    SECURE_SSL_REDIRECT=False,
+)
+class QueryBudgetTests(TestCase):
+    """Nombre de requêtes SQL borné et indépendant du volume de données"""
+
+    def setUp(self):
+        cache.clear()
+        aujourdhui = timezone.localdate()
+
+        self.annee = AnneeAcademique.objects.create(code='2025-2026')
+        self.filiere = Filiere.objects.create(nom='Informatique', code='INF')
+        self.niveau = Niveau.objects.create(nom='L1', ordre=1)
+        self.ue = UE.objects.create(
+            code='INF101', intitule='Algorithmique', filiere=self.filiere, niveau=self.niveau, semestre=1
+        )
+        self.salle = Salle.objects.create(code='A001', capacite=500, batiment='A')
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', MOT_DE_PASSE)
+        self.admin.groups.add(Group.objects.get_or_create(name='Administrateur')[0])
+        self.surveillant = User.objects.create_user('surveillant', password=MOT_DE_PASSE)
+        surveillants = Group.objects.get_or_create(name='Surveillant')[0]
+        surveillants.permissions.add(Permission.objects.get(codename='can_scan_qr'))
+        self.surveillant.groups.add(surveillants)
+        # Jeton déjà émis : api_token_auth ne mesure pas sa création au premier appel
+        Token.objects.create(user=self.admin)
+
+        self.session = SessionExamen.objects.create(
+            nom='Session normale', type_session='normale', annee_academique=self.annee,
+            date_debut=aujourdhui - timedelta(days=7), date_fin=aujourdhui + timedelta(days=7), active=True
+        )
+        # Examen en cours toute la journée (les scans sont autorisés)
+        self.examen = Examen.objects.create(
+            ue=self.ue, annee_academique=self.annee, session=self.session, date=aujourdhui,
+            heure_debut=time(0, 0), heure_fin=time(23, 59), salle=self.salle,
+            surveillant=self.surveillant, created_by=self.admin
+        )
+        self.examen_passe = Examen.objects.create(
+            ue=self.ue, annee_academique=self.annee, session=self.session,
+            date=aujourdhui - timedelta(days=3), heure_debut=time(8, 0), heure_fin=time(10, 0),
+            salle=self.salle, surveillant=self.surveillant, created_by=self.admin
+        )
+
+        self.ajouter_etudiants(ETUDIANTS_DEPART)
+        self.versements = 0
+        self.numero = 0
+
+        # Justificatifs déposés par les cas d'écriture : hors de MEDIA_ROOT
+        medias = tempfile.TemporaryDirectory()
+        self.addCleanup(medias.cleanup)
+        reglages = self.settings(MEDIA_ROOT=medias.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        self.etudiant = Etudiant.objects.select_related('user').order_by('pk').first()
+        self.paiement = Paiement.objects.order_by('pk').first()
+        self.inscription = InscriptionUE.objects.order_by('pk').first()
+        self.controle = ControleAcces.objects.order_by('pk').first()
+        self.justificatif = JustificatifAbsence.objects.order_by('pk').first()
+
+        self.utilisateurs = {
+            'admin': self.admin,
+            'surveillant': self.surveillant,
+            'etudiant': self.etudiant.user,
+        }
+
+    def ajouter_etudiants(self, nombre):
+        """Étudiants inscrits et en règle ; un sur deux scanné, un sur trois avec justificatif"""
+        depart = Etudiant.objects.count()
+        for index in range(depart, depart + nombre):
+            etudiant = Etudiant.objects.create(
+                matricule=f'ETU{index:05d}', nom=f'Nom{index}', prenom=f'Prenom{index}',
+                email=f'etu{index}@example.com', filiere=self.filiere, niveau=self.niveau
+            )
+            Paiement.objects.create(
+                etudiant=etudiant, annee_academique=self.annee,
+                montant=50000, montant_attendu=50000, est_regle=True, date_paiement=timezone.now()
+            )
+            InscriptionUE.objects.create(
+                etudiant=etudiant, ue=self.ue, annee_academique=self.annee, est_autorise_examen=True
+            )
+            if index % 2 == 0:
+                ControleAcces.objects.create(
+                    examen=self.examen, etudiant=etudiant, scanned_by=self.surveillant, scan_method='qr'
+                )
+            if index % 3 == 0:
+                JustificatifAbsence.objects.create(
+                    etudiant=etudiant, examen=self.examen_passe, fichier='justificatifs/test.pdf',
+                    description='Certificat médical'
+                )
+
+    def prochain_etudiant_a_scanner(self):
+        return Etudiant.objects.exclude(controleacces__examen=self.examen).order_by('pk').first()
+
+    def prochain_justificatif_en_attente(self):
+        return JustificatifAbsence.objects.filter(statut='en_attente').order_by('pk').first()
+
+    def mesurer(self, cas):
+        """Nombre de requêtes d'un appel, caches vidés et client neuf"""
+        cache.clear()
+        client = Client()
+        if cas.role:
+            client.force_login(self.utilisateurs[cas.role])
+
+        # Les écritures (et les objets qu'elles visent) sont annulées :
+        # chaque cas part du même référentiel
+        with transaction.atomic():
+            url = reverse(cas.nom, kwargs=cas.kwargs(self) if cas.kwargs else None)
+            data = cas.data(self) if cas.data else {}
+
+            if cas.methode == 'get':
+                corps, type_contenu = None, None
+            elif any(isinstance(valeur, File) for valeur in data.values()):
+                corps, type_contenu = encode_multipart(BOUNDARY, data), MULTIPART_CONTENT
+            else:
+                corps, type_contenu = json.dumps(data), 'application/json'
+
+            with CaptureQueriesContext(connection) as requetes:
+                if corps is None:
+                    response = client.get(url)
+                else:
+                    response = client.generic(cas.methode.upper(), url, corps, content_type=type_contenu)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+
+        # Le budget mesure la vue elle-même, pas un refus ou une erreur
+        self.assertLess(
+            response.status_code, 400,
+            f"{cas.nom} {cas.methode.upper()} ({url}) : statut {response.status_code}\n"
+            + response.content.decode(errors='replace')[:500]
+        )
+        return len(requetes), [requete['sql'] for requete in requetes.captured_queries]
+
+    def test_budgets_de_requetes(self):
+        depart = {(cas.nom, cas.methode): self.mesurer(cas) for cas in BUDGETS}
+
+        self.ajouter_etudiants(ETUDIANTS_AJOUTES)
+
+        for cas in BUDGETS:
+            libelle = f"{cas.nom} ({cas.methode.upper()})"
+            with self.subTest(url=libelle):
+                nombre, sql = self.mesurer(cas)
+                nombre_depart, sql_depart = depart[cas.nom, cas.methode]
+                self.assertEqual(
+                    nombre, nombre_depart,
+                    f"{libelle} : {nombre_depart} requêtes avec {ETUDIANTS_DEPART} étudiants, "
+                    f"{nombre} avec {ETUDIANTS_DEPART + ETUDIANTS_AJOUTES} (requête par ligne ?)\n"
+                    + "\n".join(difflib.unified_diff(sql_depart, sql, lineterm=''))
+                )
+                self.assertLessEqual(
+                    nombre, cas.budget,
+                    f"{libelle} : {nombre} requêtes pour un budget de {cas.budget}\n" + "\n".join(sql)
+                )
+
+    def test_toutes_les_urls_ont_un_budget(self):
+        def noms(patterns):
+            for pattern in patterns:
+                if isinstance(pattern, URLResolver):
+                    if not pattern.namespace:
+                        yield from noms(pattern.url_patterns)
+                elif isinstance(pattern, URLPattern) and pattern.name:
+                    yield pattern.name
+
+        urls = set(noms(get_resolver('core.urls').url_patterns))
+        couvertes = {cas.nom for cas in BUDGETS} | set(EXCLUSIONS)
+        self.assertEqual(urls - couvertes, set(), "URLs sans budget de requêtes")
+
+    def test_toutes_les_actions_du_routeur_ont_un_budget(self):
+        """Chaque couple (route, méthode HTTP) servi par un ViewSet a son budget"""
+        actions = {
+            (route.name.format(basename=basename), methode)
+            for _, viewset, basename in router.registry
+            for route in router.get_routes(viewset)
+            for methode, action in route.mapping.items()
+            if hasattr(viewset, action) and methode in viewset.http_method_names
+        }
+        couvertes = {(cas.nom, cas.methode) for cas in BUDGETS}
+        self.assertEqual(actions - couvertes, set(), "Actions du routeur sans budget de requêtes")
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    AUDIT_ASYNC=False,
+    PROFILING_ENABLED=False,
+    SECURE_SSL_REDIRECT=False,
+)
+class ServiceTestCase(TestCase):
+    """Référentiel minimal partagé par les tests de comportement des services"""
+
+    def setUp(self):
+        cache.clear()
+        self.annee = AnneeAcademique.objects.create(code='2025-2026')
+        self.filiere = Filiere.objects.create(nom='Informatique', code='INF')
+        self.niveau = Niveau.objects.create(nom='L1', ordre=1)
+        # Un lundi à venir : une session d'un jour ouvré
+        aujourdhui = timezone.localdate()
+        self.lundi = aujourdhui + timedelta(days=7 - aujourdhui.weekday())
+        self.session = SessionExamen.objects.create(
+            nom='Session normale', type_session='normale', annee_academique=self.annee,
+            date_debut=self.lundi, date_fin=self.lundi
+        )
+
+    def creer_ue(self, code):
+        return UE.objects.create(
+            code=code, intitule=code, filiere=self.filiere, niveau=self.niveau, semestre=1
+        )
+
+    def creer_etudiant(self, matricule, ues=(), **kwargs):
+        """Étudiant autorisé à composer dans chacune des UEs données"""
+        etudiant = Etudiant.objects.create(
+            matricule=matricule, nom=f'Nom {matricule}', prenom=f'Prenom {matricule}',
+            filiere=self.filiere, niveau=self.niveau, **kwargs
+        )
+        for ue in ues:
+            InscriptionUE.objects.create(
+                etudiant=etudiant, ue=ue, annee_academique=self.annee, est_autorise_examen=True
+            )
+        return etudiant
+
+    def creer_examen(self, ue, **kwargs):
+        valeurs = {'date': self.lundi, 'heure_debut': time(8, 0), 'heure_fin': time(10, 0)}
+        valeurs.update(kwargs)
+        return Examen.objects.create(
+            ue=ue, annee_academique=self.annee, session=self.session, **valeurs
+        )
+
+
+class ExamSchedulerTests(ServiceTestCase):
+    """Coloration du graphe de conflits par le planificateur de session"""
+
+    def setUp(self):
+        super().setUp()
+        # Deux salles : deux examens au plus sur un même créneau
+        Salle.objects.create(code='A001', capacite=50)
+        Salle.objects.create(code='A002', capacite=50)
+        self.ues = [self.creer_ue(f'UE{numero}') for numero in range(5)]
+        self.numero = 0
+
+    def relier(self, ue_a, ue_b, nombre):
+        """`nombre` étudiants inscrits aux deux UEs (arête du graphe de conflits)"""
+        for _ in range(nombre):
+            self.numero += 1
+            self.creer_etudiant(f'ETU{self.numero:05d}', ues=(ue_a, ue_b))
+
+    def test_graphe_de_conflits(self):
+        a, b, c = self.ues[:3]
+        self.relier(a, b, 2)
+        self.relier(b, c, 3)
+        for ue in (a, b, c):
+            self.creer_examen(ue)
+
+        effectifs, communs = ExamSchedulerService.conflict_graph(self.session)
+
+        self.assertEqual(effectifs, {a.pk: 2, b.pk: 5, c.pk: 3})
+        self.assertEqual(communs, {(a.pk, b.pk): 2, (b.pk, c.pk): 3})
+
+    def test_coloration_sans_conflit(self):
+        # Cycle impair : 3 couleurs nécessaires, 4 créneaux disponibles
+        for i in range(5):
+            self.relier(self.ues[i], self.ues[(i + 1) % 5], 2)
+        for ue in self.ues:
+            self.creer_examen(ue)
+
+        planifies, rapport = ExamSchedulerService.plan(self.session, seed=1)
+
+        self.assertEqual(rapport['creneaux'], 4)
+        self.assertEqual(rapport['planifies'], 5)
+        self.assertEqual(rapport['conflits_simultanes'], 0)
+        self.assertEqual(rapport['chevauchements_salle'], [])
+        creneau = {examen.ue_id: examen.heure_debut for examen in planifies}
+        for i in range(5):
+            self.assertNotEqual(creneau[self.ues[i].pk], creneau[self.ues[(i + 1) % 5].pk])
+
+    def test_coloration_minimale(self):
+        # Graphe complet à 5 sommets sur 4 créneaux : une paire partage
+        # forcément un créneau, au mieux celle qui a le moins d'étudiants communs
+        for i, ue_a in enumerate(self.ues):
+            for ue_b in self.ues[i + 1:]:
+                self.relier(ue_a, ue_b, 1 if (ue_a, ue_b) == (self.ues[0], self.ues[1]) else 3)
+        for ue in self.ues:
+            self.creer_examen(ue)
+
+        planifies, rapport = ExamSchedulerService.plan(self.session, seed=1)
+
+        self.assertEqual(rapport['planifies'], 5)
+        self.assertEqual(rapport['conflits_simultanes'], 1)
+        creneau = {examen.ue_id: examen.heure_debut for examen in planifies}
+        self.assertEqual(creneau[self.ues[0].pk], creneau[self.ues[1].pk])
+        self.assertEqual(len(set(creneau.values())), 4)
+
+    def test_enregistrement(self):
+        self.relier(self.ues[0], self.ues[1], 2)
+        examens = [self.creer_examen(ue) for ue in self.ues[:2]]
+
+        ExamSchedulerService.schedule(self.session, seed=1)
+
+        debuts = set(
+            Examen.objects.filter(pk__in=[examen.pk for examen in examens])
+            .values_list('heure_debut', flat=True)
+        )
+        self.assertEqual(len(debuts), 2)
+        self.assertFalse(Examen.objects.filter(session=self.session, salle__isnull=True).exists())
+
+
+class DoubleBookingTests(ServiceTestCase):
+    """Étudiants convoqués à deux examens qui se chevauchent"""
+
+    def test_chevauchements(self):
+        a, b, c, d = (self.creer_ue(code) for code in ('UEA', 'UEB', 'UEC', 'UED'))
+        examen_a = self.creer_examen(a, heure_debut=time(8, 0), heure_fin=time(10, 0))
+        examen_b = self.creer_examen(b, heure_debut=time(9, 0), heure_fin=time(11, 0))
+        examen_c = self.creer_examen(c, heure_debut=time(10, 0), heure_fin=time(12, 0))
+        # Même horaire que A, mais le lendemain
+        self.creer_examen(d, date=self.lundi + timedelta(days=1), heure_debut=time(8, 0), heure_fin=time(10, 0))
+
+        premier = self.creer_etudiant('ETU00001', ues=(a, b))
+        self.creer_etudiant('ETU00002', ues=(a, c))  # C commence quand A finit
+        troisieme = self.creer_etudiant('ETU00003', ues=(a, b, c))
+        self.creer_etudiant('ETU00004', ues=(a, d))
+
+        resultat = ExamSchedulerService.double_bookings(self.session)
+
+        self.assertEqual(resultat['etudiants'], 2)
+        self.assertEqual(
+            [(paire['examens'], paire['etudiants']) for paire in resultat['paires']],
+            [([examen_a.pk, examen_b.pk], 2), ([examen_b.pk, examen_c.pk], 1)],
+        )
+        self.assertEqual(
+            sorted((conflit['etudiant_id'], conflit['examen']['id']) for conflit in resultat['conflits']),
+            [(premier.pk, examen_b.pk), (troisieme.pk, examen_b.pk), (troisieme.pk, examen_c.pk)],
+        )
+
+    def test_sans_chevauchement(self):
+        a, b = self.creer_ue('UEA'), self.creer_ue('UEB')
+        self.creer_examen(a, heure_debut=time(8, 0), heure_fin=time(10, 0))
+        self.creer_examen(b, heure_debut=time(10, 30), heure_fin=time(12, 30))
+        self.creer_etudiant('ETU00001', ues=(a, b))
+
+        resultat = ExamSchedulerService.double_bookings(self.session)
+
+        self.assertEqual(resultat['etudiants'], 0)
+        self.assertEqual(resultat['paires'], [])
+
+
+class PlacementTests(ServiceTestCase):
+    """Répartition d'un examen entre plusieurs salles"""
+
+    def setUp(self):
+        super().setUp()
+        self.ue = self.creer_ue('INF101')
+        self.petite = Salle.objects.create(code='B001', capacite=1)
+        self.salles = [
+            Salle.objects.create(code='A001', capacite=2),
+            Salle.objects.create(code='A002', capacite=2),
+            self.petite,
+        ]
+        self.examen = self.creer_examen(self.ue, salle=self.petite)
+        # Créés dans le désordre : la place suit le matricule
+        self.etudiants = {
+            matricule: self.creer_etudiant(matricule, ues=(self.ue,))
+            for matricule in ('ETU00004', 'ETU00001', 'ETU00005', 'ETU00003', 'ETU00002')
+        }
+
+    def repartir(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PlacementService.allocate(self.examen, salles=self.salles, **kwargs)
+
+    def places(self):
+        return {
+            matricule: PlacementService.get_place(self.examen, etudiant.pk)
+            for matricule, etudiant in self.etudiants.items()
+        }
+
+    def test_repartition_par_matricule(self):
+        repartitions = self.repartir()
+
+        self.assertEqual([repartition.salle.code for repartition in repartitions], ['A001', 'A002', 'B001'])
+        self.assertEqual(self.places(), {
+            'ETU00001': {'salle': 'A001', 'place': 1},
+            'ETU00002': {'salle': 'A001', 'place': 2},
+            'ETU00003': {'salle': 'A002', 'place': 1},
+            'ETU00004': {'salle': 'A002', 'place': 2},
+            'ETU00005': {'salle': 'B001', 'place': 1},
+        })
+        # La première salle devient la salle principale de l'examen
+        self.examen.refresh_from_db()
+        self.assertEqual(self.examen.salle.code, 'A001')
+
+    def test_nouvelle_repartition(self):
+        self.repartir()
+        self.repartir(ordre='aleatoire', seed=3)
+
+        places = self.places().values()
+        self.assertEqual(RepartitionSalle.objects.filter(examen=self.examen).count(), 3)
+        self.assertEqual(
+            sorted((place['salle'], place['place']) for place in places),
+            [('A001', 1), ('A001', 2), ('A002', 1), ('A002', 2), ('B001', 1)],
+        )
+
+    def test_capacite_insuffisante(self):
+        self.creer_etudiant('ETU00006', ues=(self.ue,))
+
+        with self.assertRaises(ValidationError):
+            self.repartir()
+        self.assertFalse(RepartitionSalle.objects.filter(examen=self.examen).exists())
+
+    def test_etudiant_sans_place(self):
+        self.repartir()
+        retardataire = self.creer_etudiant('ETU00000', ues=(self.ue,))
+        principale, secondaire = self.salles[:2]
+
+        self.assertEqual(
+            PlacementService.get_place(self.examen, retardataire.pk), {'salle': 'A001', 'place': None}
+        )
+        # Attendu à la porte de la salle principale uniquement
+        porte_principale = RosterService.get_roster(self.examen, principale)['etudiants_data']
+        porte_secondaire = RosterService.get_roster(self.examen, secondaire)['etudiants_data']
+        self.assertEqual(
+            sorted((ligne['etudiant'].matricule, ligne['sans_place']) for ligne in porte_principale),
+            [('ETU00000', True), ('ETU00001', False), ('ETU00002', False)],
+        )
+        self.assertEqual(
+            sorted(ligne['etudiant'].matricule for ligne in porte_secondaire), ['ETU00003', 'ETU00004']
+        )
+
+    def test_salles_de_la_repartition_occupees(self):
+        self.repartir()
+        secondaire = self.salles[1]
+        autre = Examen(
+            ue=self.creer_ue('INF102'), annee_academique=self.annee, salle=secondaire,
+            date=self.lundi, heure_debut=time(9, 0), heure_fin=time(11, 0),
+        )
+
+        self.assertEqual(
+            list(Examen.chevauchements(secondaire, self.lundi, time(9, 0), time(11, 0))), [self.examen]
+        )
+        self.assertEqual(ExamenService.valider_planning([autre]), [(autre, self.examen)])
+
+        # Le planificateur d'une autre session ne place rien dans ces salles à 8h
+        rattrapage = SessionExamen.objects.create(
+            nom='Rattrapage', type_session='rattrapage', annee_academique=self.annee,
+            date_debut=self.lundi, date_fin=self.lundi
+        )
+        Examen.objects.create(
+            ue=autre.ue, annee_academique=self.annee, session=rattrapage,
+            date=self.lundi, heure_debut=time(8, 0), heure_fin=time(10, 0),
+        )
+        planifies, _ = ExamSchedulerService.plan(rattrapage, iterations=0)
+        self.assertEqual(planifies[0].heure_debut, time(10, 30))
+
+    def test_examen_deplace(self):
+        self.repartir()
+        self.assertTrue(PlacementService.get_places(self.examen.pk))
+
+        # Changer de surveillant garde la répartition, changer d'horaire la supprime
+        self.examen.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.examen.surveillant = User.objects.create_user('surveillant')
+            self.examen.save()
+        self.assertTrue(PlacementService.get_places(self.examen.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.examen.heure_debut, self.examen.heure_fin = time(14, 0), time(16, 0)
+            self.examen.save()
+        self.assertFalse(RepartitionSalle.objects.filter(examen=self.examen).exists())
+        self.assertEqual(PlacementService.get_places(self.examen.pk), {})
+
+    def test_planification_deplace_l_examen(self):
+        self.repartir()
+        self.assertTrue(PlacementService.get_places(self.examen.pk))
+
+        # Aucune salle ne suffit : l'examen passe dans la plus grande (A002)
+        with self.captureOnCommitCallbacks(execute=True):
+            planifies, _ = ExamSchedulerService.schedule(self.session, iterations=0)
+        self.assertEqual(planifies[0].salle.code, 'A002')
+        self.assertFalse(RepartitionSalle.objects.filter(examen=self.examen).exists())
+        self.assertEqual(PlacementService.get_places(self.examen.pk), {})
+
+
+class TokenCacheTests(ServiceTestCase):
+    """Révocation des jetons d'API mis en cache par CachedTokenAuthentication"""
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', MOT_DE_PASSE)
+        self.token = Token.objects.create(user=self.admin)
+        self.url = reverse('ue-list')
+
+    def appeler(self, key=None):
+        # Jeton refusé : 403 et non 401, SessionAuthentication étant la
+        # première classe d'authentification (pas d'en-tête WWW-Authenticate)
+        return Client().get(self.url, HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+
+    def test_jeton_mis_en_cache(self):
+        self.assertEqual(self.appeler().status_code, 200)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+        # Jeton en cache : ni authtoken_token ni auth_user ne sont relus
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(self.appeler().status_code, 200)
+        self.assertFalse([
+            requete['sql'] for requete in requetes.captured_queries if 'authtoken_token' in requete['sql']
+        ])
+
+    def test_jeton_supprime(self):
+        self.appeler()
+        key = self.token.key  # clé primaire, remise à None par delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+
+        self.assertIsNone(token_cache.get(key))
+        self.assertEqual(self.appeler(key).status_code, 403)
+
+    def test_jeton_regenere(self):
+        self.appeler()
+        ancien = self.token.key
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            nouveau = Token.objects.create(user=self.admin)
+
+        self.assertEqual(self.appeler(ancien).status_code, 403)
+        self.assertEqual(self.appeler(nouveau.key).status_code, 200)
+
+    def test_compte_desactive(self):
+        self.appeler()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_active = False
+            self.admin.save()
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.appeler().status_code, 403)
+
+
+class MultiAuthBackendTests(ServiceTestCase):
+    """Connexion par nom d'utilisateur, matricule ou email"""
+
+    def setUp(self):
+        super().setUp()
+        self.etudiant = self.creer_etudiant('ETU00001', email='etudiant@example.com')
+        self.user = self.etudiant.user
+        self.user.set_password(MOT_DE_PASSE)
+        self.user.save()
+
+    def connecter(self, identifiant, mot_de_passe=MOT_DE_PASSE):
+        return authenticate(None, username=identifiant, password=mot_de_passe)
+
+    def test_identifiants(self):
+        for identifiant in ('etu_etu00001', 'ETU00001', 'etudiant@example.com'):
+            with self.subTest(identifiant=identifiant):
+                self.assertEqual(self.connecter(identifiant), self.user)
+
+    def test_echecs(self):
+        self.assertIsNone(self.connecter('ETU00001', 'mauvais'))
+        self.assertIsNone(self.connecter('ETU99999'))
+        self.assertIsNone(self.connecter(''))
+
+    def test_priorite(self):
+        # Le nom d'utilisateur prime sur le matricule, le matricule sur l'email
+        homonyme = User.objects.create_user('ETU00001', password=MOT_DE_PASSE)
+        User.objects.create_user('secretariat', email='ETU00001', password=MOT_DE_PASSE)
+        self.assertEqual(self.connecter('ETU00001'), homonyme)
+
+        homonyme.delete()
+        self.assertEqual(self.connecter('ETU00001'), self.user)
+
+    def test_compte_desactive(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(self.connecter('ETU00001'))
+        response = Client().post(
+            reverse('api_token_auth'), {'username': 'ETU00001', 'password': MOT_DE_PASSE}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_jeton_par_matricule(self):
+        response = Client().post(
+            reverse('api_token_auth'), {'username': 'ETU00001', 'password': MOT_DE_PASSE}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=self.user).key)
+
+
+class TimetableTests(ServiceTestCase):
+    """Emplois du temps en cache et renommage d'une UE ou d'une salle"""
+
+    def setUp(self):
+        super().setUp()
+        self.ue = self.creer_ue('INF101')
+        self.salle = Salle.objects.create(code='A001', capacite=50)
+        self.examen = self.creer_examen(self.ue, salle=self.salle)
+        self.etudiant = self.creer_etudiant('ETU00001', ues=(self.ue,))
+        self.etag = TimetableService.get_timetable(self.etudiant)['etag']
+
+    def test_salle_renommee(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salle.code = 'B101'
+            self.salle.save()
+
+        timetable = TimetableService.get_timetable(self.etudiant)
+        self.assertEqual(timetable['examens'][0].salle.code, 'B101')
+        self.assertNotEqual(timetable['etag'], self.etag)
+        self.assertIn('LOCATION:B101', TimetableService.to_ical(self.etudiant, timetable))
+
+    def test_ue_renommee(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ue.intitule = 'Algorithmique avancée'
+            self.ue.save()
+
+        timetable = TimetableService.get_timetable(self.etudiant)
+        self.assertEqual(timetable['examens'][0].ue.intitule, 'Algorithmique avancée')
+        self.assertNotEqual(timetable['etag'], self.etag)
+
+
+class RoleServiceTests(ServiceTestCase):
+    """Rôles en cache après modification des groupes"""
+
+    def setUp(self):
+        super().setUp()
+        self.groupe = Group.objects.create(name='Administrateur')
+        self.user = User.objects.create_user('gestionnaire', password=MOT_DE_PASSE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.groupe)
+
+    def roles(self):
+        # Objet neuf à chaque lecture : seul le cache partagé entre requêtes compte
+        return RoleService.get_roles(User.objects.get(pk=self.user.pk))
+
+    def test_groupe_retire(self):
+        self.assertEqual(self.roles(), {'Administrateur'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.groupe)
+        self.assertEqual(self.roles(), set())
+
+    def test_groupe_supprime(self):
+        self.assertEqual(self.roles(), {'Administrateur'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groupe.delete()
+        self.assertEqual(self.roles(), set())
+
+    def test_groupe_renomme(self):
+        self.assertEqual(self.roles(), {'Administrateur'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groupe.name = 'Scolarité'
+            self.groupe.save()
+        self.assertEqual(self.roles(), {'Scolarité'})
+
+
+class ReconciliationTests(ServiceTestCase):
+    """Rapprochement d'un relevé bancaire avec les paiements"""
+
+    # Relevé sans identifiant d'opération : trois virements le même jour,
+    # dont deux lignes identiques
+    RELEVE = (
+        "Date opération;Libellé;Montant\n"
+        "01/10/2025;Frais ETU00001;25000\n"
+        "01/10/2025;Frais ETU00001;25000\n"
+        "01/10/2025;Frais ETU00002;10000\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.annee.active = True
+        self.annee.save()
+        self.etudiants = [self.creer_etudiant(f'ETU0000{numero}') for numero in (1, 2)]
+
+    def importer(self, releve=RELEVE):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ReconciliationService.reconcile(io.BytesIO(releve.encode('utf-8')), 'releve.csv')
+
+    def montants(self):
+        return [
+            Paiement.objects.get(etudiant=etudiant, annee_academique=self.annee).montant
+            for etudiant in self.etudiants
+        ]
+
+    def test_colonnes(self):
+        self.assertEqual(
+            ReconciliationService.find_columns(['date opération', 'libellé', 'montant']),
+            {'matricule': None, 'montant': 'montant', 'date': 'date opération',
+             'operation': None, 'reference': 'libellé'},
+        )
+        colonnes = ReconciliationService.find_columns([
+            'date valeur', 'n° opération', "type d'opération", 'montant débit', 'montant crédit',
+            'matricule', 'référence',
+        ])
+        self.assertEqual(colonnes['montant'], 'montant crédit')
+        self.assertEqual(colonnes['operation'], 'n° opération')
+        self.assertEqual(colonnes['date'], 'date valeur')
+        self.assertEqual(colonnes['reference'], 'référence')
+        # Une seule colonne de débit ne vaut pas montant
+        self.assertIsNone(ReconciliationService.find_columns(['matricule', 'débit'])['montant'])
+
+    def test_virements_du_meme_jour(self):
+        resultat = self.importer()
+
+        self.assertEqual(resultat['rapprochees'], 3)
+        self.assertEqual(resultat['deja_importees'], 0)
+        self.assertEqual(self.montants(), [50000, 10000])
+        self.assertEqual(VirementBancaire.objects.count(), 3)
+
+    def test_reimport_idempotent(self):
+        self.importer()
+        resultat = self.importer()
+
+        self.assertEqual(resultat['deja_importees'], 3)
+        self.assertEqual(resultat['modifies'], 0)
+        self.assertEqual(self.montants(), [50000, 10000])
+        self.assertEqual(VirementBancaire.objects.count(), 3)
+
+
+class AuthorizationTests(ServiceTestCase):
+    """Autorisations d'examen recalculées quand le statut de l'étudiant change"""
+
+    def setUp(self):
+        super().setUp()
+        self.etudiant = self.creer_etudiant('ETU00001', ues=(self.creer_ue('INF101'),))
+        Paiement.objects.create(
+            etudiant=self.etudiant, annee_academique=self.annee,
+            montant=100, montant_attendu=100, est_regle=True,
+        )
+
+    def changer_statut(self, statut):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.etudiant.statut = statut
+            self.etudiant.save()
+        return InscriptionUE.objects.get(etudiant=self.etudiant).est_autorise_examen
+
+    def test_changement_de_statut(self):
+        self.assertFalse(self.changer_statut('suspendu'))
+        self.assertTrue(self.changer_statut('actif'))
+
+    def test_autorisation_manuelle_conservee(self):
+        InscriptionUE.objects.filter(etudiant=self.etudiant).update(autorisation_manuelle=True)
+
+        self.assertTrue(self.changer_statut('exclu'))
@@ -77,10 +77,12 @@ urlpatterns = [
     
     # Tableau de bord principal (personnel/surveillants/enseignants)
     path('dashboard/', views.dashboard_view, name='dashboard'),
+    path('dashboard/stats/', views.dashboard_stats, name='dashboard_stats'),
     
     # Espace étudiant
     path('student/', views.student_dashboard, name='student_dashboard'),
     path('student/examens/', views.student_examens, name='student_examens'),
+    path('student/examens/<str:token>.ics', views.student_examens_ical, name='student_examens_ical'),
     
     # ============================================
     # GESTION DES EXAMENS
@@ -98,6 +100,7 @@ urlpatterns = [
     # Interface de scan (pour surveillants)
     path('scan/', views.scan_interface, name='scan_interface'),
     path('scan/<int:examen_id>/', views.scan_examen, name='scan_examen'),
+    path('scan/<int:examen_id>/scans/', views.scan_events_since, name='scan_events_since'),
     
     # ============================================
     # FONCTIONNALITÉS ÉTUDIANTS
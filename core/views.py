@@ -4,10 +4,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.generics import RetrieveAPIView, ListAPIView
+from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
 from django.db.models import Q, Count
 from django.http import HttpResponse
 from django.utils import timezone
+from django.urls import reverse
 import csv
 from django.contrib.auth import authenticate, login
 from .forms import *
@@ -24,9 +26,12 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login
 from django.contrib import messages
 from django.contrib.auth.decorators import permission_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import condition
 import datetime
+from django.conf import settings
 
 from .models import (
     Etudiant, Examen, ControleAcces, InscriptionUE,
@@ -42,7 +47,7 @@ from .serializers import (
     UESerializer, SalleSerializer, SessionExamenSerializer,
     AnneeAcademiqueSerializer, FiliereSerializer, NiveauSerializer,
     AuditLogSerializer, ScanSerializer, PresenceReportSerializer,
-    StatistiquesSerializer, UserSerializer
+    StatistiquesSerializer, UserSerializer, PlanningExamenSerializer, RepartitionSerializer
 )
 from .permissions import (
     IsAdministrateur, IsSurveillant, IsEnseignant, IsResponsableScolarite,
@@ -50,7 +55,10 @@ from .permissions import (
     IsOwnerOrAdmin, IsScanByUserOrAdmin, IsInSameFiliere
 )
 from .services import (
-    QRCodeService, ExamenService, ScanService, ReportingService
+    QRCodeService, ExamenService, ScanService, ReportingService,
+    DashboardSnapshotService, ScanEventService, CompteursService,
+    RosterService, TimetableService, RoleService, ProfilingService,
+    ReconciliationService, ExamSchedulerService, PlacementService
 )
 
 
@@ -92,7 +100,7 @@ class UEViewSet(viewsets.ModelViewSet):
         """Filtrer par filière si l'utilisateur est enseignant"""
         queryset = super().get_queryset()
         
-        if self.request.user.groups.filter(name='Enseignant').exists():
+        if RoleService.has_role(self.request.user, 'Enseignant'):
             # Filtrer les UE des filières de l'enseignant
             if hasattr(self.request.user, 'enseignant_profile'):
                 filieres = self.request.user.enseignant_profile.filieres.all()
@@ -116,6 +124,11 @@ class SessionExamenViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsAdministrateur | IsResponsableScolarite]
     filterset_fields = ['type_session', 'active', 'annee_academique']
     search_fields = ['nom']
+    
+    @action(detail=True, methods=['get'], url_path='doubles-reservations')
+    def doubles_reservations(self, request, pk=None):
+        """Étudiants convoqués à deux examens qui se chevauchent dans la session"""
+        return Response(ExamSchedulerService.double_bookings(self.get_object()))
 
 
 class EtudiantViewSet(viewsets.ModelViewSet):
@@ -142,12 +155,12 @@ class EtudiantViewSet(viewsets.ModelViewSet):
         queryset = super().get_queryset()
         
         # Si c'est un étudiant, ne voir que son propre profil
-        if self.request.user.groups.filter(name='Etudiant').exists():
+        if RoleService.has_role(self.request.user, 'Etudiant'):
             if hasattr(self.request.user, 'etudiant_profile'):
                 queryset = queryset.filter(id=self.request.user.etudiant_profile.id)
         
         # Si c'est un enseignant, ne voir que les étudiants de sa filière
-        elif self.request.user.groups.filter(name='Enseignant').exists():
+        elif RoleService.has_role(self.request.user, 'Enseignant'):
             if hasattr(self.request.user, 'enseignant_profile'):
                 filieres = self.request.user.enseignant_profile.filieres.all()
                 queryset = queryset.filter(filiere__in=filieres)
@@ -173,7 +186,7 @@ class EtudiantViewSet(viewsets.ModelViewSet):
         etudiant = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.can_scan_qr') or 
+        if not (request.user.has_perm('core.can_scan_qr') or 
                 (hasattr(request.user, 'etudiant_profile') and 
                  request.user.etudiant_profile == etudiant)):
             return Response(
@@ -190,7 +203,7 @@ class EtudiantViewSet(viewsets.ModelViewSet):
         etudiant = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.view_paiement') or 
+        if not (request.user.has_perm('core.view_paiement') or 
                 (hasattr(request.user, 'etudiant_profile') and 
                  request.user.etudiant_profile == etudiant)):
             return Response(
@@ -208,7 +221,7 @@ class EtudiantViewSet(viewsets.ModelViewSet):
         etudiant = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.view_inscriptionue') or 
+        if not (request.user.has_perm('core.view_inscriptionue') or 
                 (hasattr(request.user, 'etudiant_profile') and 
                  request.user.etudiant_profile == etudiant)):
             return Response(
@@ -231,16 +244,24 @@ class ExamenViewSet(viewsets.ModelViewSet):
     filterset_fields = ['type_examen', 'session', 'ue__filiere', 'ue__niveau', 'date']
     search_fields = ['ue__code', 'ue__intitule', 'salle__code']
     
+    def get_permissions(self):
+        """Permissions personnalisées selon l'action"""
+        if self.action in ['scans', 'scanner', 'rapport_presence', 'export_presence_csv']:
+            # Ouvertes aux surveillants : chaque action vérifie ses propres droits
+            self.permission_classes = [IsAuthenticated]
+        
+        return super().get_permissions()
+    
     def get_queryset(self):
         """Filtrer le queryset selon les permissions"""
         queryset = super().get_queryset()
         
         # Si c'est un surveillant, ne voir que ses examens
-        if self.request.user.groups.filter(name='Surveillant').exists():
+        if RoleService.has_role(self.request.user, 'Surveillant'):
             queryset = queryset.filter(surveillant=self.request.user)
         
         # Si c'est un enseignant, ne voir que les examens de ses UE
-        elif self.request.user.groups.filter(name='Enseignant').exists():
+        elif RoleService.has_role(self.request.user, 'Enseignant'):
             if hasattr(self.request.user, 'enseignant_profile'):
                 filieres = self.request.user.enseignant_profile.filieres.all()
                 queryset = queryset.filter(ue__filiere__in=filieres)
@@ -251,13 +272,133 @@ class ExamenViewSet(viewsets.ModelViewSet):
         """Enregistrer l'utilisateur qui crée"""
         serializer.save(created_by=self.request.user)
     
+    @action(detail=True, methods=['get', 'post'])
+    def repartition(self, request, pk=None):
+        """
+        Répartition de l'examen entre plusieurs salles.
+        
+        GET : salles et nombre de places ; avec ?salle=<id>, la liste des
+        étudiants de cette salle seulement (part d'une porte, plus les
+        étudiants sans place pour la salle principale). POST : calculer la
+        répartition (ordre 'matricule' ou 'aleatoire', seed, salles).
+        """
+        examen = self.get_object()
+        
+        if request.method == 'POST':
+            parametres = RepartitionSerializer(data=request.data)
+            parametres.is_valid(raise_exception=True)
+            try:
+                PlacementService.allocate(
+                    examen,
+                    salles=parametres.validated_data.get('salles') or None,
+                    ordre=parametres.validated_data['ordre'],
+                    seed=parametres.validated_data.get('seed'),
+                    user=request.user,
+                )
+            except ValidationError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        repartitions = list(examen.repartitions.select_related('salle'))
+        # Autorisés après la répartition : attendus sans place à la salle principale
+        sans_place = InscriptionUE.objects.none()
+        if repartitions:
+            sans_place = InscriptionUE.objects.filter(
+                ue_id=examen.ue_id,
+                annee_academique_id=examen.annee_academique_id,
+                est_autorise_examen=True,
+            ).exclude(
+                etudiant_id__in=list(PlacementService.get_places(examen.pk))
+            ).order_by('etudiant__matricule').values_list(
+                'etudiant__matricule', 'etudiant__nom', 'etudiant__prenom'
+            )
+        
+        salle_id = request.query_params.get('salle')
+        if salle_id:
+            repartition = next((r for r in repartitions if str(r.salle_id) == salle_id), None)
+            if repartition is None:
+                return Response({'error': 'Salle absente de la répartition'}, status=status.HTTP_404_NOT_FOUND)
+            etudiants = Etudiant.objects.only('matricule', 'nom', 'prenom').in_bulk(repartition.etudiants)
+            liste = [
+                {
+                    'place': numero,
+                    'matricule': etudiants[etudiant_id].matricule,
+                    'nom': etudiants[etudiant_id].nom,
+                    'prenom': etudiants[etudiant_id].prenom,
+                }
+                for numero, etudiant_id in enumerate(repartition.etudiants, start=1)
+                if etudiant_id in etudiants
+            ]
+            if repartition.salle_id == examen.salle_id:
+                liste += [
+                    {'place': None, 'matricule': matricule, 'nom': nom, 'prenom': prenom}
+                    for matricule, nom, prenom in sans_place
+                ]
+            return Response({
+                'salle': repartition.salle.code,
+                'etudiants': liste,
+            })
+        
+        return Response({
+            'examen': examen.pk,
+            'sans_place': sans_place.count(),
+            'salles': [
+                {
+                    'ordre': repartition.ordre,
+                    'salle_id': repartition.salle_id,
+                    'salle': repartition.salle.code,
+                    'capacite': repartition.salle.capacite,
+                    'places': repartition.nombre_places,
+                }
+                for repartition in repartitions
+            ],
+        })
+    
+    @action(detail=False, methods=['post'], url_path='valider-planning')
+    def valider_planning(self, request):
+        """Vérifier en une passe les chevauchements de salle d'un planning proposé (champ 'examens')"""
+        serializer = PlanningExamenSerializer(data=request.data.get('examens', []), many=True)
+        serializer.is_valid(raise_exception=True)
+        
+        examens = [
+            Examen(
+                pk=ligne.get('id'),
+                salle_id=ligne['salle'],
+                date=ligne['date'],
+                heure_debut=ligne['heure_debut'],
+                heure_fin=ligne['heure_fin'],
+            )
+            for ligne in serializer.validated_data
+        ]
+        lignes = {id(examen): index for index, examen in enumerate(examens)}
+        
+        def decrire(examen):
+            return {
+                'ligne': lignes.get(id(examen)),
+                'id': examen.pk,
+                'ue': None if id(examen) in lignes else examen.ue.code,
+                'salle': examen.salle_id,
+                'date': examen.date,
+                'heure_debut': examen.heure_debut,
+                'heure_fin': examen.heure_fin,
+            }
+        
+        conflits = ExamenService.valider_planning(examens)
+        return Response({
+            'valide': not conflits,
+            'examens': len(examens),
+            'conflits': [
+                {'examen': decrire(examen), 'conflit': decrire(conflit)}
+                for examen, conflit in conflits
+            ],
+        })
+    
     @action(detail=True, methods=['get'])
     def scans(self, request, pk=None):
         """Récupérer les scans d'un examen"""
         examen = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.view_controleacces') or 
+        if not (request.user.has_perm('core.view_controleacces') or 
                 examen.surveillant == request.user):
             return Response(
                 {'error': 'Permission refusée'},
@@ -274,7 +415,7 @@ class ExamenViewSet(viewsets.ModelViewSet):
         examen = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.can_scan_qr') or 
+        if not (request.user.has_perm('core.can_scan_qr') or 
                 examen.surveillant == request.user):
             return Response(
                 {'error': 'Permission refusée'},
@@ -315,7 +456,7 @@ class ExamenViewSet(viewsets.ModelViewSet):
         examen = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.can_view_reports') or 
+        if not (request.user.has_perm('core.can_view_reports') or 
                 examen.surveillant == request.user or
                 (hasattr(request.user, 'enseignant_profile') and
                  request.user.enseignant_profile.filieres.filter(id=examen.ue.filiere.id).exists())):
@@ -334,7 +475,7 @@ class ExamenViewSet(viewsets.ModelViewSet):
         examen = self.get_object()
         
         # Vérifier les permissions
-        if not (request.user.has_perm('gestion_examen.can_view_reports') or 
+        if not (request.user.has_perm('core.can_view_reports') or 
                 examen.surveillant == request.user):
             return Response(
                 {'error': 'Permission refusée'},
@@ -392,11 +533,11 @@ class ControleAccesViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = super().get_queryset()
         
         # Si c'est un surveillant, ne voir que ses scans
-        if self.request.user.groups.filter(name='Surveillant').exists():
+        if RoleService.has_role(self.request.user, 'Surveillant'):
             queryset = queryset.filter(scanned_by=self.request.user)
         
         # Si c'est un enseignant, ne voir que les scans de sa filière
-        elif self.request.user.groups.filter(name='Enseignant').exists():
+        elif RoleService.has_role(self.request.user, 'Enseignant'):
             if hasattr(self.request.user, 'enseignant_profile'):
                 filieres = self.request.user.enseignant_profile.filieres.all()
                 queryset = queryset.filter(examen__ue__filiere__in=filieres)
@@ -414,6 +555,35 @@ class PaiementViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Enregistrer l'utilisateur qui crée"""
         serializer.save(created_by=self.request.user)
+    
+    @action(detail=False, methods=['post'], url_path='rapprochement',
+            parser_classes=[MultiPartParser, FormParser])
+    def rapprochement(self, request):
+        """Rapprocher un relevé bancaire (CSV/XLSX, champ 'fichier') avec les paiements"""
+        fichier = request.FILES.get('fichier')
+        if not fichier:
+            return Response(
+                {'error': 'Fichier du relevé requis (champ fichier)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        annee_academique = None
+        if request.data.get('annee_academique'):
+            annee_academique = get_object_or_404(AnneeAcademique, pk=request.data['annee_academique'])
+        
+        try:
+            resultat = ReconciliationService.reconcile(
+                fichier,
+                fichier.name,
+                annee_academique=annee_academique,
+                user=request.user,
+                remplacer=str(request.data.get('remplacer', '')).lower() in ('1', 'true', 'on'),
+                dry_run=str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'on'),
+            )
+        except ValidationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(resultat)
 
 
 class InscriptionUEViewSet(viewsets.ModelViewSet):
@@ -453,12 +623,12 @@ class JustificatifAbsenceViewSet(viewsets.ModelViewSet):
         queryset = super().get_queryset()
         
         # Si c'est un étudiant, ne voir que ses justificatifs
-        if self.request.user.groups.filter(name='Etudiant').exists():
+        if RoleService.has_role(self.request.user, 'Etudiant'):
             if hasattr(self.request.user, 'etudiant_profile'):
                 queryset = queryset.filter(etudiant=self.request.user.etudiant_profile)
         
         # Si c'est un enseignant, ne voir que les justificatifs de sa filière
-        elif self.request.user.groups.filter(name='Enseignant').exists():
+        elif RoleService.has_role(self.request.user, 'Enseignant'):
             if hasattr(self.request.user, 'enseignant_profile'):
                 filieres = self.request.user.enseignant_profile.filieres.all()
                 queryset = queryset.filter(examen__ue__filiere__in=filieres)
@@ -467,7 +637,7 @@ class JustificatifAbsenceViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         """Associer l'étudiant connecté au justificatif"""
-        if self.request.user.groups.filter(name='Etudiant').exists():
+        if RoleService.has_role(self.request.user, 'Etudiant'):
             if hasattr(self.request.user, 'etudiant_profile'):
                 serializer.save(etudiant=self.request.user.etudiant_profile)
         else:
@@ -542,7 +712,7 @@ class DashboardView(APIView):
         examens_serializer = ExamenSerializer(examens_du_jour, many=True, context={'request': request})
         
         # Statistiques selon le rôle
-        if request.user.groups.filter(name='Surveillant').exists():
+        if RoleService.has_role(request.user, 'Surveillant'):
             # Statistiques pour surveillant
             mes_examens = examens_du_jour.filter(surveillant=request.user)
             scans_aujourdhui = ControleAcces.objects.filter(
@@ -556,15 +726,11 @@ class DashboardView(APIView):
                 'role': 'surveillant'
             }
         
-        elif request.user.groups.filter(name='Etudiant').exists():
+        elif RoleService.has_role(request.user, 'Etudiant'):
             # Statistiques pour étudiant
             if hasattr(request.user, 'etudiant_profile'):
                 etudiant = request.user.etudiant_profile
-                examens_etudiant = Examen.objects.filter(
-                    ue__inscriptionue__etudiant=etudiant,
-                    ue__inscriptionue__est_autorise_examen=True,
-                    date__gte=timezone.now().date()
-                ).count()
+                examens_etudiant = len(TimetableService.get_examens(etudiant, a_venir=True))
                 
                 stats = {
                     'examens_a_venir': examens_etudiant,
@@ -573,7 +739,7 @@ class DashboardView(APIView):
             else:
                 stats = {'role': 'etudiant'}
         
-        elif request.user.groups.filter(name='Enseignant').exists():
+        elif RoleService.has_role(request.user, 'Enseignant'):
             # Statistiques pour enseignant
             if hasattr(request.user, 'enseignant_profile'):
                 filieres = request.user.enseignant_profile.filieres.all()
@@ -589,7 +755,7 @@ class DashboardView(APIView):
             else:
                 stats = {'role': 'enseignant'}
         
-        elif request.user.groups.filter(name='Administrateur').exists() or request.user.is_superuser:
+        elif RoleService.has_role(request.user, 'Administrateur') or request.user.is_superuser:
             # Statistiques pour administrateur
             stats = ReportingService.generate_statistiques_globales()
             stats['role'] = 'administrateur'
@@ -629,7 +795,7 @@ class ScanRapideView(APIView):
         # Formater pour l'interface de scan
         examens_data = []
         for examen in examens:
-            if examen.surveillant == request.user or request.user.has_perm('gestion_examen.can_scan_qr'):
+            if examen.surveillant == request.user or request.user.has_perm('core.can_scan_qr'):
                 examens_data.append({
                     'id': examen.id,
                     'ue': examen.ue.code,
@@ -830,7 +996,7 @@ def scanner_api(request, examen_id):
     examen = get_object_or_404(Examen, id=examen_id)
     
     # Vérifier les permissions
-    if not (request.user.groups.filter(name='Surveillant').exists() or 
+    if not (RoleService.has_role(request.user, 'Surveillant') or 
             examen.surveillant == request.user or 
             request.user.is_staff):
         return JsonResponse({'error': 'Permission refusée'}, status=403)
@@ -931,6 +1097,7 @@ def scanner_api(request, examen_id):
             },
             'scan_id': scan.id,
             'timestamp': scan.date_scan.isoformat(),
+            'placement': PlacementService.get_place(examen, etudiant.id) if autorise else None,
             'message': 'Accès autorisé' if autorise else f'Accès refusé: {raison}'
         })
         
@@ -954,6 +1121,7 @@ def scan_interface(request):
     
     context = {
         'examens_disponibles': examens,
+        'scan_poll_interval': settings.SCAN_EVENTS_POLL_INTERVAL * 1000,
     }
     return render(request, 'core/scan_interface.html', context)
 
@@ -976,73 +1144,68 @@ def scan_examen(request, examen_id):
     )
     
     # Vérifier les permissions
-    if not (request.user.groups.filter(name='Surveillant').exists() or 
+    if not (RoleService.has_role(request.user, 'Surveillant') or 
             examen.surveillant == request.user or 
             request.user.is_staff):
         messages.error(request, "Vous n'avez pas la permission de scanner cet examen.")
         return redirect('dashboard')
     
-    # Récupérer les scans existants
-    scans_total = ControleAcces.objects.filter(examen=examen)
-    
     # Scans récents pour l'historique
-    scans_recent = scans_total.select_related(
+    scans_recent = ControleAcces.objects.filter(examen=examen).select_related(
         'etudiant', 
         'etudiant__filiere'
     ).order_by('-date_scan')[:10]
     
-    # Calculer les statistiques de base
-    total_inscrits = InscriptionUE.objects.filter(
-        ue=examen.ue,
-        annee_academique=examen.annee_academique,
-        est_autorise_examen=True
-    ).count()
-    
-    total_presents = scans_total.filter(autorise=True).count()
-    total_refuses = scans_total.filter(autorise=False).count()
-    
-    # Préparer les données des étudiants
-    inscriptions = InscriptionUE.objects.filter(
-        ue=examen.ue,
-        annee_academique=examen.annee_academique,
-        est_autorise_examen=True
-    ).select_related(
-        'etudiant',
-        'etudiant__filiere',
-        'etudiant__niveau'
-    ).prefetch_related('etudiant__paiement_set')
-    
-    etudiants_data = []
-    for inscription in inscriptions:
-        etudiant = inscription.etudiant
-        
-        # Vérifier si déjà scanné
-        scan = scans_total.filter(etudiant=etudiant).first()
-        
-        # Vérifier le paiement
-        paiement_regle = etudiant.paiement_set.filter(
-            annee_academique=examen.annee_academique,
-            est_regle=True
-        ).exists()
-        
-        etudiants_data.append({
-            'etudiant': etudiant,
-            'inscription': inscription,
-            'scan': scan,
-            'paiement_regle': paiement_regle,
-        })
+    # Examen réparti en plusieurs salles : chaque porte (?salle=<id>) n'a que sa part
+    repartitions = list(examen.repartitions.select_related('salle'))
+    salle_porte = next(
+        (repartition.salle for repartition in repartitions
+         if str(repartition.salle_id) == request.GET.get('salle')),
+        None
+    )
+    
+    # Liste d'appel : inscrits, scans, paiements et places en quatre requêtes
+    roster = RosterService.get_roster(examen, salle=salle_porte)
     
     context = {
         'examen': examen,
+        'repartitions': repartitions,
+        'salle_porte': salle_porte,
         'scans_recent': scans_recent,
-        'total_inscrits': total_inscrits,
-        'total_presents': total_presents,
-        'total_refuses': total_refuses,
-        'etudiants_data': etudiants_data,
+        'total_inscrits': roster['total_inscrits'],
+        'total_presents': roster['total_presents'],
+        'total_refuses': roster['total_refuses'],
+        'etudiants_data': roster['etudiants_data'],
     }
     
     return render(request, 'core/scan_examen.html', context)
 
+
+def _peut_suivre_scans(user, examen):
+    """Mêmes droits que l'interface de scan"""
+    return (RoleService.has_role(user, 'Surveillant') or
+            examen.surveillant_id == user.id or
+            user.is_staff)
+
+
+@login_required
+def scan_events_since(request, examen_id):
+    """Scans postérieurs à ?since=, relus périodiquement par l'interface de scan"""
+    examen = get_object_or_404(Examen, id=examen_id)
+    if not _peut_suivre_scans(request.user, examen):
+        return JsonResponse({'error': 'Permission refusée'}, status=403)
+    
+    cursor = request.GET.get('since')
+    if not cursor:
+        # Premier appel : seulement le curseur courant, l'historique vient de l'API
+        return JsonResponse({
+            'cursor': ScanEventService.get_cursor(examen.id),
+            'scans': [],
+            'statistiques': None,
+            'reset': False,
+        })
+    return JsonResponse(ScanEventService.get_events_since(examen.id, cursor))
+
 @login_required
 def student_dashboard(request):
     """Tableau de bord étudiant"""
@@ -1054,10 +1217,7 @@ def student_dashboard(request):
     
     context = {
         'etudiant': etudiant,
-        'examens': Examen.objects.filter(
-            ue__inscriptionue__etudiant=etudiant,
-            ue__inscriptionue__est_autorise_examen=True
-        ).select_related('ue', 'salle').order_by('date', 'heure_debut'),
+        'examens': TimetableService.get_examens(etudiant),
         'paiements': etudiant.paiement_set.select_related('annee_academique'),
         'justificatifs': etudiant.justificatifabsence_set.select_related('examen', 'examen__ue'),
     }
@@ -1126,15 +1286,12 @@ def home_view(request):
 def examen_list(request):
     """Liste des examens - MANQUANTE"""
     # Récupérer les examens selon le rôle
-    if request.user.groups.filter(name='Surveillant').exists():
+    if RoleService.has_role(request.user, 'Surveillant'):
         examens = Examen.objects.filter(surveillant=request.user)
-    elif request.user.groups.filter(name='Etudiant').exists():
+    elif RoleService.has_role(request.user, 'Etudiant'):
         if hasattr(request.user, 'etudiant_profile'):
             etudiant = request.user.etudiant_profile
-            examens = Examen.objects.filter(
-                ue__inscriptionue__etudiant=etudiant,
-                ue__inscriptionue__est_autorise_examen=True
-            )
+            examens = Examen.objects.filter(id__in=TimetableService.get_examen_ids(etudiant))
         else:
             examens = Examen.objects.none()
     else:
@@ -1147,7 +1304,7 @@ def examen_list(request):
         examens = examens.filter(date=date_filter)
     
     # Filtrer par filière si enseignant
-    if request.user.groups.filter(name='Enseignant').exists():
+    if RoleService.has_role(request.user, 'Enseignant'):
         if hasattr(request.user, 'enseignant_profile'):
             filieres = request.user.enseignant_profile.filieres.all()
             examens = examens.filter(ue__filiere__in=filieres)
@@ -1172,7 +1329,7 @@ def examen_detail(request, pk):
     ), pk=pk)
     
     # Vérifier les permissions
-    if request.user.groups.filter(name='Etudiant').exists():
+    if RoleService.has_role(request.user, 'Etudiant'):
         if hasattr(request.user, 'etudiant_profile'):
             if not InscriptionUE.objects.filter(
                 etudiant=request.user.etudiant_profile,
@@ -1182,12 +1339,12 @@ def examen_detail(request, pk):
                 messages.error(request, "Vous n'êtes pas autorisé à voir cet examen.")
                 return redirect('dashboard')
     
-    elif request.user.groups.filter(name='Surveillant').exists():
+    elif RoleService.has_role(request.user, 'Surveillant'):
         if examen.surveillant != request.user and not request.user.is_staff:
             messages.error(request, "Vous n'êtes pas surveillant de cet examen.")
             return redirect('dashboard')
     
-    elif request.user.groups.filter(name='Enseignant').exists():
+    elif RoleService.has_role(request.user, 'Enseignant'):
         if hasattr(request.user, 'enseignant_profile'):
             if examen.ue.filiere not in request.user.enseignant_profile.filieres.all():
                 messages.error(request, "Cet examen n'est pas dans vos filières.")
@@ -1201,36 +1358,15 @@ def examen_detail(request, pk):
         examen=examen
     ).select_related('etudiant', 'scanned_by').order_by('-date_scan')[:20]
     
-    # Récupérer les étudiants inscrits
-    etudiants_inscrits = InscriptionUE.objects.filter(
-        ue=examen.ue,
-        annee_academique=examen.annee_academique,
-        est_autorise_examen=True
-    ).select_related('etudiant', 'etudiant__filiere')
-    
-    # Vérifier la présence de chaque étudiant
-    etudiants_data = []
-    for inscription in etudiants_inscrits:
-        scan = ControleAcces.objects.filter(
-            examen=examen,
-            etudiant=inscription.etudiant
-        ).first()
-        
-        etudiants_data.append({
-            'etudiant': inscription.etudiant,
-            'inscription': inscription,
-            'scan': scan,
-            'present': scan.autorise if scan else False,
-            'autorise': scan.autorise if scan else False,
-            'raison_refus': scan.raison_refus if scan else None
-        })
+    # Étudiants inscrits et leur présence
+    roster = RosterService.get_roster(examen)
     
     context = {
         'examen': examen,
         'stats': stats,
         'scans_recent': scans_recent,
-        'etudiants_data': etudiants_data,
-        'total_inscrits': len(etudiants_data),
+        'etudiants_data': roster['etudiants_data'],
+        'total_inscrits': roster['total_inscrits'],
     }
     return render(request, 'core/examen_detail.html', context)
 
@@ -1241,10 +1377,10 @@ def examen_rapport(request, pk):
     examen = get_object_or_404(Examen, pk=pk)
     
     # Vérifier les permissions
-    if not (request.user.groups.filter(name='Surveillant').exists() or 
+    if not (RoleService.has_role(request.user, 'Surveillant') or 
             examen.surveillant == request.user or 
             request.user.is_staff or
-            request.user.groups.filter(name='Enseignant').exists()):
+            RoleService.has_role(request.user, 'Enseignant')):
         messages.error(request, "Vous n'avez pas la permission de voir ce rapport.")
         return redirect('dashboard')
     
@@ -1267,34 +1403,29 @@ def student_examens(request):
     
     etudiant = request.user.etudiant_profile
     
-    # Récupérer les examens à venir
-    examens_a_venir = Examen.objects.filter(
-        ue__inscriptionue__etudiant=etudiant,
-        ue__inscriptionue__est_autorise_examen=True,
-        date__gte=timezone.now().date()
-    ).select_related('ue', 'salle', 'surveillant').order_by('date', 'heure_debut')
-    
-    # Récupérer les examens passés
-    examens_passes = Examen.objects.filter(
-        ue__inscriptionue__etudiant=etudiant,
-        ue__inscriptionue__est_autorise_examen=True,
-        date__lt=timezone.now().date()
-    ).select_related('ue', 'salle').order_by('-date', 'heure_debut')[:20]
+    # Emploi du temps pré-calculé (une lecture de cache)
+    examens_a_venir = TimetableService.get_examens(etudiant, a_venir=True)
+    examens_passes = sorted(
+        TimetableService.get_examens(etudiant, a_venir=False),
+        key=lambda e: (-e.date.toordinal(), e.heure_debut)
+    )[:20]
+    
+    # Présences et justificatifs des examens à venir, en une requête chacun
+    ids_a_venir = [examen.id for examen in examens_a_venir]
+    presences = {}
+    for controle in ControleAcces.objects.filter(
+            examen_id__in=ids_a_venir, etudiant=etudiant, autorise=True):
+        presences.setdefault(controle.examen_id, controle)
+    justificatifs = {}
+    for justificatif in JustificatifAbsence.objects.filter(
+            examen_id__in=ids_a_venir, etudiant=etudiant).order_by('pk'):
+        justificatifs.setdefault(justificatif.examen_id, justificatif)
     
     # Vérifier les présences pour les examens à venir
     examens_avec_presence = []
     for examen in examens_a_venir:
-        presence = ControleAcces.objects.filter(
-            examen=examen,
-            etudiant=etudiant,
-            autorise=True
-        ).first()
-        
-        justificatif = None
-        if not presence:
-            justificatif = examen.justificatifabsence_set.filter(
-                etudiant=etudiant
-            ).first()
+        presence = presences.get(examen.id)
+        justificatif = None if presence else justificatifs.get(examen.id)
         
         examens_avec_presence.append({
             'examen': examen,
@@ -1309,10 +1440,42 @@ def student_examens(request):
         'examens_a_venir': examens_avec_presence,
         'examens_passes': examens_passes,
         'today': timezone.now().date(),
+        'ical_url': request.build_absolute_uri(reverse(
+            'student_examens_ical', args=[TimetableService.get_ical_token(etudiant)]
+        )),
     }
     return render(request, 'core/student_examens.html', context)
 
 
+def _timetable_ical(request, token):
+    """Emploi du temps désigné par le jeton (mémorisé sur la requête)"""
+    if not hasattr(request, '_timetable'):
+        request._timetable = None
+        etudiant_id = TimetableService.get_etudiant_id_from_token(token)
+        etudiant = Etudiant.objects.filter(pk=etudiant_id).first() if etudiant_id else None
+        if etudiant:
+            request._timetable = (etudiant, TimetableService.get_timetable(etudiant))
+    return request._timetable
+
+
+def _timetable_etag(request, token):
+    timetable = _timetable_ical(request, token)
+    return timetable[1]['etag'] if timetable else None
+
+
+@condition(etag_func=_timetable_etag)
+def student_examens_ical(request, token):
+    """Flux iCal des examens de l'étudiant (abonnement depuis un agenda, sans session)"""
+    timetable = _timetable_ical(request, token)
+    if timetable is None:
+        return HttpResponse(status=404)
+    etudiant, data = timetable
+    response = HttpResponse(TimetableService.to_ical(etudiant, data), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = f'inline; filename="examens_{etudiant.matricule}.ics"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def student_qr(request):
     """Page pour afficher et télécharger le QR code de l'étudiant - MANQUANTE"""
@@ -1352,11 +1515,7 @@ def student_qr(request):
     qr_base64 = base64.b64encode(buffer.getvalue()).decode()
     
     # Vérifier les examens où le QR code peut être utilisé
-    examens_prochains = Examen.objects.filter(
-        ue__inscriptionue__etudiant=etudiant,
-        ue__inscriptionue__est_autorise_examen=True,
-        date__gte=timezone.now().date()
-    ).select_related('ue', 'salle').order_by('date', 'heure_debut')[:5]
+    examens_prochains = TimetableService.get_examens(etudiant, a_venir=True)[:5]
     
     context = {
         'etudiant': etudiant,
@@ -1661,9 +1820,9 @@ def documentation_view(request):
     if request.user.is_authenticated:
         if request.user.is_staff:
             user_role = 'Administrateur'
-        elif request.user.groups.filter(name='Surveillant').exists():
+        elif RoleService.has_role(request.user, 'Surveillant'):
             user_role = 'Surveillant'
-        elif request.user.groups.filter(name='Etudiant').exists():
+        elif RoleService.has_role(request.user, 'Etudiant'):
             user_role = 'Étudiant'
     
     context = {
@@ -1683,56 +1842,47 @@ def documentation_view(request):
 @login_required
 def dashboard_view(request):
     """Vue du tableau de bord principal - EXISTANTE"""
-    # Récupérer les statistiques
-    stats = {
-        'total_etudiants': Etudiant.objects.count(),
-        'examens_aujourdhui': Examen.objects.filter(date=timezone.now().date()).count(),
-        'scans_aujourdhui': ControleAcces.objects.filter(
-            date_scan__date=timezone.now().date()
-        ).count(),
-        'examens_en_cours': Examen.objects.filter(
-            date=timezone.now().date(),
-            heure_debut__lte=timezone.now().time(),
-            heure_fin__gte=timezone.now().time()
-        ).count(),
-    }
-    
-    # Récupérer les examens du jour
-    examens_du_jour = ExamenService.get_examens_du_jour(request.user)
-    
-    # Récupérer l'activité récente
-    recent_activity = AuditLog.objects.all().select_related('utilisateur').order_by('-timestamp')[:10]
-    
-    # Formater l'activité pour le template
-    activity_data = []
-    for activity in recent_activity:
-        icon_map = {
-            'scan': 'qrcode',
-            'paiement': 'money-bill-wave',
-            'inscription': 'user-plus',
-            'examen': 'calendar-alt',
-            'justificatif': 'file-medical',
-            'system': 'cog',
-            'connexion': 'sign-in-alt',
-        }
-        
-        activity_data.append({
-            'description': activity.action,
-            'user': activity.utilisateur.get_full_name() if activity.utilisateur else "Système",
-            'timestamp': activity.timestamp,
-            'action_type': activity.action_type,
-            'icon': icon_map.get(activity.action_type, 'info-circle'),
-            'ip': activity.ip
-        })
+    # Statistiques, examens du jour et activité récente depuis l'instantané partagé
+    snapshot = _get_dashboard_snapshot(request)
     
     context = {
-        'stats': stats,
-        'examens_du_jour': examens_du_jour,
-        'recent_activity': activity_data,
+        'stats': snapshot['data']['stats'],
+        'examens_du_jour': snapshot['examens'],
+        'recent_activity': snapshot['data']['recent_activity'],
     }
     return render(request, 'core/dashboard.html', context)
 
 
+def _get_dashboard_snapshot(request):
+    """Récupérer l'instantané du tableau de bord une seule fois par requête"""
+    if not hasattr(request, '_dashboard_snapshot'):
+        request._dashboard_snapshot = DashboardSnapshotService.get_snapshot(request.user)
+    return request._dashboard_snapshot
+
+
+def _dashboard_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return _get_dashboard_snapshot(request)['etag']
+
+
+def _dashboard_last_modified(request):
+    if not request.user.is_authenticated:
+        return None
+    return _get_dashboard_snapshot(request)['last_modified']
+
+
+@login_required
+@condition(etag_func=_dashboard_etag, last_modified_func=_dashboard_last_modified)
+def dashboard_stats(request):
+    """API JSON des statistiques du tableau de bord (GET conditionnel, 304 si inchangé)"""
+    snapshot = _get_dashboard_snapshot(request)
+    response = JsonResponse(snapshot['data'])
+    # Obliger le navigateur à revalider avec If-None-Match / If-Modified-Since
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def profile_view(request):
     """Page de profil utilisateur avec édition"""
@@ -1886,11 +2036,7 @@ def add_justificatif(request, examen_id=None):
         form = JustificatifForm(initial=initial)
     
     # Récupérer les examens auxquels l'étudiant est inscrit
-    examens = Examen.objects.filter(
-        ue__inscriptionue__etudiant=etudiant,
-        ue__inscriptionue__est_autorise_examen=True,
-        date__gte=timezone.now().date()  # Seulement les examens futurs
-    ).select_related('ue', 'salle').order_by('date')
+    examens = TimetableService.get_examens(etudiant, a_venir=True)  # Seulement les examens futurs
     
     context = {
         'form': form,
@@ -1924,13 +2070,13 @@ def universal_login_view(request):
                     login(request, user)
                     
                     # Déterminer la redirection selon le type d'utilisateur
-                    if user.groups.filter(name='Etudiant').exists():
+                    if RoleService.has_role(user, 'Etudiant'):
                         redirect_url = 'student_dashboard'
                         welcome_msg = f"Bienvenue {user.get_full_name()} !"
-                    elif user.groups.filter(name='Surveillant').exists():
+                    elif RoleService.has_role(user, 'Surveillant'):
                         redirect_url = 'dashboard'
                         welcome_msg = f"Bienvenue Surveillant {user.get_full_name()} !"
-                    elif user.groups.filter(name='Enseignant').exists():
+                    elif RoleService.has_role(user, 'Enseignant'):
                         redirect_url = 'dashboard'
                         welcome_msg = f"Bienvenue Professeur {user.get_full_name()} !"
                     elif user.is_staff or user.is_superuser:
@@ -2864,15 +3010,13 @@ def examen_detail1(request, pk):
         pk=pk
     )
     
-    # Récupérer les inscriptions pour cet examen
-    inscriptions = InscriptionUE.objects.filter(
-        ue=examen.ue,
-        annee_academique=examen.annee_academique,
-        est_autorise_examen=True
-    ).select_related('etudiant')
+    # Liste d'appel : inscrits, scans, paiements et places en quatre requêtes
+    roster = RosterService.get_roster(examen)
+    etudiants_data = roster['etudiants_data']
     
-    # Récupérer les contrôles d'accès pour cet examen
-    controles = ControleAcces.objects.filter(examen=examen).select_related('etudiant', 'scanned_by')
+    # Les inscriptions et contrôles sont repris de la liste d'appel (pas de nouvelle requête)
+    inscriptions = [data['inscription'] for data in etudiants_data]
+    controles = roster['scans']
     
     # Récupérer les justificatifs pour cet examen
     justificatifs = JustificatifAbsence.objects.filter(examen=examen).select_related('etudiant', 'traite_par')
@@ -2881,7 +3025,8 @@ def examen_detail1(request, pk):
         'examen': examen,
         'inscriptions': inscriptions,
         'controles': controles,
-        'justificatifs': justificatifs
+        'justificatifs': justificatifs,
+        'etudiants_data': etudiants_data,
     })
 
 
@@ -2893,32 +3038,53 @@ def Operations(request):
     """Operations avec statistiques"""
     
     # Statistiques générales
-    stats = {
-        'total_etudiants': Etudiant.objects.count(),
-        'total_ues': UE.objects.count(),
-        'total_examens': Examen.objects.count(),
-        'total_salles': Salle.objects.count(),
-        'paiements_regles': Paiement.objects.filter(est_regle=True).count(),
-        'paiements_en_attente': Paiement.objects.filter(est_regle=False).count(),
-        'justificatifs_en_attente': JustificatifAbsence.objects.filter(statut='en_attente').count(),
-    }
+    stats = CompteursService.get_compteurs()
     
     # Examens à venir (dans les 7 prochains jours)
     date_limit = timezone.now().date() + datetime.timedelta(days=7)
     examens_a_venir = Examen.objects.filter(
         date__gte=timezone.now().date(),
         date__lte=date_limit
-    ).order_by('date', 'heure_debut')[:5]
+    ).select_related('ue', 'salle').order_by('date', 'heure_debut')[:5]
     
     # Derniers contrôles d'accès
-    derniers_controles = ControleAcces.objects.all().order_by('-date_scan')[:10]
+    derniers_controles = ControleAcces.objects.select_related(
+        'etudiant', 'examen__ue'
+    ).order_by('-date_scan')[:10]
     
     # Derniers justificatifs déposés
-    derniers_justificatifs = JustificatifAbsence.objects.all().order_by('-date_depot')[:10]
+    derniers_justificatifs = JustificatifAbsence.objects.select_related(
+        'etudiant', 'examen__ue'
+    ).order_by('-date_depot')[:10]
     
     return render(request, 'core/operations.html', {
         'stats': stats,
         'examens_a_venir': examens_a_venir,
         'derniers_controles': derniers_controles,
         'derniers_justificatifs': derniers_justificatifs,
-    })
\ No newline at end of file
+    })
+
+
+# ============== Profilage ==============
+@staff_member_required
+def profiling_report(request):
+    """Rapport de profilage par endpoint (HTML, ou JSON avec ?format=json)"""
+    if request.method == 'POST' and request.POST.get('action') == 'reset':
+        ProfilingService.reset()
+        messages.success(request, "Statistiques de profilage réinitialisées.")
+        return redirect('profiling_report')
+    
+    tris = ['queries_avg', 'queries_max', 'db_time_avg_ms', 'python_time_avg_ms', 'duplicates_avg', 'requests']
+    tri = request.GET.get('sort') if request.GET.get('sort') in tris else 'queries_avg'
+    rapport = ProfilingService.get_report(tri)
+    
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'sort': tri, 'endpoints': rapport})
+    
+    return render(request, 'admin/profiling_report.html', {
+        'title': 'Profilage des requêtes',
+        'rapport': rapport,
+        'tri': tri,
+        'tris': tris,
+        'profiling_enabled': settings.PROFILING_ENABLED,
+    })
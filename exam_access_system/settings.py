@@ -54,20 +54,20 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.AuditMiddleware',
-    'core.middleware.SessionManagementMiddleware',
-    'core.middleware.MultiTabSessionMiddleware',
-    'core.middleware.TabSpecificSessionMiddleware',
+    'core.middleware.ActivityTrackerMiddleware',
 ]
 
 ROOT_URLCONF = 'exam_access_system.urls'
 
 
+# MultiAuthBackend hérite de ModelBackend (permissions) : inutile de le
+# lister une seconde fois, ce qui doublerait le coût d'un échec de connexion
 AUTHENTICATION_BACKENDS = [
-    'core.backends.MultiAuthBackend',  
-    'django.contrib.auth.backends.ModelBackend',
+    'core.backends.MultiAuthBackend',
 ]
 
 TEMPLATES = [
@@ -130,6 +130,18 @@ CACHES = {
     }
 }
 
+# Cache partagé entre les workers (gunicorn) si Redis est disponible
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+        'KEY_PREFIX': 'exam_access',
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -194,7 +206,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -408,7 +420,9 @@ if USE_S3:
 SESSION_COOKIE_NAME = 'sessionid'  # Garder le nom standard
 SESSION_COOKIE_AGE = 86400  # 24 heures en secondes
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True # Garder la session après fermeture du navigateur
-SESSION_SAVE_EVERY_REQUEST = True  # Rafraîchir l'expiration à chaque requête
+SESSION_SAVE_EVERY_REQUEST = False  # L'inactivité est suivie par ActivityTrackerMiddleware (cache partagé, sinon session)
+SESSION_IDLE_TIMEOUT = 30 * 60  # Déconnexion après 30 minutes sans requête
+ACTIVITY_UPDATE_INTERVAL = 60  # Secondes minimum entre deux mises à jour de l'activité
 
 # Utiliser des sessions signées pour plus de sécurité
 SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
@@ -437,6 +451,42 @@ MAX_SCANS_PER_MINUTE = 50  # Limite de scans par minute
 EXAM_START_TOLERANCE = 30  # Minutes de tolérance avant l'examen
 EXAM_END_TOLERANCE = 30  # Minutes de tolérance après l'examen
 MAX_JUSTIFICATIF_SIZE = 10 * 1024 * 1024  # 10MB
+DASHBOARD_SNAPSHOT_INTERVAL = 30  # Secondes entre deux recalculs des statistiques du tableau de bord
+SCAN_EVENTS_POLL_INTERVAL = 5  # Secondes entre deux lectures incrémentales des scans par l'interface de scan
+OPERATIONS_COUNTERS_TIMEOUT = 15  # Secondes de cache des compteurs de la page Opérations
+TIMETABLE_CACHE_TIMEOUT = 24 * 3600  # Durée de vie des emplois du temps étudiants pré-calculés
+ROLE_CACHE_TIMEOUT = 3600  # Durée de cache des groupes d'un utilisateur (invalidé à chaque changement)
+TOKEN_CACHE_TIMEOUT = 60  # Durée de validité d'un jeton d'API en cache (core.authentication)
+TOKEN_CACHE_MAX_SIZE = 1000  # Nombre maximal de jetons en cache par processus (LRU)
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=os.cpu_count() or 1, cast=int)  # Processus de hachage des commandes en masse
+PASSWORD_BULK_CHUNK_SIZE = 1000  # Comptes écrits par bulk_update / bulk_create
+PAIEMENT_MONTANT_ATTENDU = 50000  # Droits universitaires attendus pour un nouveau paiement
+RECONCILIATION_BATCH_SIZE = 1000  # Paiements écrits par requête lors d'un rapprochement bancaire
+EXAM_CRENEAUX = (  # Créneaux d'examen d'une journée ouvrée (planificateur de session)
+    ('08:00', '10:00'),
+    ('10:30', '12:30'),
+    ('14:00', '16:00'),
+    ('16:30', '18:30'),
+)
+EXAM_PLANNING_ITERATIONS = 2000  # Déplacements tentés par la recherche locale du planificateur
+PLACEMENT_CACHE_TIMEOUT = 6 * 3600  # Plan de placement d'un examen en cache (salle et place de chaque étudiant)
+
+# Profilage des requêtes (core.middleware.ProfilingMiddleware, rapport dans /admin/profilage/)
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)  # Sinon : staff + en-tête X-Profile: 1
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=1.0, cast=float)
+PROFILING_REPORT_TIMEOUT = 7 * 24 * 3600  # Conservation des statistiques agrégées
+
+# Journal d'audit des requêtes (core.middleware.AuditMiddleware)
+AUDIT_ASYNC = config('AUDIT_ASYNC', default=True, cast=bool)  # Écriture différée par lots
+AUDIT_FLUSH_INTERVAL = 2  # Secondes entre deux écritures de lot
+AUDIT_BATCH_SIZE = 200  # Entrées par bulk_create
+AUDIT_QUEUE_MAX_SIZE = 10000  # Au-delà, les nouvelles entrées sont ignorées
+AUDIT_MAX_BODY_SIZE = 4096  # Octets de corps JSON conservés au maximum
+# Taux d'échantillonnage des requêtes en lecture, par préfixe de chemin (1 = tout garder)
+AUDIT_SAMPLING_RATES = {
+    '/admin/': config('AUDIT_ADMIN_SAMPLING_RATE', default=1.0, cast=float),
+    '/api/': 1.0,
+}
 
 # Swagger/OpenAPI configuration
 SWAGGER_SETTINGS = {
@@ -3,9 +3,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from . import health
+from core import views as core_views
 
 urlpatterns = [
     path('health/', health.health_check, name='health_check'),
+    path('admin/profilage/', core_views.profiling_report, name='profiling_report'),
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
 ]